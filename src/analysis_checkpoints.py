@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger('bot')
+config = Config()
+
+STATUS_RUNNING = 'running'  # анализ выполняется (или был прерван перезапуском бота)
+STATUS_INTERRUPTED = 'interrupted'  # пользователю предложено продолжить прерванный анализ
+STATUS_COMPLETED = 'completed'
+STATUS_DISCARDED = 'discarded'  # пользователь отказался продолжать прерванный анализ
+
+STAGE_COMPLETED = 'completed'
+STAGE_FAILED = 'failed'
+
+
+@dataclass
+class AnalysisCheckpoint:
+    """Сохраненное состояние анализа: параметры, контекст из файла и результаты завершенных этапов."""
+
+    analysis_id: str
+    user_id: int
+    analysis_params: Dict[str, Any]
+    additional_context: str
+    status: str
+    updated_at: float
+    stages: Dict[str, str] = field(default_factory=dict)  # этап -> результат
+    failed_stages: List[str] = field(default_factory=list)
+
+    @property
+    def company_name(self) -> str:
+        return self.analysis_params.get('name', 'unknown_company')
+
+    def completed_results(self, exclude: Optional[List[str]] = None) -> Dict[str, str]:
+        """Результаты успешно завершенных этапов, кроме перечисленных в exclude."""
+        exclude = set(exclude or ())
+        return {
+            stage: result
+            for stage, result in self.stages.items()
+            if stage not in self.failed_stages and stage not in exclude
+        }
+
+
+class AnalysisCheckpointStore:
+    """Контрольные точки инвестиционных анализов в SQLite (Singleton).
+
+    Результат сохраняется после каждого этапа, поэтому анализ можно продолжить после сбоя или перезапуска бота.
+    """
+
+    _instance = None
+
+    def __new__(cls) -> 'AnalysisCheckpointStore':
+        if cls._instance is None:
+            logger.info('Создание экземпляра AnalysisCheckpointStore (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.db_path = config.ANALYSIS_CHECKPOINT_DB_PATH
+        self.ttl = config.ANALYSIS_CHECKPOINT_TTL
+        self._lock = threading.Lock()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS analyses ('
+                'analysis_id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, params TEXT NOT NULL, '
+                'additional_context TEXT NOT NULL, status TEXT NOT NULL, '
+                'created_at REAL NOT NULL, updated_at REAL NOT NULL)',
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS analysis_stages ('
+                'analysis_id TEXT NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, result TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, PRIMARY KEY (analysis_id, stage))',
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_analyses_status ON analyses (status, updated_at)')
+            self._conn.commit()
+        logger.info(f'Контрольные точки анализов: {self.db_path}')
+
+    def _create(
+        self,
+        analysis_id: str,
+        user_id: int,
+        analysis_params: Dict[str, Any],
+        additional_context: str,
+        status: str,
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO analyses '
+                '(analysis_id, user_id, params, additional_context, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (analysis_id, user_id, json.dumps(analysis_params, ensure_ascii=False), additional_context, status,
+                 now, now),
+            )
+            self._conn.execute('DELETE FROM analysis_stages WHERE analysis_id = ?', (analysis_id,))
+            self._cleanup(now)
+            self._conn.commit()
+
+    def _cleanup(self, now: float) -> None:
+        expired = [
+            row[0]
+            for row in self._conn.execute('SELECT analysis_id FROM analyses WHERE updated_at < ?', (now - self.ttl,))
+        ]
+        for analysis_id in expired:
+            self._conn.execute('DELETE FROM analysis_stages WHERE analysis_id = ?', (analysis_id,))
+            self._conn.execute('DELETE FROM analyses WHERE analysis_id = ?', (analysis_id,))
+
+    def _save_stage(self, analysis_id: str, stage: str, status: str, result: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO analysis_stages (analysis_id, stage, status, result, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (analysis_id, stage, status, result, now),
+            )
+            self._conn.execute('UPDATE analyses SET updated_at = ? WHERE analysis_id = ?', (now, analysis_id))
+            self._conn.commit()
+
+    def _set_status(self, analysis_id: str, status: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                'UPDATE analyses SET status = ?, updated_at = ? WHERE analysis_id = ?',
+                (status, time.time(), analysis_id),
+            )
+            self._conn.commit()
+
+    def _load(self, analysis_id: str) -> Optional[AnalysisCheckpoint]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT analysis_id, user_id, params, additional_context, status, updated_at '
+                'FROM analyses WHERE analysis_id = ?',
+                (analysis_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            stages = self._conn.execute(
+                'SELECT stage, status, result FROM analysis_stages WHERE analysis_id = ?', (analysis_id,),
+            ).fetchall()
+        if time.time() - row[5] > self.ttl:
+            return None
+        checkpoint = AnalysisCheckpoint(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5])
+        for stage, status, result in stages:
+            checkpoint.stages[stage] = result
+            if status == STAGE_FAILED:
+                checkpoint.failed_stages.append(stage)
+        return checkpoint
+
+    def _list_running(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT analysis_id FROM analyses WHERE status = ? AND updated_at >= ? ORDER BY updated_at',
+                (STATUS_RUNNING, time.time() - self.ttl),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    async def create(
+        self,
+        analysis_id: str,
+        user_id: int,
+        analysis_params: Dict[str, Any],
+        additional_context: str = '',
+        status: str = STATUS_RUNNING,
+    ) -> None:
+        """Создает (или пересоздает) контрольную точку анализа без результатов этапов."""
+        await asyncio.to_thread(self._create, analysis_id, user_id, analysis_params, additional_context, status)
+
+    async def save_stage(self, analysis_id: str, stage: str, result: str, failed: bool = False) -> None:
+        """Сохраняет результат этапа сразу после его завершения."""
+        await asyncio.to_thread(
+            self._save_stage, analysis_id, stage, STAGE_FAILED if failed else STAGE_COMPLETED, result,
+        )
+
+    async def set_status(self, analysis_id: str, status: str) -> None:
+        await asyncio.to_thread(self._set_status, analysis_id, status)
+
+    async def load(self, analysis_id: str) -> Optional[AnalysisCheckpoint]:
+        return await asyncio.to_thread(self._load, analysis_id)
+
+    async def list_interrupted(self) -> List[AnalysisCheckpoint]:
+        """Анализы, которые выполнялись в момент остановки бота."""
+        checkpoints = [await self.load(analysis_id) for analysis_id in await asyncio.to_thread(self._list_running)]
+        return [checkpoint for checkpoint in checkpoints if checkpoint is not None]
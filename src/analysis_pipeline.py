@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+from prompts import SystemPrompt, SystemPrompts
+
+logger = logging.getLogger('bot')
+config = Config()
+
+
+@dataclass(frozen=True)
+class AnalysisStage:
+    """Этап инвестиционного анализа и этапы, результаты которых он получает в контекст."""
+
+    name: str
+    prompt_type: SystemPrompt
+    context_title: str  # заголовок результата этапа в контексте следующих этапов
+    error_message: str
+    depends_on: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    context_tokens: int = 0  # бюджет сжатого контекста (файл и результаты зависимостей), 0 — контекст целиком
+
+    def error_result(self, reason: str) -> str:
+        """Текст, сохраняемый вместо результата этапа при ошибке; по нему этап находит failed_stages."""
+        return f'{self.error_message}: {reason}'
+
+
+DEFAULT_STAGES: Tuple[AnalysisStage, ...] = (
+    AnalysisStage(
+        'market', SystemPrompt.INVESTMENT_MARKET, 'Результат рыночного анализа компании', 'Ошибка при анализе рынка',
+    ),
+    AnalysisStage(
+        'rivals',
+        SystemPrompt.INVESTMENT_RIVALS,
+        'Результат анализа конкурентов компании',
+        'Ошибка при анализе конкурентов',
+    ),
+    AnalysisStage(
+        'synergy',
+        SystemPrompt.INVESTMENT_SYNERGY,
+        'Результат анализа синергии компании',
+        'Ошибка при анализе синергии',
+        depends_on=('market', 'rivals'),
+    ),
+)
+
+# Чем заменяется плейсхолдер компании в статическом префиксе промптов этапов анализа
+COMPANY_REFERENCE = 'из запроса пользователя'
+STAGE_ANSWER_LIMIT = '\n\nОТВЕТ ДОЛЖЕН БЫТЬ СТРОГО НЕ БОЛЕЕ 300 СЛОВ.'
+
+# Выполняет один этап: (этап, результаты успешно завершенных зависимостей) -> ответ модели
+StageRunner = Callable[[AnalysisStage, Dict[str, str]], Awaitable[str]]
+# Вызывается после каждого выполненного этапа: (этап, результат, этап завершился ошибкой)
+StageCallback = Callable[[AnalysisStage, str, bool], Awaitable[None]]
+
+
+def parse_stage_mapping(spec: str) -> Dict[str, str]:
+    """Разбирает настройку вида 'rivals:market;synergy:market,rivals' в словарь этап -> значение."""
+    mapping = {}
+    for item in spec.split(';'):
+        if not item.strip():
+            continue
+        name, _, value = item.partition(':')
+        mapping[name.strip()] = value.strip()
+    return mapping
+
+
+def build_stage_prefix(prompt_type: SystemPrompt) -> str:
+    """Статическая часть запроса этапа: роль, инструкции и ограничение объема.
+
+    Текст не зависит от компании и побайтно совпадает между запросами, поэтому OpenAI
+    кеширует этот префикс (prompt caching) и не обрабатывает его заново.
+    """
+    prompt = SystemPrompts().get_compiled_prompt(prompt_type)
+
+    # Название компании передается в конце запроса, в промпте оставляем ссылку на него
+    instructions = prompt.render(company=COMPANY_REFERENCE)
+
+    return prompt.role + '\n\n' + instructions + STAGE_ANSWER_LIMIT
+
+
+def build_stage_messages(
+    prompt_type: SystemPrompt,
+    company_name: str,
+    additional_context: str = '',
+    analysis_context: str = '',
+) -> List[Dict[str, str]]:
+    """Собирает сообщения для одного этапа анализа (рынок, конкуренты, синергия).
+
+    Сначала идет статический префикс этапа, все данные конкретного запроса (компания,
+    файл, результаты предыдущих этапов) добавляются в конец.
+    """
+    user_content = f'Компания: {company_name}' + additional_context + analysis_context
+
+    return [
+        {'role': 'system', 'content': build_stage_prefix(prompt_type)},
+        {'role': 'user', 'content': user_content},
+    ]
+
+
+def configured_stages() -> Tuple[AnalysisStage, ...]:
+    """Этапы анализа с зависимостями, таймаутами и бюджетами контекста из настроек."""
+    dependencies = parse_stage_mapping(config.ANALYSIS_STAGE_DEPENDENCIES)
+    timeouts = parse_stage_mapping(config.ANALYSIS_STAGE_TIMEOUTS)
+    context_budgets = parse_stage_mapping(config.ANALYSIS_CONTEXT_STAGE_TOKENS)
+    stages = []
+    for stage in DEFAULT_STAGES:
+        depends_on = stage.depends_on
+        if stage.name in dependencies:
+            depends_on = tuple(name.strip() for name in dependencies[stage.name].split(',') if name.strip())
+        timeout = float(timeouts[stage.name]) if stage.name in timeouts else config.ANALYSIS_STAGE_TIMEOUT
+        # по умолчанию сжимается контекст этапов, которые получают результаты других этапов
+        if stage.name in context_budgets:
+            context_tokens = int(context_budgets[stage.name] or 0)
+        else:
+            context_tokens = config.ANALYSIS_CONTEXT_TOKENS if depends_on else 0
+        stages.append(AnalysisStage(
+            stage.name,
+            stage.prompt_type,
+            stage.context_title,
+            stage.error_message,
+            depends_on,
+            timeout or None,
+            context_tokens,
+        ))
+    return tuple(stages)
+
+
+class AnalysisPipeline:
+    """Граф этапов анализа: независимые этапы выполняются параллельно, зависимый этап ждет свои зависимости.
+
+    Ошибка или таймаут этапа не прерывают анализ: в результат попадает сообщение об ошибке,
+    а зависимые этапы выполняются без контекста упавшего этапа.
+    """
+
+    def __init__(self, stages: Optional[Iterable[AnalysisStage]] = None) -> None:
+        self.stages: Dict[str, AnalysisStage] = {
+            stage.name: stage for stage in (stages if stages is not None else configured_stages())
+        }
+        self._check_graph()
+
+    def _check_graph(self) -> None:
+        """Проверяет, что зависимости существуют и не образуют цикл."""
+        for stage in self.stages.values():
+            unknown = set(stage.depends_on) - set(self.stages)
+            if unknown:
+                raise ValueError(f'Этап {stage.name} зависит от неизвестных этапов: {", ".join(sorted(unknown))}')
+
+        visited, in_progress = set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in in_progress:
+                raise ValueError(f'Циклическая зависимость этапов анализа: {name}')
+            in_progress.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            in_progress.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(
+        self,
+        selected: Iterable[str],
+        run_stage: StageRunner,
+        company_name: str,
+        completed: Optional[Dict[str, str]] = None,
+        on_stage_done: Optional[StageCallback] = None,
+    ) -> Dict[str, str]:
+        """Выполняет выбранные этапы; зависимости вне выбора пропускаются. Результаты — в порядке этапов.
+
+        Этапы из completed не выполняются повторно: их сохраненные результаты используются как есть
+        и передаются в контекст зависимых этапов.
+        """
+        selected = [name for name in self.stages if name in set(selected)]
+        completed = completed or {}
+        results: Dict[str, str] = {}
+        failed = set()
+        tasks: Dict[str, asyncio.Task] = {}
+        started_at = time.monotonic()
+
+        async def execute(stage: AnalysisStage) -> None:
+            if stage.name in completed:
+                results[stage.name] = completed[stage.name]
+                return
+            dependencies = [name for name in stage.depends_on if name in selected]
+            if dependencies:
+                await asyncio.gather(*(tasks[name] for name in dependencies))
+            dependency_results = {name: results[name] for name in dependencies if name not in failed}
+            stage_started_at = time.monotonic()
+            try:
+                results[stage.name] = await asyncio.wait_for(run_stage(stage, dependency_results), stage.timeout)
+                logger.info(
+                    f'[AnalysisPipeline] Этап {stage.name} выполнен за {time.monotonic() - stage_started_at:.1f}с',
+                )
+            except asyncio.TimeoutError:
+                failed.add(stage.name)
+                logger.error(f'[AnalysisPipeline] Этап {stage.name} не уложился в {stage.timeout:g}с')
+                results[stage.name] = stage.error_result('превышено время ожидания ответа')
+            except Exception as e:
+                failed.add(stage.name)
+                logger.error(f'[AnalysisPipeline] Ошибка этапа {stage.name}: {e}')
+                results[stage.name] = stage.error_result(str(e))
+            if on_stage_done is not None:
+                try:
+                    await on_stage_done(stage, results[stage.name], stage.name in failed)
+                except Exception as e:
+                    logger.error(f'[AnalysisPipeline] Не удалось сохранить результат этапа {stage.name}: {e}')
+
+        # задачи создаются в топологическом порядке: зависимость всегда запущена раньше зависящего от нее этапа
+        for name in self._ordered(selected):
+            tasks[name] = asyncio.ensure_future(execute(self.stages[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        logger.info(
+            f'[AnalysisPipeline] Анализ {company_name}: этапов {len(selected)}, '
+            f'из контрольной точки {sum(name in completed for name in selected)}, ошибок {len(failed)}, '
+            f'время {time.monotonic() - started_at:.1f}с',
+        )
+        return {name: results[name] for name in selected}
+
+    def context_sections(self, dependency_results: Dict[str, str], company_name: str) -> List[Tuple[str, str]]:
+        """Результаты зависимостей как разделы контекста этапа: (заголовок, текст)."""
+        return [
+            (f'{self.stages[name].context_title} {company_name}', result)
+            for name, result in dependency_results.items()
+        ]
+
+    def failed_stages(self, results: Dict[str, str]) -> List[str]:
+        """Этапы, вместо результата которых сохранено сообщение об ошибке."""
+        return [
+            name for name, result in results.items()
+            if name in self.stages and result.startswith(self.stages[name].error_message)
+        ]
+
+    def levels(self, selected: Iterable[str]) -> List[List[str]]:
+        """Выбранные этапы по волнам: этапы волны зависят только от этапов предыдущих волн."""
+        selected = set(selected)
+        selected = [name for name in self.stages if name in selected]
+        depth: Dict[str, int] = {}
+        for name in self._ordered(selected):
+            dependencies = [dependency for dependency in self.stages[name].depends_on if dependency in selected]
+            depth[name] = max((depth[dependency] + 1 for dependency in dependencies), default=0)
+        levels: List[List[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for name in selected:
+            levels[depth[name]].append(name)
+        return levels
+
+    def _ordered(self, selected: List[str]) -> List[str]:
+        """Топологический порядок выбранных этапов."""
+        ordered: List[str] = []
+
+        def visit(name: str) -> None:
+            if name in ordered:
+                return
+            for dependency in self.stages[name].depends_on:
+                if dependency in selected:
+                    visit(dependency)
+            ordered.append(name)
+
+        for name in selected:
+            visit(name)
+        return ordered
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from config import Config
+from semantic_cache import TRANSLITERATION
+
+logger = logging.getLogger('bot')
+config = Config()
+
+# Названия, которые parse_user_request возвращает, если компанию определить не удалось
+UNKNOWN_COMPANY_NAMES = frozenset({'unknown_company', 'неизвестная_компания'})
+
+
+def company_key(company_name: str) -> str:
+    """Нормализованное название: регистр, «ё», пунктуация и пробелы, транслитерация — «Озон» и «OZON» дают один ключ.
+
+    В отличие от ключа семантического кеша, слова и окончания не отбрасываются: хранилище общее
+    для всех пользователей, и «Сбер Маркет» не должен получить анализ компании «Маркет».
+    """
+    words = re.findall(r'\w+', company_name.casefold().replace('ё', 'е'))
+    return ''.join(TRANSLITERATION.get(char, char) for char in ' '.join(words))
+
+
+def analysis_flags(stages: Iterable[str]) -> str:
+    """Набор этапов анализа в каноническом виде: 'market,rivals,synergy'."""
+    return ','.join(sorted(stages))
+
+
+@dataclass
+class StoredAnalysis:
+    """Готовый анализ компании из хранилища."""
+
+    company_name: str
+    analysis_params: Dict[str, Any]
+    analysis_results: Dict[str, str]
+    executive_summary: str
+    created_at: float
+
+
+class CompanyAnalysisStore:
+    """Завершенные анализы компаний в SQLite, общие для всех пользователей (Singleton).
+
+    Ключ — нормализованное название компании, набор этапов и хеш версии промптов: после изменения
+    промпта или модели старые анализы не выдаются и удаляются по истечении срока свежести.
+    """
+
+    _instance = None
+
+    def __new__(cls) -> 'CompanyAnalysisStore':
+        if cls._instance is None:
+            logger.info('Создание экземпляра CompanyAnalysisStore (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.enabled = config.ANALYSIS_STORE_ENABLED
+        self.db_path = config.ANALYSIS_STORE_DB_PATH
+        self.ttl = config.ANALYSIS_STORE_TTL
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if not self.enabled:
+            return
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS company_analyses ('
+                'company_key TEXT NOT NULL, flags TEXT NOT NULL, prompt_hash TEXT NOT NULL, '
+                'company_name TEXT NOT NULL, params TEXT NOT NULL, results TEXT NOT NULL, '
+                'executive_summary TEXT NOT NULL, created_at REAL NOT NULL, '
+                'PRIMARY KEY (company_key, flags, prompt_hash))',
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_company_analyses_company '
+                'ON company_analyses (company_key, created_at)',
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_company_analyses_created ON company_analyses (created_at)',
+            )
+            self._conn.commit()
+        logger.info(f'Хранилище анализов компаний: {self.db_path}')
+
+    def _get(self, key: str, flags: str, prompt_hash: str) -> Optional[StoredAnalysis]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT company_name, params, results, executive_summary, created_at FROM company_analyses '
+                'WHERE company_key = ? AND flags = ? AND prompt_hash = ? AND created_at >= ?',
+                (key, flags, prompt_hash, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredAnalysis(row[0], json.loads(row[1]), json.loads(row[2]), row[3], row[4])
+
+    def _save(
+        self,
+        key: str,
+        flags: str,
+        prompt_hash: str,
+        company_name: str,
+        analysis_params: Dict[str, Any],
+        analysis_results: Dict[str, str],
+        executive_summary: str,
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO company_analyses '
+                '(company_key, flags, prompt_hash, company_name, params, results, executive_summary, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, flags, prompt_hash, company_name, json.dumps(analysis_params, ensure_ascii=False),
+                 json.dumps(analysis_results, ensure_ascii=False), executive_summary, now),
+            )
+            self._conn.execute('DELETE FROM company_analyses WHERE created_at < ?', (now - self.ttl,))
+            self._conn.commit()
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM company_analyses').fetchone()[0]
+
+    @staticmethod
+    def _storable(company_name: str) -> bool:
+        return bool(company_name) and company_name not in UNKNOWN_COMPANY_NAMES and bool(company_key(company_name))
+
+    async def get(self, company_name: str, stages: Iterable[str], prompt_hash: str) -> Optional[StoredAnalysis]:
+        """Свежий анализ компании с тем же набором этапов и той же версией промптов."""
+        if not self.enabled or not self._storable(company_name):
+            return None
+        try:
+            stored = await asyncio.to_thread(
+                self._get, company_key(company_name), analysis_flags(stages), prompt_hash,
+            )
+        except Exception as e:
+            logger.error(f'Ошибка чтения хранилища анализов: {e}')
+            stored = None
+        if stored is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(f'[CompanyAnalysisStore] Анализ {company_name} из хранилища ({stored.company_name})')
+        return stored
+
+    async def save(
+        self,
+        company_name: str,
+        stages: Iterable[str],
+        prompt_hash: str,
+        analysis_params: Dict[str, Any],
+        analysis_results: Dict[str, str],
+        executive_summary: str,
+    ) -> None:
+        """Сохраняет завершенный анализ; анализ той же компании с тем же ключом заменяется."""
+        if not self.enabled or not self._storable(company_name) or not executive_summary:
+            return
+        try:
+            await asyncio.to_thread(
+                self._save, company_key(company_name), analysis_flags(stages), prompt_hash, company_name,
+                analysis_params, analysis_results, executive_summary,
+            )
+            self.stores += 1
+        except Exception as e:
+            logger.error(f'Ошибка записи в хранилище анализов: {e}')
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'entries': self._count() if self._conn is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+        }
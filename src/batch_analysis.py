@@ -0,0 +1,316 @@
+"""Пакетный (офлайн) инвестиционный анализ списка компаний через OpenAI Batch API.
+
+Пример запуска:
+    python batch_analysis.py companies.xlsx --output reports/
+    python batch_analysis.py companies.txt --base-url http://127.0.0.1:8080/v1 --poll-interval 1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from openai import AsyncOpenAI, OpenAIError
+from openai.types import Batch
+
+from analysis_pipeline import AnalysisPipeline, AnalysisStage, build_stage_messages, configured_stages
+from config import Config
+from context_compaction import ContextCompactor, format_context
+from logger import Logger
+from openai_clients import OpenAIClientRegistry, get_openai_client
+from portfolio import read_company_list
+from report_renderer import ReportRenderer
+from token_budget import TokenBudget
+
+logger = logging.getLogger('bot')
+config = Config()
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+UNSAFE_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+class BatchTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class BatchJob:
+    """Одна отправленная партия запросов и ее результаты."""
+
+    companies: List[str]
+    batch_id: Optional[str] = None  # последний отправленный batch
+    status: Optional[str] = None
+    results: Dict[str, str] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None  # волна не выполнена: причина для всех этапов без ответа
+
+
+class BatchAnalysisRunner:
+    """Компилирует этапы анализа в JSONL для Batch API, отправляет партии, ждет их и собирает DOCX-отчеты.
+
+    Запросы Batch API идут по отдельной квоте и не расходуют интерактивный бюджет RPM/TPM бота.
+    Все запросы одного batch выполняются одновременно, поэтому партия компаний отправляется
+    волнами по графу этапов: сначала рынок и конкуренты, затем синергия с их результатами
+    в контексте — так же, как в интерактивном анализе.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        model: Optional[str] = None,
+        output_dir: str = 'batch_reports',
+        poll_interval: Optional[float] = None,
+        max_requests: Optional[int] = None,
+        max_wait: Optional[float] = None,
+    ) -> None:
+        self.client = client or get_openai_client(base_url=config.OPENAI_BATCH_BASE_URL)
+        self.model = model or config.OPENAI_BATCH_MODEL
+        self.output_dir = Path(output_dir)
+        self.poll_interval = poll_interval if poll_interval is not None else config.BATCH_POLL_INTERVAL
+        self.max_requests = max_requests or config.BATCH_MAX_REQUESTS
+        self.max_wait = max_wait if max_wait is not None else config.BATCH_MAX_WAIT
+        self.stages: Tuple[AnalysisStage, ...] = configured_stages()
+        self.pipeline = AnalysisPipeline(self.stages)
+        self.budget = TokenBudget(self.model)
+        self.compactor = ContextCompactor(self.budget)
+
+    @staticmethod
+    def make_custom_id(index: int, stage: str) -> str:
+        # индекс вместо названия: в названиях компаний встречаются любые символы
+        return f'company-{index}:{stage}'
+
+    def _stage_messages(
+        self, stage: AnalysisStage, company_name: str, dependency_results: Dict[str, str],
+    ) -> List[Dict[str, str]]:
+        """Сообщения этапа с результатами зависимостей в контексте, как в интерактивном анализе."""
+        sections = self.pipeline.context_sections(dependency_results, company_name)
+        if stage.context_tokens:
+            sections = self.compactor.compact_sections(sections, stage.context_tokens)
+        messages = build_stage_messages(stage.prompt_type, company_name, '', format_context(sections))
+        return self.budget.fit_messages(messages)
+
+    def compile_requests(
+        self,
+        companies: Sequence[str],
+        offset: int = 0,
+        stages: Optional[Sequence[str]] = None,
+        previous_results: Optional[Dict[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Собирает строки JSONL для Batch API: по запросу на каждый этап (из stages) каждой компании.
+
+        previous_results — ответы предыдущих волн по custom_id; результаты зависимостей этапа
+        подставляются в его контекст, упавшие зависимости пропускаются.
+        """
+        stages = [stage for stage in self.stages if stages is None or stage.name in stages]
+        previous_results = previous_results or {}
+        requests = []
+        for index, company_name in enumerate(companies, start=offset):
+            for stage in stages:
+                dependency_results = {
+                    name: previous_results[self.make_custom_id(index, name)]
+                    for name in stage.depends_on
+                    if self.make_custom_id(index, name) in previous_results
+                }
+                messages = self._stage_messages(stage, company_name, dependency_results)
+                requests.append({
+                    'custom_id': self.make_custom_id(index, stage.name),
+                    'method': 'POST',
+                    'url': BATCH_ENDPOINT,
+                    'body': {'model': self.model, 'messages': messages},
+                })
+        return requests
+
+    @staticmethod
+    def write_jsonl(requests: List[Dict[str, Any]], path: Path) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + '\n')
+
+    def _split_companies(self, companies: List[str]) -> List[List[str]]:
+        """Делит список компаний на партии, чтобы не превысить лимит запросов в одном batch."""
+        per_batch = max(self.max_requests // len(self.stages), 1)
+        return [companies[i:i + per_batch] for i in range(0, len(companies), per_batch)]
+
+    async def submit(self, requests: List[Dict[str, Any]]) -> str:
+        """Загружает JSONL и создает batch; возвращает его идентификатор."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            jsonl_path = Path(tmp_dir) / 'batch_input.jsonl'
+            self.write_jsonl(requests, jsonl_path)
+            input_file = await self.client.files.create(file=jsonl_path, purpose='batch')
+
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=config.BATCH_COMPLETION_WINDOW,
+            metadata={'source': 'investment_analysis'},
+        )
+        logger.info(f'[Batch] Создан batch {batch.id}: {len(requests)} запросов')
+        return batch.id
+
+    async def wait(self, batch_id: str) -> Batch:
+        """Опрашивает batch до завершения; если он не завершился за max_wait секунд, отменяет его."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            if counts is not None:
+                logger.info(
+                    f'[Batch] {batch_id}: {batch.status}, выполнено {counts.completed}/{counts.total}, '
+                    f'ошибок {counts.failed}',
+                )
+            if batch.status in FINAL_STATUSES:
+                return batch
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                try:
+                    await self.client.batches.cancel(batch_id)
+                except Exception as e:
+                    logger.error(f'[Batch] Не удалось отменить batch {batch_id}: {e}')
+                raise BatchTimeoutError(
+                    f'Batch {batch_id} не завершился за {self.max_wait:g}с (статус {batch.status})',
+                )
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def _read_file_lines(self, file_id: Optional[str]) -> List[Dict[str, Any]]:
+        if not file_id:
+            return []
+        content = await self.client.files.content(file_id)
+        return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+    async def fetch_results(self, batch: Batch) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Скачивает выходной файл и файл ошибок batch; возвращает ответы и ошибки по custom_id."""
+        results, errors = {}, {}
+        for line in await self._read_file_lines(batch.output_file_id):
+            custom_id = line.get('custom_id')
+            response = line.get('response') or {}
+            if line.get('error') or response.get('status_code') != 200:
+                errors[custom_id] = json.dumps(line.get('error') or response.get('body'), ensure_ascii=False)
+                continue
+            try:
+                results[custom_id] = response['body']['choices'][0]['message']['content'].strip()
+            except (KeyError, IndexError, TypeError, AttributeError) as e:
+                errors[custom_id] = f'Некорректный ответ: {e}'
+
+        for line in await self._read_file_lines(batch.error_file_id):
+            custom_id = line.get('custom_id')
+            error = line.get('error') or (line.get('response') or {}).get('body')
+            errors[custom_id] = json.dumps(error, ensure_ascii=False)
+
+        if errors:
+            logger.warning(f'[Batch] {batch.id}: {len(errors)} запросов завершились с ошибкой')
+        return results, errors
+
+    async def write_reports(self, companies: Sequence[str], job: BatchJob, offset: int = 0) -> List[str]:
+        """Раскладывает ответы по компаниям и сохраняет DOCX-отчет для каждой."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        reports = []
+        for index, company_name in enumerate(companies, start=offset):
+            analysis_results = {}
+            for stage in self.stages:
+                custom_id = self.make_custom_id(index, stage.name)
+                if custom_id in job.results:
+                    analysis_results[stage.name] = job.results[custom_id]
+                else:
+                    reason = job.errors.get(custom_id) or job.error or f'batch завершен со статусом {job.status}'
+                    analysis_results[stage.name] = stage.error_result(reason)
+
+            temp_path = await self.create_docx_report(company_name, analysis_results)
+            safe_name = safe_filename(company_name)
+            report_path = self.output_dir / f'{index + 1:04d}_investment_analysis_{safe_name}.docx'
+            shutil.move(temp_path, report_path)
+            reports.append(str(report_path))
+        return reports
+
+    @staticmethod
+    async def create_docx_report(company_name: str, analysis_results: Dict[str, str]) -> str:
+        return await ReportRenderer().render_analysis_report(company_name, analysis_results)
+
+    async def run_waves(self, companies: List[str], offset: int = 0) -> BatchJob:
+        """Выполняет этапы партии компаний волнами: каждая волна — отдельный batch с результатами предыдущих.
+
+        Если волна не выполнена (истекло ожидание, ошибка API), следующие волны не отправляются:
+        этапы без ответа попадут в отчеты как ошибки, а прогон продолжится со следующей партии.
+        """
+        job = BatchJob(companies=companies)
+        for stages in self.pipeline.levels(stage.name for stage in self.stages):
+            requests = self.compile_requests(companies, offset, stages, job.results)
+            try:
+                job.batch_id = await self.submit(requests)
+                batch = await self.wait(job.batch_id)
+                results, errors = await self.fetch_results(batch)
+            except (BatchTimeoutError, OpenAIError) as e:
+                logger.error(f'[Batch] Этапы {", ".join(stages)} компаний {offset + 1}–{offset + len(companies)}: {e}')
+                job.status = 'failed'
+                job.error = str(e)
+                break
+            job.status = batch.status
+            job.results.update(results)
+            job.errors.update(errors)
+            for request in requests:
+                # запросы без ответа и без ошибки: batch завершился раньше, чем до них дошла очередь
+                if request['custom_id'] not in job.results:
+                    job.errors.setdefault(request['custom_id'], f'batch завершен со статусом {batch.status}')
+        return job
+
+    async def run(self, companies: List[str]) -> List[str]:
+        """Полный цикл: компиляция, отправка, ожидание и запись отчетов по всем партиям."""
+        reports = []
+        offset = 0
+        for chunk in self._split_companies(companies):
+            job = await self.run_waves(chunk, offset)
+            reports.extend(await self.write_reports(chunk, job, offset))
+            logger.info(f'[Batch] {job.batch_id}: готово отчетов {len(chunk)}, ответов {len(job.results)}')
+            offset += len(chunk)
+        return reports
+
+
+def safe_filename(name: str) -> str:
+    """Название компании в виде, пригодном для имени файла."""
+    sanitized = UNSAFE_FILENAME_CHARS.sub('_', name).strip().replace(' ', '_')[:50].rstrip('.')
+    return sanitized or 'unknown_company'
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Запускает пакетный анализ списка компаний из файла и сохраняет отчеты в args.output."""
+    companies = read_company_list(args.companies)
+    if not companies:
+        raise ValueError(f'Список компаний пуст: {args.companies}')
+
+    client = get_openai_client(base_url=args.base_url) if args.base_url else None
+    runner = BatchAnalysisRunner(
+        client=client,
+        model=args.model,
+        output_dir=args.output,
+        poll_interval=args.poll_interval,
+        max_wait=args.max_wait,
+    )
+    try:
+        reports = await runner.run(companies)
+    finally:
+        await OpenAIClientRegistry().close()
+        ReportRenderer().close()
+    logger.info(f'[Batch] Сохранено отчетов: {len(reports)} в {os.path.abspath(args.output)}')
+
+
+if __name__ == '__main__':
+    Logger()
+    parser = argparse.ArgumentParser(description='Пакетный инвестиционный анализ через OpenAI Batch API')
+    parser.add_argument(
+        'companies', help='файл со списком компаний (.txt — по одной в строке, .xlsx — первый столбец)',
+    )
+    parser.add_argument('--output', default='batch_reports', help='каталог для DOCX-отчетов')
+    parser.add_argument('--model', default=None, help='модель (по умолчанию OPENAI_BATCH_MODEL)')
+    parser.add_argument('--base-url', default=None, help='адрес API, например локального тестового сервера')
+    parser.add_argument('--poll-interval', type=float, default=None, help='интервал опроса статуса batch, с')
+    parser.add_argument(
+        '--max-wait', type=float, default=None, help='максимальное ожидание batch, с (по умолчанию BATCH_MAX_WAIT)',
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -1,15 +1,20 @@
+import asyncio
+import dataclasses
+import hashlib
 import html
+import io
 import logging
 import re
 import traceback
 import json
 import os
 import smtplib
+import tempfile
+import time
+import uuid
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Tuple
-from docx import Document
+from typing import Any, Dict, List, Optional, Tuple
 from docx.shared import Inches
-import tempfile
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
@@ -22,19 +27,55 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 
 from access_middleware import AccessMiddleware
+from analysis_checkpoints import (
+    STATUS_COMPLETED,
+    STATUS_DISCARDED,
+    STATUS_INTERRUPTED,
+    STATUS_RUNNING,
+    AnalysisCheckpointStore,
+)
+from analysis_pipeline import AnalysisPipeline, AnalysisStage, build_stage_messages, build_stage_prefix
+from analysis_store import CompanyAnalysisStore, StoredAnalysis
 from chat_context import ChatContextManager
+from circuit_breaker import CircuitBreakerRegistry
 from config import Config
+from context_compaction import ContextCompactor, format_context
+from file_digest import FileDigestCache
 from file_processor import FileProcessor
 from keyboards_builder import Button, DynamicKeyboard, Keyboard
+from llm_metrics import LLMMetrics, start_metrics_server
+from llm_scheduler import LLMScheduler, RequestPriority
 from logger import Logger
 from models_api import ExcelFileManager, ExcelSearchStrategy, ModelAPI
+from openai_clients import OpenAIClientRegistry
+from rate_limiter import RateLimiterRegistry
+from portfolio import (
+    STATUS_DONE as PORTFOLIO_DONE,
+    STATUS_FAILED as PORTFOLIO_FAILED,
+    STATUS_RUNNING as PORTFOLIO_RUNNING,
+    PortfolioAnalysis,
+    PortfolioItem,
+    read_company_list,
+)
 from prompts import DEFAULT_PROMPTS_DIR, Models, SystemPrompt, SystemPrompts, Topics
+from response_cache import ResponseCache
+from report_cache import FinalReportCache
+from report_renderer import SECTION_TITLES, ReportRenderer
+from semantic_cache import SemanticCache, SemanticCacheHit
 from sql_auth import init_auth_system, check_user_authorized
+from token_budget import TokenBudget, preload_encodings
 
 Logger()
 logger = logging.getLogger('bot')
 config = Config()
 
+FILE_CONTEXT_TITLE = "Дополнительная информация из файла"
+
+
+def file_context_text(additional_context: str) -> str:
+    """Текст файла из контекста анализа, сохраненного в контрольной точке."""
+    return additional_context[len(format_context([(FILE_CONTEXT_TITLE, '')])):]
+
 class EmailSender:
     """Класс для отправки email с отчетами."""
     
@@ -163,6 +204,7 @@ class UserStates(StatesGroup):
     INVESTMENT_QA = State()  # Режим вопросов-ответов по анализу
     INVESTMENT_REPORT_OPTIONS = State()  # Выбор способа получения отчета
     CHOOSING_FINAL_ACTION = State()  # НОВОЕ: Выбор после получения отчета
+    PORTFOLIO_UPLOAD = State()  # Ожидание файла со списком компаний для портфельного анализа
 
 
 
@@ -280,6 +322,44 @@ class InvestmentActionsKeyboard(Keyboard):
     )
 
 
+class InvestmentCachedActionsKeyboard(Keyboard):
+    """Клавиатура действий для анализа, взятого из кеша похожих запросов или хранилища анализов компаний."""
+
+    _buttons = InvestmentActionsKeyboard._buttons + (Button('Запустить анализ заново', 'semantic_force_fresh'),)
+
+
+class CachedContinueKeyboard(Keyboard):
+    """Клавиатура продолжения диалога для ответа, взятого из кеша похожих запросов."""
+
+    _buttons = ContinueKeyboard._buttons + (Button('Запустить поиск заново', 'semantic_force_fresh'),)
+
+
+class RegenerateSectionsKeyboard(Keyboard):
+    """Клавиатура выбора разделов анализа для повторной генерации."""
+
+    @classmethod
+    def build(cls, sections, failed_count: int = 0) -> types.InlineKeyboardMarkup:
+        buttons = []
+        if failed_count:
+            buttons.append(Button(f'Разделы с ошибками ({failed_count})', 'regenerate_failed'))
+        buttons += [
+            Button(InvestmentAnalysisProcessor.SECTION_TITLES[name], f'regenerate_{name}') for name in sections
+        ]
+        buttons += [Button('Все разделы', 'regenerate_all'), Button('← Назад', 'back_to_investment_actions')]
+        return cls._build_keyboard(buttons)
+
+
+class ResumeAnalysisKeyboard(Keyboard):
+    """Клавиатура для продолжения анализа, прерванного перезапуском бота."""
+
+    @classmethod
+    def build(cls, analysis_id: str) -> types.InlineKeyboardMarkup:
+        return cls._build_keyboard([
+            Button('Продолжить анализ', f'resume_analysis:{analysis_id}'),
+            Button('Не продолжать', f'resume_discard:{analysis_id}'),
+        ])
+
+
 class InvestmentReportKeyboard(Keyboard):
     """Клавиатура для выбора способа получения отчета."""
 
@@ -303,7 +383,10 @@ class PromptTypeKeyboard(Keyboard):
 class InvestmentAnalysisProcessor:
     """Класс для обработки анализа инвестиционной привлекательности."""
     
-    def __init__(self):
+    SECTION_TITLES = SECTION_TITLES
+    
+    def __init__(self, user_id: int = None):
+        self.user_id = user_id  # для справедливой очереди запросов к моделям
         self.analysis_prompt = """
 Найди название компании в тексте и определи типы анализа.
 
@@ -456,7 +539,7 @@ class InvestmentAnalysisProcessor:
     async def parse_user_request(self, user_text: str) -> Dict[str, Any]:
         """Парсит запрос пользователя и определяет параметры анализа."""
         try:
-            model_api = ModelAPI(Models.chatgpt.value())
+            model_api = ModelAPI(Models.chatgpt.value(), RequestPriority.ANALYSIS, self.user_id, call_site='parse')
             messages = [
                 {"role": "system", "content": "Ты помощник для извлечения названий компаний из текста. Отвечай только валидным JSON без лишнего текста."},
                 {"role": "user", "content": self.analysis_prompt.format(user_text=user_text)}
@@ -521,207 +604,155 @@ class InvestmentAnalysisProcessor:
         logger.info(f"Using fallback result: {fallback_result}")
         return fallback_result
 
-    async def run_analysis(self, analysis_params: Dict[str, Any], file_content: str = "") -> Dict[str, str]:
-        results = {}
-        system_prompts = SystemPrompts()
+    async def run_analysis(
+        self,
+        analysis_params: Dict[str, Any],
+        file_content: str = "",
+        bypass_cache: bool = False,
+        priority: RequestPriority = RequestPriority.ANALYSIS,
+        analysis_id: Optional[str] = None,
+        rerun: Optional[List[str]] = None,
+        previous_results: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, str]:
+        """Выполняет этапы анализа.
+
+        С analysis_id результат каждого этапа сохраняется в контрольную точку. Если она уже есть,
+        повторно выполняются только незавершенные этапы, этапы с ошибками и этапы из rerun;
+        previous_results заменяет контрольную точку, если ее нет (например, истек срок хранения).
+        """
+        pipeline = AnalysisPipeline()
         
         # ИЗМЕНЕНИЕ: Используем настроенную модель вместо хардкода
-        model_api = ModelAPI(self._get_ai_model())
+        strategy = self._get_ai_model()
+        budget = TokenBudget(getattr(strategy, 'model', None))
         
         company_name = analysis_params.get("name", "unknown_company")
         
+        checkpoints = AnalysisCheckpointStore() if analysis_id else None
+        checkpoint = await checkpoints.load(analysis_id) if checkpoints else None
+        completed = {}
+        if checkpoint is not None:
+            completed = checkpoint.completed_results(exclude=rerun)
+        elif previous_results:
+            failed = pipeline.failed_stages(previous_results) + list(rerun or ())
+            completed = {name: result for name, result in previous_results.items() if name not in failed}
+        
         # Подготавливаем дополнительный контекст из файла
         additional_context = ""
-        if file_content:
-            additional_context = f"\n\nДополнительная информация из файла:\n{file_content}"
-        
-        # ИЗМЕНЕНИЕ: Добавляем контекст между анализами
-        analysis_context = ""
-        
-        # Запускаем анализы согласно параметрам В ПРАВИЛЬНОМ ПОРЯДКЕ
-        if analysis_params.get("market", 0):
-            try:
-                # Получаем промпт как строку
-                market_prompt_raw = system_prompts.get_prompt(SystemPrompt.INVESTMENT_MARKET)
-                
-                # Парсим классический промпт
-                parsed_prompt = self._parse_classical_prompt(market_prompt_raw)
-                
-                # ИЗМЕНЕНИЕ: Добавляем ограничение на 300 слов
-                system_content = parsed_prompt["role"] + "\n\nОТВЕТ ДОЛЖЕН БЫТЬ СТРОГО НЕ БОЛЕЕ 300 СЛОВ."
-                
-                # Подставляем название компании
-                user_content = parsed_prompt["prompt"].replace("[название компании]", company_name)
-                full_user_content = user_content + additional_context
-                
-                messages = [
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": full_user_content}
-                ]
-                
-                results["market"] = await model_api.get_response(messages)
-                
-                # ИЗМЕНЕНИЕ: Добавляем результат в контекст для следующих анализов
-                analysis_context += f"\n\nРезультат рыночного анализа компании {company_name}:\n{results['market']}"
-                
-                logger.info("Market analysis completed")
-            except Exception as e:
-                logger.error(f"Error in market analysis: {e}")
-                results["market"] = f"Ошибка при анализе рынка: {str(e)}"
-        
-        if analysis_params.get("rivals", 0):
-            try:
-                # Получаем промпт как строку
-                rivals_prompt_raw = system_prompts.get_prompt(SystemPrompt.INVESTMENT_RIVALS)
-                
-                # Парсим классический промпт
-                parsed_prompt = self._parse_classical_prompt(rivals_prompt_raw)
-                
-                # ИЗМЕНЕНИЕ: Добавляем ограничение на 300 слов + контекст
-                system_content = parsed_prompt["role"] + "\n\nОТВЕТ ДОЛЖЕН БЫТЬ СТРОГО НЕ БОЛЕЕ 300 СЛОВ."
-                
-                # Подставляем название компании
-                user_content = parsed_prompt["prompt"].replace("[название компании]", company_name)
-                # ИЗМЕНЕНИЕ: Добавляем контекст предыдущего анализа
-                full_user_content = user_content + additional_context + analysis_context
-                
-                messages = [
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": full_user_content}
-                ]
-                
-                results["rivals"] = await model_api.get_response(messages)
-                
-                # ИЗМЕНЕНИЕ: Добавляем результат в контекст для следующих анализов
-                analysis_context += f"\n\nРезультат анализа конкурентов компании {company_name}:\n{results['rivals']}"
-                
-                logger.info("Rivals analysis completed")
-            except Exception as e:
-                logger.error(f"Error in rivals analysis: {e}")
-                results["rivals"] = f"Ошибка при анализе конкурентов: {str(e)}"
-        
-        if analysis_params.get("synergy", 0):
-            try:
-                # Получаем промпт для анализа синергии
-                synergy_prompt_raw = system_prompts.get_prompt(SystemPrompt.INVESTMENT_SYNERGY)
-                
-                # Проверяем формат промпта
-                if isinstance(synergy_prompt_raw, dict):
-                    # ИЗМЕНЕНИЕ: Добавляем ограничение на 300 слов + контекст
-                    system_content = synergy_prompt_raw.get("role", "") + "\n\nОТВЕТ ДОЛЖЕН БЫТЬ СТРОГО НЕ БОЛЕЕ 300 СЛОВ."
-                    user_content = synergy_prompt_raw.get("prompt", "")
-                    user_content = user_content.replace("[название компании]", company_name)
-                    # ИЗМЕНЕНИЕ: Добавляем контекст всех предыдущих анализов
-                    full_user_content = user_content + additional_context + analysis_context
-                    
-                    messages = [
-                        {"role": "system", "content": system_content},
-                        {"role": "user", "content": full_user_content}
-                    ]
-                elif isinstance(synergy_prompt_raw, str):
-                    # Парсим классический промпт
-                    parsed_prompt = self._parse_classical_prompt(synergy_prompt_raw)
-                    system_content = parsed_prompt["role"] + "\n\nОТВЕТ ДОЛЖЕН БЫТЬ СТРОГО НЕ БОЛЕЕ 300 СЛОВ."
-                    
-                    full_prompt = parsed_prompt["prompt"].replace("[название компании]", company_name)
-                    # ИЗМЕНЕНИЕ: Добавляем контекст всех предыдущих анализов
-                    full_prompt = full_prompt + additional_context + analysis_context
-                    
-                    messages = [
-                        {"role": "system", "content": system_content},
-                        {"role": "user", "content": full_prompt}
-                    ]
-                else:
-                    raise ValueError(f"Неподдерживаемый формат промпта: {type(synergy_prompt_raw)}")
-                
-                results["synergy"] = await model_api.get_response(messages)
-                logger.info("Synergy analysis completed")
-            except Exception as e:
-                logger.error(f"Error in synergy analysis: {e}")
-                results["synergy"] = f"Ошибка при анализе синергии: {str(e)}"
+        if checkpoint is not None:
+            # контекст из файла сохранен в контрольной точке: сам файл после перезапуска уже недоступен
+            additional_context = checkpoint.additional_context
+            file_content = file_context_text(additional_context)
+            await checkpoints.set_status(analysis_id, STATUS_RUNNING)
+        elif file_content:
+            # Обычно сюда приходит уже готовая выжимка файла (FileDigestCache); если она все же больше своей доли
+            # контекста, сжимаем ее по частям
+            file_budget = int(budget.limit * config.TOKEN_BUDGET_FILE_SHARE)
+            file_content = await budget.fit_text(
+                file_content,
+                file_budget,
+                summarize=lambda chunk: self._summarize_file_chunk(chunk, priority, bypass_cache),
+            )
+            additional_context = format_context([(FILE_CONTEXT_TITLE, file_content)])
+        if checkpoints is not None and checkpoint is None:
+            await checkpoints.create(analysis_id, self.user_id, analysis_params, additional_context)
+            for name, result in completed.items():
+                await checkpoints.save_stage(analysis_id, name, result)
         
+        compactor = ContextCompactor(budget)
+
+        # Этапы выполняются по графу зависимостей: рынок и конкуренты параллельно, синергия ждет оба результата
+        async def run_stage(stage: AnalysisStage, dependency_results: Dict[str, str]) -> str:
+            sections = pipeline.context_sections(dependency_results, company_name)
+            if stage.context_tokens:
+                # вместо полного файла и полных ответов предыдущих этапов — выдержка в пределах бюджета этапа
+                file_sections = [(FILE_CONTEXT_TITLE, file_content)] if additional_context else []
+                compacted = compactor.compact_sections(file_sections + sections, stage.context_tokens)
+                messages = build_stage_messages(stage.prompt_type, company_name, '', format_context(compacted))
+            else:
+                messages = build_stage_messages(
+                    stage.prompt_type, company_name, additional_context, format_context(sections)
+                )
+            model_api = ModelAPI(strategy, priority, self.user_id, call_site=stage.name)
+            return await model_api.get_response(budget.fit_messages(messages), bypass_cache=bypass_cache)
+
+        async def save_stage(stage: AnalysisStage, result: str, failed: bool) -> None:
+            await checkpoints.save_stage(analysis_id, stage.name, result, failed)
+
+        selected = [name for name in pipeline.stages if analysis_params.get(name, 0)]
+        results = await pipeline.run(
+            selected, run_stage, company_name, completed, save_stage if checkpoints is not None else None
+        )
+        if checkpoints is not None:
+            await checkpoints.set_status(analysis_id, STATUS_COMPLETED)
         return results
     
-    def _parse_classical_prompt(self, prompt_text: str) -> Dict[str, str]:
-        """
-        Парсит классический промпт формата 'РОЛЬ. ... КОНТЕКСТ. ...' 
-        и разделяет на роль и контекст.
-        """
-        try:
-            # Ищем паттерны РОЛЬ и КОНТЕКСТ
-            role_match = re.search(r'РОЛЬ\.\s*(.*?)(?=\n\s*КОНТЕКСТ\.|\n\s*[А-ЯЁ]+\.|\Z)', prompt_text, re.DOTALL | re.IGNORECASE)
-            context_match = re.search(r'КОНТЕКСТ\.\s*(.*?)(?=\n\s*[А-ЯЁ]+\.|\Z)', prompt_text, re.DOTALL | re.IGNORECASE)
-            
-            role = role_match.group(1).strip() if role_match else ""
-            context = context_match.group(1).strip() if context_match else ""
-            
-            # Если не нашли структурированные части, используем весь текст как контекст
-            if not role and not context:
-                context = prompt_text.strip()
-                role = "Ты профессиональный аналитик."
-            
-            return {
-                "role": role,
-                "prompt": context
-            }
-        except Exception as e:
-            logger.warning(f"Error parsing classical prompt: {e}")
-            return {
-                "role": "Ты профессиональный аналитик.",
-                "prompt": prompt_text
-            }
-
-    def create_docx_report(self, company_name: str, analysis_results: Dict[str, str]) -> str:
-        """Создает DOCX отчет с результатами анализа."""
+    async def _summarize_file_chunk(
+        self, chunk: str, priority: RequestPriority = RequestPriority.ANALYSIS, bypass_cache: bool = False
+    ) -> str:
+        """Сжимает часть файла, которая не помещается в контекст анализа."""
+        summary_prompt = SystemPrompts().get_prompt(SystemPrompt.FILE_SUMMARY)
+        messages = [{"role": "system", "content": summary_prompt}, {"role": "user", "content": chunk}]
+        model_api = ModelAPI(Models.chatgpt_file.value(), priority, self.user_id, call_site='file_summary')
+        return await model_api.get_response(messages, bypass_cache=bypass_cache)
+
+    def prompt_version(self, stages: List[str]) -> str:
+        """Хеш промптов этапов, промпта executive summary и модели: меняется при изменении любого из них."""
+        pipeline = AnalysisPipeline()
+        digest = hashlib.sha256(str(getattr(self._get_ai_model(), 'model', '')).encode('utf-8'))
+        for name in sorted(stages):
+            digest.update(build_stage_prefix(pipeline.stages[name].prompt_type).encode('utf-8'))
+        digest.update(self.executive_summary_prompt.encode('utf-8'))
+        return digest.hexdigest()
+
+    async def create_docx_report(self, company_name: str, analysis_results: Dict[str, str]) -> str:
+        """Создает DOCX отчет с результатами анализа в пуле процессов, не блокируя цикл событий."""
         try:
-            doc = Document()
-            
-            # Заголовок
-            title = doc.add_heading(f'Анализ инвестиционной привлекательности: {company_name}', 0)
-            
-            # Добавляем результаты анализов
-            if "market" in analysis_results:
-                doc.add_heading('Рыночный анализ', level=1)
-                doc.add_paragraph(analysis_results["market"])
-                doc.add_page_break()
-            
-            if "rivals" in analysis_results:
-                doc.add_heading('Анализ конкурентов', level=1)
-                doc.add_paragraph(analysis_results["rivals"])
-                doc.add_page_break()
-            
-            if "synergy" in analysis_results:
-                doc.add_heading('Анализ синергии', level=1)
-                doc.add_paragraph(analysis_results["synergy"])
-            
-            # Сохраняем во временный файл
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.docx')
-            doc.save(temp_file.name)
-            temp_file.close()
-            
-            logger.info(f"DOCX report created: {temp_file.name}")
-            return temp_file.name
-            
+            return await ReportRenderer().render_analysis_report(company_name, analysis_results)
         except Exception as e:
             logger.error(f"Error creating DOCX report: {e}")
             raise
 
-    async def generate_executive_summary(self, docx_file_path: str) -> str:
-        """Генерирует executive summary на основе DOCX файла."""
+    def build_analysis_text(self, company_name: str, analysis_results: Dict[str, str]) -> str:
+        """Текст анализа с теми же заголовками и разделами, что и в DOCX отчете."""
+        parts = [f"Анализ инвестиционной привлекательности: {company_name}"]
+        for section, title in self.SECTION_TITLES.items():
+            if section in analysis_results:
+                parts += [title, analysis_results[section]]
+        return "\n".join(parts) + "\n"
+
+    def _build_executive_summary_messages(
+        self, company_name: str, analysis_results: Dict[str, str], file_digest: str = ""
+    ) -> list:
+        """Готовит сообщения для генерации executive summary прямо из результатов анализа, без DOCX."""
+        doc_content = self.build_analysis_text(company_name, analysis_results)
+        if file_digest:
+            doc_content += format_context([(FILE_CONTEXT_TITLE, file_digest)])
+
+        return [
+            {"role": "system", "content": self.executive_summary_prompt},
+            {"role": "user", "content": f"Содержимое анализа:\n\n{doc_content}"}
+        ]
+
+    def stream_executive_summary(
+        self, company_name: str, analysis_results: Dict[str, str], bypass_cache: bool = False, file_digest: str = ""
+    ):
+        """Генерирует executive summary потоково, фрагментами по мере генерации."""
+        model_api = ModelAPI(Models.chatgpt.value(), RequestPriority.BACKGROUND, self.user_id, call_site='summary')
+        messages = self._build_executive_summary_messages(company_name, analysis_results, file_digest)
+        return model_api.stream_response(messages, bypass_cache=bypass_cache)
+
+    async def generate_executive_summary(
+        self, company_name: str, analysis_results: Dict[str, str], bypass_cache: bool = False, file_digest: str = ""
+    ) -> str:
+        """Генерирует executive summary по результатам анализа."""
         try:
-            # Читаем содержимое DOCX файла
-            doc = Document(docx_file_path)
-            doc_content = ""
-            for paragraph in doc.paragraphs:
-                doc_content += paragraph.text + "\n"
-            
-            model_api = ModelAPI(Models.chatgpt.value())
-            messages = [
-                {"role": "system", "content": self.executive_summary_prompt},
-                {"role": "user", "content": f"Содержимое анализа:\n\n{doc_content}"}
-            ]
+            model_api = ModelAPI(
+                Models.chatgpt.value(), RequestPriority.BACKGROUND, self.user_id, call_site='summary'
+            )
+            messages = self._build_executive_summary_messages(company_name, analysis_results, file_digest)
             
-            executive_summary = await model_api.get_response(messages)
+            executive_summary = await model_api.get_response(messages, bypass_cache=bypass_cache)
             logger.info("Executive summary generated")
             return executive_summary
             
@@ -729,133 +760,16 @@ class InvestmentAnalysisProcessor:
             logger.error(f"Error generating executive summary: {e}")
 
     async def create_final_report_with_qa(self, company_name: str, analysis_results: Dict[str, str], qa_history: list) -> str:
-        """Создает финальный отчет с интегрированными Q&A."""
+        """Создает финальный отчет с интегрированными Q&A (готовый файл берется из кеша отчетов).
+
+        После отправки файл нужно освободить через FinalReportCache().release.
+        """
         try:
-        # Создаем новый документ
-            doc = Document()
-        
-        # Заголовок
-            title = doc.add_heading(f'Инвестиционный анализ: {company_name}', 0)
-            title.alignment = 1  # Выравнивание по центру
-        
-        # Дата создания отчета
-            from datetime import datetime
-            date_paragraph = doc.add_paragraph(f'Дата создания отчета: {datetime.now().strftime("%d.%m.%Y")}')
-            date_paragraph.alignment = 1  # Выравнивание по центру
-        
-            doc.add_page_break()
-        
-        # Добавляем результаты анализов с улучшенным форматированием
-            if "market" in analysis_results:
-                doc.add_heading('1. Рыночный анализ', level=1)
-                self._add_formatted_content(doc, analysis_results["market"])
-                doc.add_page_break()
-        
-            if "rivals" in analysis_results:
-                doc.add_heading('2. Анализ конкурентов', level=1)
-                self._add_formatted_content(doc, analysis_results["rivals"])
-                doc.add_page_break()
-        
-            if "synergy" in analysis_results:
-                doc.add_heading('3. Анализ синергии', level=1)
-                self._add_formatted_content(doc, analysis_results["synergy"])
-            
-                if qa_history:  # Добавляем разрыв страницы только если есть Q&A
-                    doc.add_page_break()
-        
-        # Добавляем Q&A секцию если есть вопросы
-            if qa_history:
-                doc.add_heading('4. Дополнительные вопросы и ответы', level=1)
-            
-                for i, qa in enumerate(qa_history, 1):
-                # Добавляем вопрос
-                    question_para = doc.add_paragraph()
-                    question_run = question_para.add_run(f"Вопрос {i}: ")
-                    question_run.bold = True
-                    question_para.add_run(qa['question'])
-                
-                # Добавляем ответ
-                    answer_para = doc.add_paragraph()
-                    answer_run = answer_para.add_run("Ответ: ")
-                    answer_run.bold = True
-                
-                # Добавляем сам текст ответа
-                    self._add_formatted_content(doc, qa['answer'], is_sub_content=True)
-                
-                # Добавляем небольшой отступ между Q&A парами (если не последний)
-                    if i < len(qa_history):
-                        doc.add_paragraph()  # Один пустой параграф вместо нескольких
-        
-        # Сохраняем во временный файл
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='_final.docx')
-            doc.save(temp_file.name)
-            temp_file.close()
-        
-            logger.info(f"Final report with Q&A created: {temp_file.name}")
-            return temp_file.name
-        
+            return await FinalReportCache().get_report(company_name, analysis_results, qa_history)
         except Exception as e:
             logger.error(f"Error creating final report with Q&A: {e}")
-        # В случае ошибки возвращаем базовый отчет
-            return self.create_docx_report(company_name, analysis_results)
-
-
-    def _add_formatted_content(self, doc, content: str, is_sub_content: bool = False):
-        """Добавляет форматированный контент в документ."""
-        if not content:
-            return
-    
-    # Разбиваем контент на параграфы
-        paragraphs = content.split('\n\n')
-    
-        for para_text in paragraphs:
-            if not para_text.strip():
-                continue
-        
-            lines = para_text.strip().split('\n')
-        
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-            
-            # Проверяем, является ли строка заголовком
-                if line.startswith('##'):
-                # Подзаголовок уровня 2
-                    heading_text = line.replace('##', '').strip()
-                    if heading_text:
-                        doc.add_heading(heading_text, level=3)
-                elif line.startswith('#'):
-                # Подзаголовок уровня 1 
-                    heading_text = line.replace('#', '').strip()
-                    if heading_text:
-                        doc.add_heading(heading_text, level=2 if is_sub_content else 2)
-                elif line.startswith('**') and line.endswith('**'):
-                # Жирный текст как отдельный параграф
-                    para = doc.add_paragraph()
-                    run = para.add_run(line.replace('**', ''))
-                    run.bold = True
-                elif line.startswith('- ') or line.startswith('* '):
-                # Маркированный список
-                    bullet_text = line[2:].strip()
-                    if bullet_text:
-                        para = doc.add_paragraph(bullet_text, style='List Bullet')
-                elif line[0].isdigit() and '. ' in line:
-                # Нумерованный список
-                    numbered_text = line.split('. ', 1)[1] if '. ' in line else line
-                    if numbered_text:
-                        para = doc.add_paragraph(numbered_text, style='List Number')
-                else:
-                # Обычный параграф
-                    para = doc.add_paragraph()
-                
-                # Обрабатываем жирный текст внутри параграфа
-                    parts = line.split('**')
-                    for i, part in enumerate(parts):
-                        if part:
-                            run = para.add_run(part)
-                            if i % 2 == 1:  # Нечетные части - жирные
-                                run.bold = True
+            # В случае ошибки возвращаем базовый отчет
+            return await self.create_docx_report(company_name, analysis_results)
 
     def _sanitize_filename(self, filename: str) -> str:
         """Очищает имя файла от недопустимых символов."""
@@ -908,46 +822,91 @@ class BaseScenario(ABC):
             )
             return
 
+        # Похожий запрос уже анализировался: сразу показываем готовый результат (кроме запросов с файлом)
+        force_fresh = user_data.get('force_fresh', False)
+        if force_fresh:
+            await state.update_data(force_fresh=False)
+        elif not file_content:
+            cache_hit = SemanticCache().lookup(Topics.investment.name, user_query)
+            if cache_hit:
+                await self.send_cached_investment_analysis(message, state, cache_hit)
+                return
+
         try:
             # Показываем прогресс
             progress_msg = await message.answer('🔍 Анализирую запрос и определяю параметры анализа...')
             
             # Инициализируем процессор анализа
-            processor = InvestmentAnalysisProcessor()
+            processor = InvestmentAnalysisProcessor(user_id=user_id)
             
             # Парсим запрос пользователя
             analysis_params = await processor.parse_user_request(user_query)
             company_name = analysis_params.get("name", "unknown_company")
             
+            # Ту же компанию недавно уже анализировали с теми же этапами и промптами: отдаем готовый анализ
+            stages = [name for name in AnalysisPipeline().stages if analysis_params.get(name, 0)]
+            prompt_version = processor.prompt_version(stages)
+            if not force_fresh and not file_content:
+                stored = await CompanyAnalysisStore().get(company_name, stages, prompt_version)
+                if stored:
+                    await progress_msg.delete()
+                    await self.send_stored_investment_analysis(message, state, user_query, stored)
+                    return
+
+            # Выжимка из файла строится один раз и используется всеми этапами, executive summary и Q&A
+            file_digest_id, file_digest = None, ''
+            if file_content:
+                await progress_msg.edit_text('📄 Готовлю выжимку из файла...')
+                file_digest_id, file_digest = await FileDigestCache().get_digest(
+                    file_content, user_id, bypass_cache=force_fresh
+                )
+
             await progress_msg.edit_text(f'📊 Запускаю анализ для компании: {company_name}...')
             
-            # Запускаем анализ
-            analysis_results = await processor.run_analysis(analysis_params, file_content)
-            
-            await progress_msg.edit_text('📄 Создаю отчет...')
-            
-            # Создаем DOCX отчет
-            docx_file_path = processor.create_docx_report(company_name, analysis_results)
+            # Запускаем анализ; результаты этапов сохраняются в контрольную точку
+            analysis_id = uuid.uuid4().hex
+            analysis_results = await processor.run_analysis(
+                analysis_params, file_digest, bypass_cache=force_fresh, analysis_id=analysis_id
+            )
             
             await progress_msg.edit_text('📝 Генерирую executive summary...')
             
-            # Генерируем executive summary
-            executive_summary = await processor.generate_executive_summary(docx_file_path)
+            # Executive summary строится по результатам в памяти; DOCX отчет формируется, только когда его запросят
+            if config.STREAMING_ENABLED:
+                await progress_msg.delete()
+                executive_summary = await self.send_streaming_response(
+                    message,
+                    processor.stream_executive_summary(
+                        company_name, analysis_results, bypass_cache=force_fresh, file_digest=file_digest
+                    ),
+                )
+            else:
+                executive_summary = await processor.generate_executive_summary(
+                    company_name, analysis_results, bypass_cache=force_fresh, file_digest=file_digest
+                )
             
             # Сохраняем данные для дальнейшего использования
+            analysis_data = {
+                'analysis_params': analysis_params,
+                'analysis_results': analysis_results,
+                'executive_summary': executive_summary,
+                'company_name': company_name,
+            }
+            # qa_history для хранения вопросов и ответов
             await state.update_data(
-                analysis_params=analysis_params,
-                analysis_results=analysis_results,
-                docx_file_path=docx_file_path,
-                executive_summary=executive_summary,
-                company_name=company_name,
-                qa_history=[]  # Для хранения вопросов и ответов
+                **analysis_data, analysis_id=analysis_id, file_digest_id=file_digest_id, qa_history=[]
             )
+            # анализ с ошибками этапов не сохраняем: следующий запрос должен получить полный анализ
+            if not file_content and executive_summary and not AnalysisPipeline().failed_stages(analysis_results):
+                SemanticCache().store(Topics.investment.name, user_query, analysis_data)
+                await CompanyAnalysisStore().save(
+                    company_name, stages, prompt_version, analysis_params, analysis_results, executive_summary
+                )
             
             # Отправляем executive summary
-            await self.send_markdown_response(message, executive_summary)
-            
-            await progress_msg.delete()
+            if not config.STREAMING_ENABLED:
+                await self.send_markdown_response(message, executive_summary)
+                await progress_msg.delete()
             
             # Показываем кнопки действий
             keyboard = InvestmentActionsKeyboard()
@@ -976,8 +935,20 @@ class BaseScenario(ABC):
             )
             return
 
+        # Кеш похожих запросов используется только для первого вопроса без файла: дальше ответ зависит от диалога
+        topic_name = user_data.get('chosen_topic')
+        cacheable = not file_content and not user_data.get('skip_system_prompt', False)
+        force_fresh = user_data.get('force_fresh', False)
+        if force_fresh:
+            await state.update_data(force_fresh=False)
+        elif cacheable:
+            cache_hit = SemanticCache().lookup(Topics.startups.name, user_query)
+            if cache_hit:
+                await self.send_cached_startups_response(message, cache_hit, topic_name)
+                return
+
         if file_content:
-            summary = await self.summarize_file_content(file_content)
+            summary = await self.summarize_file_content(file_content, user_id=user_id)
             if not summary:
                 await message.answer('Произошла ошибка при суммаризации файла. Попробуйте еще раз или обратитесь к администратору.'
                 )
@@ -988,11 +959,11 @@ class BaseScenario(ABC):
 
         chat_context = ChatContextManager()
         strategy = Models.chatgpt.value()
-        model_api = ModelAPI(strategy)
+        model_api = ModelAPI(strategy, RequestPriority.ANALYSIS, user_id, call_site='chat')
     
         try:
         # Используем ExcelSearchStrategy но без file_search
-            excel_search = ExcelSearchStrategy()
+            excel_search = ModelAPI(ExcelSearchStrategy(), RequestPriority.ANALYSIS, user_id, call_site='excel_search')
             excel_data = await excel_search.get_response([{'role': 'user', 'content': user_query}])
         
         # Если получили данные из Excel, добавляем к запросу
@@ -1003,12 +974,13 @@ class BaseScenario(ABC):
                 full_query = f'{user_query}{file_context}'
                 logger.warning(f"Excel search failed, continuing without data: {excel_data}")
         
-            topic_name = user_data.get('chosen_topic')
             chat_context.add_message(user_id, topic_name, 'user', full_query)
 
             await self.bot.send_chat_action(chat_id=user_id, action='typing')
-            messages = chat_context.get_limited_messages_for_api(user_id, topic_name, limit=0)
-            response = await model_api.get_response(messages)
+            messages = chat_context.get_limited_messages_for_api(
+                user_id, topic_name, limit=0, model=getattr(strategy, 'model', None)
+            )
+            response = await model_api.get_response(messages, bypass_cache=force_fresh)
 
             system_prompts = SystemPrompts()
             detail_prompt_type = f'{topic_name.upper()}_DETAIL'
@@ -1017,8 +989,12 @@ class BaseScenario(ABC):
                 {'role': 'system', 'content': detail_prompt},
                 {'role': 'user', 'content': full_query},
             ]
-            detail_response = await model_api.get_response(detail_messages)
+            detail_response = await model_api.get_response(detail_messages, bypass_cache=force_fresh)
             chat_context.add_message(user_id, topic_name, 'assistant', response)
+            if cacheable:
+                SemanticCache().store(
+                    Topics.startups.name, user_query, {'response': response, 'detail_response': detail_response}
+                )
         
             await self.send_markdown_response(message, response)
             await self.send_html_detail_response(message, detail_response)
@@ -1028,6 +1004,50 @@ class BaseScenario(ABC):
         except Exception as e:
             await self.handle_error(message, e, "startups_scouting")
         
+    @staticmethod
+    def _semantic_cache_notice(cache_hit: SemanticCacheHit) -> str:
+        age_minutes = int((time.time() - cache_hit.entry.created_at) // 60)
+        age = f'{age_minutes // 60} ч назад' if age_minutes >= 60 else f'{age_minutes} мин назад'
+        return f'⚡ Найден готовый результат по похожему запросу «{cache_hit.entry.query}» ({age}).'
+
+    async def send_cached_investment_analysis(self, message, state, cache_hit: SemanticCacheHit):
+        """Показывает анализ, сохраненный для похожего запроса, с возможностью запустить анализ заново."""
+        # контрольная точка принадлежит автору исходного запроса, при повторной генерации будет создана новая
+        await state.update_data(**cache_hit.entry.payload, analysis_id=None, file_digest_id=None, qa_history=[])
+        await message.answer(self._semantic_cache_notice(cache_hit))
+        await self.send_markdown_response(message, cache_hit.entry.payload['executive_summary'])
+        await message.answer('Что бы вы хотели сделать дальше?', reply_markup=InvestmentCachedActionsKeyboard())
+        await UserStates.INVESTMENT_ACTIONS.set()
+
+    async def send_stored_investment_analysis(self, message, state, user_query: str, stored: StoredAnalysis):
+        """Показывает свежий анализ той же компании из общего хранилища анализов."""
+        analysis_data = {
+            'analysis_params': stored.analysis_params,
+            'analysis_results': stored.analysis_results,
+            'executive_summary': stored.executive_summary,
+            'company_name': stored.company_name,
+        }
+        await state.update_data(**analysis_data, analysis_id=None, file_digest_id=None, qa_history=[])
+        SemanticCache().store(Topics.investment.name, user_query, analysis_data)
+
+        created_at = time.strftime('%d.%m.%Y %H:%M', time.localtime(stored.created_at))
+        await message.answer(f'⚡ Найден готовый анализ компании «{stored.company_name}» от {created_at}.')
+        await self.send_markdown_response(message, stored.executive_summary)
+        await message.answer('Что бы вы хотели сделать дальше?', reply_markup=InvestmentCachedActionsKeyboard())
+        await UserStates.INVESTMENT_ACTIONS.set()
+
+    async def send_cached_startups_response(self, message, cache_hit: SemanticCacheHit, topic_name: str):
+        """Показывает ответ скаутинга, сохраненный для похожего запроса, и добавляет его в контекст диалога."""
+        chat_context = ChatContextManager()
+        chat_context.add_message(message.chat.id, topic_name, 'user', cache_hit.entry.query)
+        chat_context.add_message(message.chat.id, topic_name, 'assistant', cache_hit.entry.payload['response'])
+
+        await message.answer(self._semantic_cache_notice(cache_hit))
+        await self.send_markdown_response(message, cache_hit.entry.payload['response'])
+        await self.send_html_detail_response(message, cache_hit.entry.payload['detail_response'])
+        await message.answer('Остались ли у Вас вопросы?', reply_markup=CachedContinueKeyboard())
+        await UserStates.ASKING_CONTINUE.set()
+
     async def process_query_with_file(self, message, state, file_content='', skip_system_prompt=False, max_history=0):
         """Универсальная обработка запроса пользователя с учетом выбранной темы."""
         user_data = await state.get_data()
@@ -1059,7 +1079,7 @@ class BaseScenario(ABC):
             return
 
         if file_content:
-            summary = await self.summarize_file_content(file_content)
+            summary = await self.summarize_file_content(file_content, user_id=user_id)
             if not summary:
                 await message.answer(
                     'Произошла ошибка при суммаризации файла. Попробуйте еще раз или обратитесь к администратору.'
@@ -1071,7 +1091,7 @@ class BaseScenario(ABC):
 
         chat_context = ChatContextManager()
         strategy = Models[model_name].value()
-        model_api = ModelAPI(strategy)
+        model_api = ModelAPI(strategy, RequestPriority.ANALYSIS, user_id, call_site='chat')
         
         try:
             full_query = f'{user_query}{file_context}'
@@ -1083,6 +1103,7 @@ class BaseScenario(ABC):
                 topic_name,
                 limit=max_history,
                 skip_system_prompt=skip_system_prompt,
+                model=getattr(strategy, 'model', None),
             )
             response = await model_api.get_response(messages)
 
@@ -1115,6 +1136,98 @@ class BaseScenario(ABC):
             part = escaped_response[i : i + max_length]
             await message.answer(part, parse_mode='MarkdownV2')
 
+    async def send_streaming_response(self, message, chunks) -> str:
+        """Показывает ответ модели по мере генерации, редактируя сообщение не чаще STREAM_EDIT_INTERVAL секунд.
+
+        Текст длиннее 4000 символов продолжается в новых сообщениях. После завершения генерации
+        каждое сообщение переформатируется в MarkdownV2, как в send_markdown_response.
+        """
+        max_length = 4000
+        loop = asyncio.get_running_loop()
+        full_text = ''
+        sent_parts = []  # [сообщение, показанный текст, актуальный текст части]
+        current = None
+        part_start = 0
+        last_edit = 0.0
+
+        async def show(text: str) -> None:
+            nonlocal current
+            if not text.strip():
+                return
+            if current is None:
+                current = [await message.answer(text), text, text]
+                sent_parts.append(current)
+                return
+            current[2] = text
+            if current[1] == text:
+                return
+            try:
+                await current[0].edit_text(text)
+                current[1] = text
+            except aiogram.utils.exceptions.MessageNotModified:
+                current[1] = text
+            except aiogram.utils.exceptions.RetryAfter as e:
+                logger.warning(f'Telegram ограничил частоту правок сообщения, пауза {e.timeout}с')
+
+        async def flush() -> None:
+            nonlocal current, part_start
+            while len(full_text) - part_start > max_length:
+                split_at = self._find_split_point(full_text[part_start:], max_length)
+                await show(full_text[part_start : part_start + split_at])
+                part_start += split_at
+                current = None
+            await show(full_text[part_start:])
+
+        async for chunk in chunks:
+            full_text += chunk
+            if loop.time() - last_edit >= config.STREAM_EDIT_INTERVAL:
+                await flush()
+                last_edit = loop.time()
+        await flush()
+
+        for sent_message, _, text in sent_parts:
+            escaped_text = self._escape_markdown(text)
+            try:
+                await sent_message.edit_text(escaped_text, parse_mode='MarkdownV2')
+            except aiogram.utils.exceptions.TelegramAPIError as e:
+                logger.debug(f'Не удалось переформатировать сообщение в MarkdownV2: {e}')
+                try:
+                    await sent_message.edit_text(text)
+                except aiogram.utils.exceptions.TelegramAPIError:
+                    pass
+
+        return full_text.strip()
+
+    @staticmethod
+    def _find_split_point(text: str, max_length: int) -> int:
+        """Ищет границу разбиения не дальше max_length, предпочитая перенос строки."""
+        newline_pos = text.rfind('\n', 0, max_length)
+        if newline_pos > max_length // 2:
+            return newline_pos + 1
+        return max_length
+
+    @classmethod
+    def _split_sections(cls, text: str, max_length: int = 4000) -> List[str]:
+        """Делит текст на сообщения не длиннее max_length по границам разделов (пустым строкам)."""
+        parts = []
+        current = ''
+        for section in text.split('\n\n'):
+            candidate = f'{current}\n\n{section}' if current else section
+            if len(candidate) <= max_length:
+                current = candidate
+                continue
+            if current:
+                parts.append(current)
+            # раздел, который не помещается в одно сообщение, делится по строкам
+            while len(section) > max_length:
+                split_at = cls._find_split_point(section, max_length)
+                parts.append(section[:split_at])
+                section = section[split_at:]
+            current = section
+        if current:
+            parts.append(current)
+        return parts
+
     async def send_html_detail_response(self, message, detail_response):
         max_chunk_size = 3000
         detail_chunks = [
@@ -1201,12 +1314,21 @@ class BaseScenario(ABC):
             return int(match.group(1))
         return None
 
-    async def summarize_file_content(self, file_content: str) -> str:
+    async def summarize_file_content(self, file_content: str, user_id: int = None) -> str:
         summary_prompt = SystemPrompts().get_prompt(SystemPrompt.FILE_SUMMARY)
-        messages = [{'role': 'system', 'content': summary_prompt}, {'role': 'user', 'content': file_content}]
-        model_api = ModelAPI(Models.chatgpt_file.value())
+        strategy = Models.chatgpt_file.value()
+        model_api = ModelAPI(strategy, RequestPriority.BACKGROUND, user_id, call_site='file_summary')
+        budget = TokenBudget(strategy.model)
+
+        async def summarize(text: str) -> str:
+            messages = [{'role': 'system', 'content': summary_prompt}, {'role': 'user', 'content': text}]
+            return await model_api.get_response(messages)
+
         try:
-            summary = await model_api.get_response(messages)
+            # Файл больше контекста модели: сначала сжимаем его части, затем суммаризируем результат
+            available = budget.limit - budget.count_messages([{'role': 'system', 'content': summary_prompt}])
+            file_content = await budget.fit_text(file_content, available, summarize=summarize)
+            summary = await summarize(file_content)
             logger.info(f'Суммаризация файла завершена, длина summary: {len(summary)} символов')
             return summary
         except Exception as e:
@@ -1239,38 +1361,13 @@ class InvestmentActionsHandler(BaseScenario):
         await callback_query.answer()
 
         if action == 'investment_regenerate':
-            # Регенерация анализа
-            await callback_query.message.delete()
-            progress_msg = await callback_query.message.answer('🔄 Запускаю повторную генерацию анализа...')
-            
-            try:
-                # Повторно запускаем анализ
-                processor = InvestmentAnalysisProcessor()
-                analysis_params = user_data.get('analysis_params')
-                company_name = user_data.get('company_name')
-                
-                analysis_results = await processor.run_analysis(analysis_params)
-                docx_file_path = processor.create_docx_report(company_name, analysis_results)
-                executive_summary = await processor.generate_executive_summary(docx_file_path)
-                
-                # Обновляем данные
-                await state.update_data(
-                    analysis_results=analysis_results,
-                    docx_file_path=docx_file_path,
-                    executive_summary=executive_summary,
-                    qa_history=[]  # Сбрасываем историю Q&A
-                )
-                
-                await progress_msg.delete()
-                await self.send_markdown_response(callback_query.message, executive_summary)
-                await callback_query.message.answer(
-                    'Что бы вы хотели сделать дальше?', 
-                    reply_markup=InvestmentActionsKeyboard()
-                )
-                
-            except Exception as e:
-                await progress_msg.delete()
-                await self.handle_error(callback_query.message, e, "regeneration")
+            # Выбор разделов для повторной генерации: остальные разделы сохраняются
+            analysis_results = user_data.get('analysis_results') or {}
+            failed_count = len(AnalysisPipeline().failed_stages(analysis_results))
+            await callback_query.message.edit_text(
+                'Какие разделы анализа сгенерировать заново?',
+                reply_markup=RegenerateSectionsKeyboard.build(analysis_results, failed_count),
+            )
             
         elif action == 'investment_ask_question':
             # Переход к режиму вопросов-ответов
@@ -1300,6 +1397,161 @@ class InvestmentActionsHandler(BaseScenario):
         
         logger.info("=== InvestmentActionsHandler REGISTERED SUCCESSFULLY ===")
 
+class InvestmentRegenerateSectionsHandler(BaseScenario):
+    """Повторная генерация выбранных разделов анализа или разделов с ошибками."""
+
+    async def process(self, callback_query: types.CallbackQuery, state: FSMContext, **kwargs) -> None:
+        user_id = callback_query.from_user.id
+        section = callback_query.data.replace('regenerate_', '')
+        user_data = await state.get_data()
+        analysis_params = user_data.get('analysis_params')
+        analysis_results = user_data.get('analysis_results') or {}
+        company_name = user_data.get('company_name')
+
+        await callback_query.answer()
+        await callback_query.message.delete()
+        logger.info(f'Пользователь {user_id} запросил повторную генерацию разделов: {section}')
+
+        if section == 'all':
+            rerun = list(analysis_results)
+        elif section == 'failed':
+            rerun = AnalysisPipeline().failed_stages(analysis_results)
+        else:
+            rerun = [section]
+        progress_msg = await callback_query.message.answer('🔄 Запускаю повторную генерацию анализа...')
+
+        try:
+            processor = InvestmentAnalysisProcessor(user_id=user_id)
+            analysis_id = user_data.get('analysis_id') or uuid.uuid4().hex
+            # выжимка файла не зависит от ответов моделей, поэтому берется готовой, а не строится заново
+            file_digest = FileDigestCache().get(user_data.get('file_digest_id')) or ''
+
+            # Повторная генерация должна обращаться к модели, а не к кешу ответов
+            analysis_results = await processor.run_analysis(
+                analysis_params,
+                file_digest,
+                bypass_cache=True,
+                priority=RequestPriority.BACKGROUND,
+                analysis_id=analysis_id,
+                rerun=rerun,
+                previous_results=analysis_results,
+            )
+            executive_summary = await processor.generate_executive_summary(
+                company_name, analysis_results, bypass_cache=True, file_digest=file_digest
+            )
+
+            # Обновляем данные
+            await state.update_data(
+                analysis_id=analysis_id,
+                analysis_results=analysis_results,
+                executive_summary=executive_summary,
+                qa_history=[]  # Сбрасываем историю Q&A
+            )
+
+            await progress_msg.delete()
+            await self.send_markdown_response(callback_query.message, executive_summary)
+            await callback_query.message.answer(
+                'Что бы вы хотели сделать дальше?',
+                reply_markup=InvestmentActionsKeyboard()
+            )
+
+        except Exception as e:
+            await progress_msg.delete()
+            await self.handle_error(callback_query.message, e, "regeneration")
+
+    def register(self, dp: Dispatcher) -> None:
+        dp.register_callback_query_handler(
+            self.process,
+            lambda c: c.data.startswith('regenerate_'),
+            state=UserStates.INVESTMENT_ACTIONS,
+        )
+
+
+class ResumeAnalysisHandler(BaseScenario):
+    """Продолжение анализов, прерванных перезапуском бота, с последнего завершенного этапа."""
+
+    async def notify_interrupted(self) -> None:
+        """Предлагает пользователям продолжить анализы, которые выполнялись в момент остановки бота."""
+        checkpoints = AnalysisCheckpointStore()
+        for checkpoint in await checkpoints.list_interrupted():
+            completed = len(checkpoint.completed_results())
+            try:
+                await self.bot.send_message(
+                    chat_id=checkpoint.user_id,
+                    text=(
+                        f'⚠️ Анализ компании {checkpoint.company_name} был прерван перезапуском бота '
+                        f'(готово разделов: {completed}). Продолжить с последнего завершенного этапа?'
+                    ),
+                    reply_markup=ResumeAnalysisKeyboard.build(checkpoint.analysis_id),
+                )
+            except Exception as e:
+                logger.error(f'Не удалось предложить продолжение анализа {checkpoint.analysis_id}: {e}')
+            await checkpoints.set_status(checkpoint.analysis_id, STATUS_INTERRUPTED)
+        logger.info('Проверка прерванных анализов завершена')
+
+    async def process(self, callback_query: types.CallbackQuery, state: FSMContext, **kwargs) -> None:
+        user_id = callback_query.from_user.id
+        action, _, analysis_id = callback_query.data.partition(':')
+        checkpoints = AnalysisCheckpointStore()
+        checkpoint = await checkpoints.load(analysis_id)
+
+        await callback_query.answer()
+        await callback_query.message.delete()
+
+        if checkpoint is None or checkpoint.user_id != user_id:
+            await callback_query.message.answer(
+                'Сохраненный анализ не найден или устарел. Начните новый анализ: /start'
+            )
+            return
+        if action == 'resume_discard':
+            await checkpoints.set_status(analysis_id, STATUS_DISCARDED)
+            await callback_query.message.answer('Хорошо, анализ не будет продолжен. Начать новый анализ: /start')
+            return
+
+        logger.info(f'Пользователь {user_id} продолжает прерванный анализ {analysis_id}')
+        company_name = checkpoint.company_name
+        progress_msg = await callback_query.message.answer(
+            f'🔄 Продолжаю анализ компании {company_name} с последнего завершенного этапа...'
+        )
+        try:
+            processor = InvestmentAnalysisProcessor(user_id=user_id)
+            analysis_results = await processor.run_analysis(checkpoint.analysis_params, analysis_id=analysis_id)
+            executive_summary = await processor.generate_executive_summary(
+                company_name, analysis_results, file_digest=file_context_text(checkpoint.additional_context)
+            )
+
+            # Состояние диалога после перезапуска пустое: восстанавливаем его из контрольной точки
+            await state.update_data(
+                chosen_topic=Topics.investment.name,
+                chosen_model='chatgpt',
+                analysis_id=analysis_id,
+                analysis_params=checkpoint.analysis_params,
+                analysis_results=analysis_results,
+                executive_summary=executive_summary,
+                company_name=company_name,
+                qa_history=[]
+            )
+
+            await progress_msg.delete()
+            await self.send_markdown_response(callback_query.message, executive_summary)
+            await callback_query.message.answer(
+                'Что бы вы хотели сделать дальше?',
+                reply_markup=InvestmentActionsKeyboard()
+            )
+            await UserStates.INVESTMENT_ACTIONS.set()
+
+        except Exception as e:
+            await progress_msg.delete()
+            await self.handle_error(callback_query.message, e, "resume_analysis")
+
+    def register(self, dp: Dispatcher) -> None:
+        dp.register_callback_query_handler(
+            self.process,
+            lambda c: c.data.startswith(('resume_analysis:', 'resume_discard:')),
+            state='*',
+        )
+
+
 class InvestmentQAHandler(BaseScenario):
     """Обработка вопросов-ответов в режиме инвестиционного анализа."""
 
@@ -1322,17 +1574,27 @@ class InvestmentQAHandler(BaseScenario):
         
         company_name = user_data.get('company_name', 'неизвестная_компания')
         qa_history = user_data.get('qa_history', [])
+        file_digest = FileDigestCache().get(user_data.get('file_digest_id'))
 
         try:
-            # Простой промпт только с названием компании и текущим вопросом
-            model_api = ModelAPI(Models.chatgpt.value())
+            # Простой промпт только с названием компании и текущим вопросом (и выжимкой файла, если он был)
+            model_api = ModelAPI(Models.chatgpt.value(), RequestPriority.INTERACTIVE, user_id, call_site='qa')
+            system_content = (
+                f"Ты эксперт по инвестиционному анализу. Ответь на вопрос по компании {company_name}. "
+                "Будь конкретным и профессиональным."
+            )
+            if file_digest:
+                system_content += format_context([(FILE_CONTEXT_TITLE, file_digest)])
             messages = [
-                {"role": "system", "content": f"Ты эксперт по инвестиционному анализу. Ответь на вопрос по компании {company_name}. Будь конкретным и профессиональным."},
+                {"role": "system", "content": system_content},
                 {"role": "user", "content": user_question}
             ]
             
             await self.bot.send_chat_action(chat_id=user_id, action='typing')
-            response = await model_api.get_response(messages)
+            if config.STREAMING_ENABLED:
+                response = await self.send_streaming_response(message, model_api.stream_response(messages))
+            else:
+                response = await model_api.get_response(messages)
             
             # Сохраняем Q&A в историю для итогового отчета
             qa_history.append({
@@ -1342,7 +1604,8 @@ class InvestmentQAHandler(BaseScenario):
             
             await state.update_data(qa_history=qa_history)
             
-            await self.send_markdown_response(message, response)
+            if not config.STREAMING_ENABLED:
+                await self.send_markdown_response(message, response)
             
             # Кнопка для возврата к действиям
             await message.answer(
@@ -1539,13 +1802,14 @@ class InvestmentReportHandler(BaseScenario):
                 safe_company_name = "unknown_company"
             report_filename = f'investment_analysis_{safe_company_name}_final.docx'
             
-            with open(final_report_path, 'rb') as doc_file:
-                await callback_query.message.answer_document(
-                    document=types.InputFile(doc_file, filename=report_filename),
-                    caption=f'Финальный отчет c инвестиционным анализом: {company_name}'
-                )
-            
-            os.unlink(final_report_path)
+            try:
+                with open(final_report_path, 'rb') as doc_file:
+                    await callback_query.message.answer_document(
+                        document=types.InputFile(doc_file, filename=report_filename),
+                        caption=f'Финальный отчет c инвестиционным анализом: {company_name}'
+                    )
+            finally:
+                FinalReportCache().release(final_report_path)
             
             # Показываем финальные кнопки
             await callback_query.message.answer(
@@ -1598,15 +1862,15 @@ class InvestmentReportHandler(BaseScenario):
                 safe_company_name = "unknown_company"
             report_filename = f'investment_analysis_{safe_company_name}_final.docx'
             
-            success = await self.email_sender.send_report(
-                user_email, 
-                company_name, 
-                final_report_path,
-                filename=report_filename
-            )
-            
-            if os.path.exists(final_report_path):
-                os.unlink(final_report_path)
+            try:
+                success = await self.email_sender.send_report(
+                    user_email, 
+                    company_name, 
+                    final_report_path,
+                    filename=report_filename
+                )
+            finally:
+                FinalReportCache().release(final_report_path)
             
             if success:
                 await callback_query.message.edit_text(f'✅ Отчет успешно отправлен на {user_email}')
@@ -1809,6 +2073,144 @@ class Access(BaseScenario):
         )
 
 
+class PortfolioCommandHandler(BaseScenario):
+    """Обработка команды /portfolio: анализ списка компаний из файла."""
+
+    async def process(self, message: types.Message, state: FSMContext, **kwargs) -> None:
+        user_id = message.from_user.id
+        logger.info(f'Команда /portfolio от пользователя {user_id}')
+
+        try:
+            is_authorized = await check_user_authorized(user_id)
+        except Exception as e:
+            logger.error(f"Ошибка проверки авторизации для пользователя {user_id}: {e}")
+            is_authorized = False
+        if not is_authorized:
+            await message.answer(
+                "🔒 Доступ к боту ограничен.\n\n"
+                "Для получения доступа пройдите авторизацию в главном боте.",
+                reply_markup=UnauthorizedKeyboard.get_markup()
+            )
+            return
+
+        await state.finish()
+        await message.answer(
+            '📋 Портфельный анализ\n\n'
+            'Отправьте файл со списком компаний: .xlsx (названия в первом столбце) или .txt (по одной в строке), '
+            f'не более {config.PORTFOLIO_MAX_COMPANIES} компаний.\n\n'
+            'Для каждой компании будут выполнены рыночный анализ, анализ конкурентов и анализ синергии, '
+            'результаты придут одним DOCX отчетом.'
+        )
+        await UserStates.PORTFOLIO_UPLOAD.set()
+
+    def register(self, dp: Dispatcher) -> None:
+        dp.register_message_handler(self.process, commands=['portfolio'], state='*')
+
+
+class PortfolioUploadHandler(BaseScenario):
+    """Обработка файла со списком компаний: параллельный анализ и сводный отчет."""
+
+    status_icons = {PORTFOLIO_DONE: '✅', PORTFOLIO_FAILED: '⚠️', PORTFOLIO_RUNNING: '🔄'}
+
+    def _progress_text(self, items: List[PortfolioItem]) -> str:
+        finished = sum(item.status in (PORTFOLIO_DONE, PORTFOLIO_FAILED) for item in items)
+        lines = [f'📊 Портфельный анализ: готово {finished} из {len(items)}']
+        for item in items:
+            name = item.company_name if len(item.company_name) <= 60 else item.company_name[:57] + '...'
+            duration = f' ({item.duration:.0f}с)' if item.status in (PORTFOLIO_DONE, PORTFOLIO_FAILED) else ''
+            lines.append(f'{self.status_icons.get(item.status, "⏳")} {name}{duration}')
+        return '\n'.join(lines)
+
+    async def _read_companies(self, message: types.Message) -> List[str]:
+        file = await self.bot.get_file(message.document.file_id)
+        downloaded_file = await self.bot.download_file(file.file_path)
+        suffix = os.path.splitext(message.document.file_name)[1].lower()
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        try:
+            temp_file.write(downloaded_file.read())
+            temp_file.close()
+            return await asyncio.to_thread(read_company_list, temp_file.name)
+        finally:
+            os.unlink(temp_file.name)
+
+    async def process(self, message: types.Message, state: FSMContext, **kwargs) -> None:
+        user_id = message.from_user.id
+        file_name = message.document.file_name or ''
+        if not file_name.lower().endswith(('.xlsx', '.txt')):
+            await message.answer('Пожалуйста, загрузите список компаний в формате .xlsx или .txt.')
+            return
+
+        try:
+            companies = await self._read_companies(message)
+        except Exception as e:
+            logger.error(f'Не удалось прочитать список компаний от пользователя {user_id}: {e}')
+            await message.answer('Не удалось прочитать файл. Проверьте формат и попробуйте еще раз.')
+            return
+        if not companies:
+            await message.answer('В файле не найдено ни одной компании. Загрузите другой файл.')
+            return
+        if len(companies) > config.PORTFOLIO_MAX_COMPANIES:
+            await message.answer(
+                f'В файле {len(companies)} компаний, а за один раз можно проанализировать не более '
+                f'{config.PORTFOLIO_MAX_COMPANIES}. Сократите список и загрузите файл снова.'
+            )
+            return
+
+        await state.finish()
+        logger.info(f'Портфельный анализ пользователя {user_id}, компаний: {len(companies)}')
+        try:
+            shown_text = self._progress_text([PortfolioItem(company_name) for company_name in companies])
+            progress_msg = await message.answer(shown_text)
+            last_edit = 0.0
+
+            async def show(text: str) -> None:
+                nonlocal shown_text
+                if text == shown_text:
+                    return
+                try:
+                    await progress_msg.edit_text(text)
+                except aiogram.utils.exceptions.MessageNotModified:
+                    pass
+                shown_text = text
+
+            async def on_progress(items: List[PortfolioItem], item: PortfolioItem) -> None:
+                nonlocal last_edit
+                # Telegram ограничивает частоту правок сообщения, поэтому прогресс обновляется не чаще интервала
+                if time.monotonic() - last_edit < config.STREAM_EDIT_INTERVAL:
+                    return
+                last_edit = time.monotonic()
+                await show(self._progress_text(items))
+
+            portfolio = PortfolioAnalysis(InvestmentAnalysisProcessor(user_id=user_id))
+            items = await portfolio.run(companies, on_progress)
+            try:
+                await show(self._progress_text(items))
+            except aiogram.utils.exceptions.TelegramAPIError as e:
+                # итоговый прогресс не обязателен: отчет все равно должен быть отправлен
+                logger.warning(f'Не удалось обновить прогресс портфельного анализа: {e}')
+
+            await self.bot.send_chat_action(chat_id=user_id, action='upload_document')
+            report_path = await ReportRenderer().render_portfolio_report([dataclasses.asdict(item) for item in items])
+            try:
+                with open(report_path, 'rb') as doc_file:
+                    await message.answer_document(
+                        document=types.InputFile(
+                            doc_file, filename=f'portfolio_analysis_{time.strftime("%Y%m%d_%H%M")}.docx'
+                        ),
+                        caption=f'Портфельный анализ (компаний: {len(items)})',
+                    )
+            finally:
+                os.unlink(report_path)
+
+            await message.answer('Что бы вы хотели сделать дальше?', reply_markup=FinalActionsKeyboard())
+            await UserStates.CHOOSING_FINAL_ACTION.set()
+        except Exception as e:
+            await self.handle_error(message, e, "portfolio")
+
+    def register(self, dp: Dispatcher) -> None:
+        dp.register_message_handler(self.process, content_types=['document'], state=UserStates.PORTFOLIO_UPLOAD)
+
+
 class StartHandler(BaseScenario):
     """Обработка /start команды с проверкой авторизации."""
 
@@ -2098,6 +2500,34 @@ class ContinueDialogHandler(BaseScenario):
         dp.register_message_handler(self.process, content_types=['text'], state=UserStates.CONTINUE_DIALOG)
 
 
+class SemanticCacheForceFreshHandler(BaseScenario):
+    """Повторный запуск анализа, если результат по похожему запросу не подошел."""
+
+    async def process(self, callback_query: types.CallbackQuery, state: FSMContext, **kwargs) -> None:
+        user_id = callback_query.from_user.id
+        user_data = await state.get_data()
+        topic_name = user_data.get('chosen_topic')
+
+        await callback_query.answer()
+        await callback_query.message.delete()
+        logger.info(f'Пользователь {user_id} запросил новый анализ вместо результата из кеша похожих запросов')
+
+        if topic_name == Topics.startups.name:
+            # убираем из диалога ответ, взятый из кеша
+            system_prompt = SystemPrompts().get_prompt(SystemPrompt[topic_name.upper()])
+            ChatContextManager().start_new_chat(user_id, topic_name, system_prompt)
+
+        await state.update_data(force_fresh=True)
+        await self.process_query_with_file(callback_query.message, state)
+
+    def register(self, dp: Dispatcher) -> None:
+        dp.register_callback_query_handler(
+            self.process,
+            lambda c: c.data == 'semantic_force_fresh',
+            state=[UserStates.INVESTMENT_ACTIONS, UserStates.ASKING_CONTINUE],
+        )
+
+
 class ResetStateHandler(BaseScenario):
     """Обработка команды /reset для сброса состояния пользователя."""
 
@@ -2800,6 +3230,10 @@ class AdminHelpHandler(BaseScenario):
             '/update_scouting_prompts - Обновление excel файла для темы "Скаутинг стартапов"\n\n'
             '/set_ai_model - НОВОЕ: Выбор AI модели для инвестиционного анализа (ChatGPT, Claude и др.)\n\n'
             '/list_auth_users - Получить список id авторизованных пользователей.\n\n'
+            '/portfolio - Портфельный анализ: рынок, конкуренты и синергия для списка компаний из .xlsx/.txt '
+            'файла с общим DOCX отчетом.\n\n'
+            '/llm_stats - Статистика обращений к моделям (кеш ответов, очереди, лимиты OpenAI).\n\n'
+            '/llm_metrics - Выгрузка метрик обращений к моделям в формате Prometheus.\n\n'
             '/start - Перезапуск бота и возврат к выбору темы анализа.'
         )
 
@@ -2824,17 +3258,135 @@ class AdminListAuthUsersHandler(BaseScenario):
         dp.register_message_handler(self.process, commands=['list_auth_users'], state='*')
 
 
+class AdminLLMStatsHandler(BaseScenario):
+    """Обработка команды администратора для просмотра статистики обращений к моделям."""
+
+    async def process(self, message: types.Message, **kwargs) -> None:
+        user_id = message.from_user.id
+
+        if user_id not in config.ADMIN_USERS:
+            await message.answer('У вас нет прав для выполнения этой команды.')
+            return
+
+        cache_stats = ResponseCache().get_stats()
+        stats_text = (
+            '📊 Кеш ответов моделей:\n'
+            f'Попаданий: {cache_stats["hits"]} '
+            f'(память: {cache_stats["memory_hits"]}, диск: {cache_stats["disk_hits"]})\n'
+            f'Промахов: {cache_stats["misses"]}\n'
+            f'Доля попаданий: {cache_stats["hit_rate"]:.1%}\n'
+            f'Запросов в обход кеша: {cache_stats["bypassed"]}\n'
+            f'Записей: {cache_stats["memory_items"]} в памяти, {cache_stats["disk_items"]} на диске\n'
+            f'Вытеснено: {cache_stats["evictions"]}\n'
+            f'Объединено одинаковых одновременных запросов: {ModelAPI.coalesced_requests}'
+        )
+        semantic_stats = SemanticCache().get_stats()
+        stats_text += (
+            f'\n\n🧭 Кеш похожих запросов: записей {semantic_stats["entries"]}, '
+            f'попаданий {semantic_stats["hits"]}, промахов {semantic_stats["misses"]} '
+            f'(порог сходства {semantic_stats["threshold"]})'
+        )
+        store_stats = CompanyAnalysisStore().get_stats()
+        stats_text += (
+            f'\n🗄 Хранилище анализов компаний: записей {store_stats["entries"]}, '
+            f'выдано готовых {store_stats["hits"]}, промахов {store_stats["misses"]}, '
+            f'сохранено {store_stats["stores"]}'
+        )
+        file_digest_stats = FileDigestCache().get_stats()
+        stats_text += (
+            f'\n📄 Выжимки файлов: записей {file_digest_stats["entries"]}, построено {file_digest_stats["built"]}, '
+            f'из кеша {file_digest_stats["hits"]}'
+        )
+        scheduler_stats = LLMScheduler().get_stats()
+        stats_text += (
+            f'\n\n🚦 Планировщик: в работе {scheduler_stats["active"]["in_flight"]}'
+            f'/{scheduler_stats["active"]["max_concurrency"]}'
+        )
+        for priority in RequestPriority:
+            class_stats = scheduler_stats[priority.name]
+            stats_text += (
+                f'\n{priority.name}: в очереди {class_stats["queue_depth"]}, выполнено {class_stats["dispatched"]}, '
+                f'ожидание ср. {class_stats["avg_wait"]}с / макс. {class_stats["max_wait"]}с'
+            )
+        render_stats = ReportRenderer().get_stats()
+        stats_text += (
+            f'\n\n📄 Формирование отчетов: в работе {render_stats["in_flight"]}/{render_stats["workers"]}, '
+            f'в очереди {render_stats["queue_depth"]}, готово {render_stats["rendered"]} '
+            f'(ср. {render_stats["avg_time"]}с), ошибок {render_stats["failed"]}, таймаутов {render_stats["timeouts"]}'
+        )
+        report_cache_stats = FinalReportCache().get_stats()
+        stats_text += (
+            f'\nКеш финальных отчетов: записей {report_cache_stats["entries"]}, '
+            f'из кеша {report_cache_stats["hits"]}, дописано Q&A {report_cache_stats["extended"]}, '
+            f'сформировано заново {report_cache_stats["rendered"]}'
+        )
+        for limiter_name, limiter_stats in RateLimiterRegistry().get_stats().items():
+            stats_text += (
+                f'\n\n⏱ Лимитер {limiter_name}:\n'
+                f'Лимиты: {limiter_stats["rpm"]} запр/мин, {limiter_stats["tpm"]} токенов/мин\n'
+                f'Ожиданий бюджета: {limiter_stats["throttled"]}, суммарно {limiter_stats["total_wait"]}с'
+            )
+        state_labels = {'closed': '🟢 замкнут', 'open': '🔴 разомкнут', 'half_open': '🟡 пробный запрос'}
+        for model_name, breaker_stats in CircuitBreakerRegistry().get_stats().items():
+            p95 = f'{breaker_stats["p95"]}с' if breaker_stats['p95'] is not None else 'нет данных'
+            stats_text += (
+                f'\n\n🛡 Автомат {model_name}: {state_labels[breaker_stats["state"]]}'
+                f'{" (p95 выше SLO)" if breaker_stats["degraded"] else ""}\n'
+                f'p95: {p95} по {breaker_stats["samples"]} запросам, SLO {config.LLM_LATENCY_SLO:.0f}с\n'
+                f'Успешно: {breaker_stats["successes"]}, ошибок: {breaker_stats["failures"]}, '
+                f'ошибок запроса (не учитываются): {breaker_stats["client_errors"]}, '
+                f'размыканий: {breaker_stats["trips"]}\n'
+                f'Хеджировано: {breaker_stats["hedged"]} (резерв быстрее: {breaker_stats["hedge_wins"]}), '
+                f'сразу в резерв: {breaker_stats["short_circuited"]}'
+            )
+        call_sites = LLMMetrics().summary()
+        if call_sites:
+            stats_text += '\n\n📈 По местам вызова:'
+        for item in call_sites:
+            latency = f', p50 ≤{item["p50"]:g}с, p95 ≤{item["p95"]:g}с' if item.get('p95') is not None else ''
+            stats_text += (
+                f'\n{item["call_site"]} ({item["model"]}): {item["requests"]:g} запросов, ошибок {item["errors"]:g}'
+                f'{latency}, токены {item.get("prompt_tokens", 0)}/{item.get("completion_tokens", 0)} '
+                f'(кеш {item.get("cached_tokens", 0)}, {item.get("cached_share", 0):.0%})'
+            )
+        for part in self._split_sections(stats_text):
+            await message.answer(part)
+
+    def register(self, dp: Dispatcher) -> None:
+        dp.register_message_handler(self.process, commands=['llm_stats'], state='*')
+
+
+class AdminLLMMetricsHandler(BaseScenario):
+    """Обработка команды администратора для выгрузки метрик обращений к моделям в формате Prometheus."""
+
+    async def process(self, message: types.Message, **kwargs) -> None:
+        user_id = message.from_user.id
+
+        if user_id not in config.ADMIN_USERS:
+            await message.answer('У вас нет прав для выполнения этой команды.')
+            return
+
+        metrics_file = io.BytesIO(LLMMetrics().render_prometheus().encode('utf-8'))
+        await message.answer_document(document=types.InputFile(metrics_file, filename='llm_metrics.prom'))
+
+    def register(self, dp: Dispatcher) -> None:
+        dp.register_message_handler(self.process, commands=['llm_metrics'], state='*')
+
+
 class BotManager:
     scenarios: Dict[str, BaseScenario] = {}
 
     main_scenario = {
         'access': Access,
         'start': StartHandler,
+        'portfolio': PortfolioCommandHandler,
+        'portfolio_upload': PortfolioUploadHandler,
         'enter_prompt': ProcessingEnterPromptHandler,
         'attach_file': AttachFileHandler,
         'upload_file': UploadFileHandler,
         'continue_dialog': ContinueDialogHandler,
         'continue_callback': ProcessingContinueCallback,
+        'semantic_force_fresh': SemanticCacheForceFreshHandler,
         'reset_state': ResetStateHandler,
     }
 
@@ -2872,6 +3424,8 @@ class BotManager:
     admin_common_scenario = {
         'help': AdminHelpHandler,
         'auth_users_list': AdminListAuthUsersHandler,
+        'llm_stats': AdminLLMStatsHandler,
+        'llm_metrics': AdminLLMMetricsHandler,
     }
 
     def __init__(self, bot: Bot, dp: Dispatcher) -> None:
@@ -2881,6 +3435,8 @@ class BotManager:
         # ВАЖНО: Создаем investment_analysis_scenario ПЕРЕД регистрацией
         self.investment_analysis_scenario = { 
             'investment_actions': InvestmentActionsHandler,    
+            'investment_regenerate_sections': InvestmentRegenerateSectionsHandler,
+            'resume_analysis': ResumeAnalysisHandler,
             'investment_qa': InvestmentQAHandler, 
             'back_to_investment_actions': BackToInvestmentActionsHandler, 
             'investment_report': InvestmentReportHandler, 
@@ -2942,6 +3498,30 @@ if __name__ == '__main__':
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации авторизации: {e}")
 
+        await preload_encodings((
+            config.OPENAI_MODEL, config.OPENAI_FILE_MODEL, config.OPENAI_FALLBACK_MODEL, config.OPENAI_BATCH_MODEL,
+        ))
+
+        if config.ANALYSIS_RESUME_ON_STARTUP:
+            try:
+                await ResumeAnalysisHandler(dp.bot).notify_interrupted()
+            except Exception as e:
+                logger.error(f"❌ Не удалось проверить прерванные анализы: {e}")
+
+        if config.METRICS_PORT:
+            try:
+                dp['metrics_runner'] = await start_metrics_server(config.METRICS_PORT)
+            except Exception as e:
+                logger.error(f"❌ Не удалось запустить эндпоинт метрик: {e}")
+
+    async def on_shutdown(dp):
+        """Освобождение ресурсов при остановке бота"""
+        metrics_runner = dp.get('metrics_runner')
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await OpenAIClientRegistry().close()
+        ReportRenderer().close()
+
     config = Config()
     bot = Bot(token=config.TOKEN)
     dp = Dispatcher(bot, storage=MemoryStorage())
@@ -2949,4 +3529,4 @@ if __name__ == '__main__':
     BotManager(bot, dp)
 
     # Запуск с инициализацией авторизации
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -3,6 +3,8 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Dict, List, Literal, Optional
 
+from token_budget import TokenBudget
+
 logger = logging.getLogger('bot')
 
 
@@ -157,8 +159,12 @@ class ChatContextManager:
         topic: str,
         limit: int = 3,
         skip_system_prompt: bool = False,
+        model: Optional[str] = None,
     ) -> List[dict]:
-        """Возвращает ограниченное количество последних сообщений для API, сохраняя системный промпт."""
+        """Возвращает ограниченное количество последних сообщений для API, сохраняя системный промпт.
+
+        Если указана модель, история дополнительно подгоняется под ее контекстное окно.
+        """
         chat_history = self.get_chat_history(user_id, topic)
         if not chat_history:
             logger.warning(f"Нет сообщений для API: пользователь {user_id}, тема '{topic}'")
@@ -183,6 +189,8 @@ class ChatContextManager:
             user_messages = user_messages[-1:] if user_messages else []
 
         result = system_prompts + user_messages
+        if model:
+            result = TokenBudget(model).fit_messages(result)
         
         total_size = sum(len(msg['content']) for msg in result)
         logger.info(
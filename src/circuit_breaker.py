@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+import openai
+
+from config import Config
+from llm_metrics import error_class
+
+logger = logging.getLogger('bot')
+config = Config()
+
+T = TypeVar('T')
+
+
+class CircuitState(Enum):
+    CLOSED = 'closed'  # модель работает штатно
+    OPEN = 'open'  # модель отключена, запросы идут в резервную модель
+    HALF_OPEN = 'half_open'  # пробный запрос после паузы
+
+
+class CircuitOpenError(RuntimeError):
+    """Модель временно отключена автоматом, а резервной модели нет."""
+
+
+def is_model_failure(error: BaseException) -> bool:
+    """Ошибка говорит о сбое модели (5xx, таймаут, обрыв соединения), а не о неверном запросе.
+
+    Стратегии оборачивают ошибки SDK в ValueError, поэтому проверяется вся цепочка причин.
+    Ошибки клиента (4xx: слишком длинный запрос, авторизация, лимиты) автомат не учитывает.
+    """
+    while error is not None:
+        if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError, httpx.TransportError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code >= 500
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class CircuitBreaker:
+    """Автомат для одной модели.
+
+    Ведет скользящий p95 задержки, хеджирует запросы в резервную модель, пока p95 нарушает SLO,
+    и размыкается после серии ошибок.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.slo = config.LLM_LATENCY_SLO
+        self.failure_threshold = config.LLM_CIRCUIT_FAILURE_THRESHOLD
+        self.open_timeout = config.LLM_CIRCUIT_OPEN_TIMEOUT
+        self.min_samples = config.LLM_LATENCY_MIN_SAMPLES
+        self.state = CircuitState.CLOSED
+        self._latencies: Deque[float] = deque(maxlen=config.LLM_LATENCY_WINDOW)
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.successes = 0
+        self.failures = 0
+        self.trips = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+        self.client_errors = 0
+
+    def p95(self) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(math.ceil(len(ordered) * 0.95) - 1, len(ordered) - 1)]
+
+    @property
+    def degraded(self) -> bool:
+        """Скользящий p95 задержки вышел за SLO."""
+        p95 = self.p95()
+        return p95 is not None and len(self._latencies) >= self.min_samples and p95 > self.slo
+
+    def allow_request(self) -> bool:
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self._opened_at < self.open_timeout:
+                return False
+            self.state = CircuitState.HALF_OPEN
+            logger.info(f'[CircuitBreaker {self.name}] Пробный запрос после паузы')
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    @property
+    def trial_in_flight(self) -> bool:
+        """Выполняется пробный запрос: его результат решает, замкнуть автомат или снова разомкнуть."""
+        return self.state == CircuitState.HALF_OPEN and self._trial_in_flight
+
+    def release_trial(self) -> None:
+        """Снимает пробный запрос без учета результата (запрос отменен или отклонен как ошибка клиента)."""
+        self._trial_in_flight = False
+
+    def record_error(self, error: BaseException, latency: Optional[float], trial: bool = False) -> None:
+        """Учитывает ошибку запроса: сбой модели — как отказ, ошибку клиента — только в статистике.
+
+        trial — запрос был пробным; после ошибки клиента пробным станет следующий запрос.
+        """
+        if is_model_failure(error):
+            self.record_failure(latency, reason=error_class(error))
+            return
+        self.client_errors += 1
+        if trial:
+            self.release_trial()
+
+    def record_success(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self.successes += 1
+        self._consecutive_failures = 0
+        self._trial_in_flight = False
+        if self.state != CircuitState.CLOSED:
+            logger.info(f'[CircuitBreaker {self.name}] Модель восстановилась, автомат замкнут')
+            self.state = CircuitState.CLOSED
+
+    def record_failure(self, latency: Optional[float] = None, reason: str = '') -> None:
+        if latency is not None:
+            self._latencies.append(latency)
+        self.failures += 1
+        self._consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == CircuitState.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self.state != CircuitState.OPEN:
+                self.trips += 1
+                logger.warning(
+                    f'[CircuitBreaker {self.name}] Автомат разомкнут на {self.open_timeout:.0f}с '
+                    f'(ошибок подряд: {self._consecutive_failures}, причина: {reason or "нет данных"})',
+                )
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+    async def call(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        fallback: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        """Выполняет запрос к модели и возвращает первый успешный ответ.
+
+        Пока скользящий p95 нарушает SLO, запрос дольше SLO дублируется в резервную модель;
+        в штатном режиме основная модель ожидается до ее собственного таймаута.
+        """
+        if not self.allow_request():
+            if fallback is None:
+                raise CircuitOpenError(f'Модель {self.name} временно недоступна, попробуйте позже')
+            self.short_circuited += 1
+            logger.info(f'[CircuitBreaker {self.name}] Автомат разомкнут, запрос направлен в резервную модель')
+            return await fallback()
+
+        trial = self.trial_in_flight
+        started_at = time.monotonic()
+        primary_task = asyncio.ensure_future(primary())
+        hedge_after = self.slo if fallback is not None and self.degraded else None
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=hedge_after)
+        except asyncio.CancelledError:
+            primary_task.cancel()
+            if trial:
+                self.release_trial()
+            raise
+        if done:
+            try:
+                result = primary_task.result()
+            except Exception as e:
+                self.record_error(e, time.monotonic() - started_at, trial)
+                # на ошибку клиента резервная модель ответит так же, поэтому повторять запрос в ней незачем
+                if fallback is None or not is_model_failure(e):
+                    raise
+                logger.warning(f'[CircuitBreaker {self.name}] Ошибка основной модели, запрос в резервную: {e}')
+                return await fallback()
+            self.record_success(time.monotonic() - started_at)
+            return result
+
+        return await self._hedge(primary_task, fallback, started_at, trial)
+
+    async def _hedge(
+        self,
+        primary_task: asyncio.Future,
+        fallback: Callable[[], Awaitable[T]],
+        started_at: float,
+        trial: bool = False,
+    ) -> T:
+        self.hedged += 1
+        logger.info(
+            f'[CircuitBreaker {self.name}] p95 выше SLO, ответ дольше {self.slo:.0f}с, '
+            f'отправляем хеджирующий запрос в резервную модель',
+        )
+        fallback_task = asyncio.ensure_future(fallback())
+        pending = {primary_task, fallback_task}
+        errors = []
+        settled = False  # результат основной модели уже учтен автоматом
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # при одновременном завершении первым учитывается ответ основной модели
+                for task in sorted(done, key=lambda t: t is not primary_task):
+                    latency = time.monotonic() - started_at
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        if task is primary_task:
+                            self.record_error(task.exception(), latency, trial)
+                            settled = True
+                            # на ошибку клиента резервная модель ответит так же: ее ответ не возвращаем
+                            if not is_model_failure(task.exception()):
+                                raise task.exception()
+                        continue
+                    if task is primary_task:
+                        self.record_success(latency)
+                    else:
+                        self.hedge_wins += 1
+                        if not primary_task.done():
+                            # основная модель не уложилась в SLO — считаем это сбоем
+                            self.record_failure(latency, reason='SLO')
+                    settled = True
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if trial and not settled:
+                # запрос отменен до ответа основной модели: пробный запрос не должен зависнуть навсегда
+                self.release_trial()
+        raise errors[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            'state': self.state.value,
+            'p95': round(p95, 2) if p95 is not None else None,
+            'degraded': self.degraded,
+            'samples': len(self._latencies),
+            'successes': self.successes,
+            'failures': self.failures,
+            'trips': self.trips,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'short_circuited': self.short_circuited,
+            'client_errors': self.client_errors,
+        }
+
+
+class CircuitBreakerRegistry:
+    """Реестр автоматов: один автомат на модель на весь процесс (Singleton)."""
+
+    _instance = None
+
+    def __new__(cls) -> 'CircuitBreakerRegistry':
+        if cls._instance is None:
+            logger.info('Создание экземпляра CircuitBreakerRegistry (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._breakers = {}
+        return cls._instance
+
+    def get(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(model)
+            self._breakers[model] = breaker
+        return breaker
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.get_stats() for name, breaker in self._breakers.items()}
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """Возвращает общий автомат для модели."""
+    return CircuitBreakerRegistry().get(model)
@@ -1,5 +1,5 @@
 import os
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set
 from dotenv import dotenv_values, load_dotenv
 
 config = {
@@ -69,6 +69,128 @@ class Config:
     OPENAI_MAX_TOKENS = os.getenv('OPENAI_MAX_TOKENS', 1000)
     OPENAI_MAX_TOKENS_DETAIL = os.getenv('OPENAI_MAX_TOKENS_DETAIL', 3000)
     OPENAI_FILE_MODEL = os.getenv('OPENAI_FILE_MODEL', 'gpt-4o')
+
+    # Лимиты OpenAI по умолчанию (уточняются по заголовкам x-ratelimit-* ответов)
+    OPENAI_DEFAULT_RPM = int(os.getenv('OPENAI_DEFAULT_RPM', 500))
+    OPENAI_DEFAULT_TPM = int(os.getenv('OPENAI_DEFAULT_TPM', 30000))
+    OPENAI_RATE_LIMIT_HEADROOM = float(os.getenv('OPENAI_RATE_LIMIT_HEADROOM', 0.95))
+
+    # Планировщик запросов к моделям
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+
+    @property
+    def LLM_USER_WEIGHTS(self) -> Dict[int, float]:
+        """Веса пользователей в справедливой очереди, формат: `id:вес,id:вес`."""
+        weights = {}
+        for item in os.getenv('LLM_USER_WEIGHTS', '').split(','):
+            if ':' in item:
+                user_id, weight = item.split(':', 1)
+                weights[int(user_id.strip())] = float(weight)
+        return weights
+
+    # Адрес OpenAI-совместимого API (например, локального mock_llm_server.py для нагрузочных тестов)
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+    # Пул HTTP-соединений клиента OpenAI
+    OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 20))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 60))
+    OPENAI_HTTP2 = os.getenv('OPENAI_HTTP2', '1') == '1'
+    OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 600))
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 10))
+
+    # Потоковая выдача ответов в Telegram
+    STREAMING_ENABLED = os.getenv('STREAMING_ENABLED', '1') == '1'
+    STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', 1.5))
+
+    # Автомат отключения деградировавшей модели и хеджирование в резервную модель
+    OPENAI_FALLBACK_MODEL = os.getenv('OPENAI_FALLBACK_MODEL', '')
+    LLM_LATENCY_SLO = float(os.getenv('LLM_LATENCY_SLO', 45))
+    LLM_LATENCY_WINDOW = int(os.getenv('LLM_LATENCY_WINDOW', 100))
+    LLM_LATENCY_MIN_SAMPLES = int(os.getenv('LLM_LATENCY_MIN_SAMPLES', 20))
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', 5))
+    LLM_CIRCUIT_OPEN_TIMEOUT = float(os.getenv('LLM_CIRCUIT_OPEN_TIMEOUT', 60))
+
+    # Бюджет токенов: запрос подгоняется под контекстное окно модели до отправки
+    LLM_CONTEXT_WINDOW = int(os.getenv('LLM_CONTEXT_WINDOW', 0))  # 0 — по таблице моделей
+    LLM_DEFAULT_CONTEXT_WINDOW = int(os.getenv('LLM_DEFAULT_CONTEXT_WINDOW', 16385))
+    TOKEN_BUDGET_MARGIN = float(os.getenv('TOKEN_BUDGET_MARGIN', 0.05))
+    TOKEN_BUDGET_FILE_SHARE = float(os.getenv('TOKEN_BUDGET_FILE_SHARE', 0.5))
+
+    # Пакетный (офлайн) анализ через OpenAI Batch API
+    OPENAI_BATCH_MODEL = os.getenv('OPENAI_BATCH_MODEL', OPENAI_MODEL)
+    OPENAI_BATCH_BASE_URL = os.getenv('OPENAI_BATCH_BASE_URL') or None
+    BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', 60))
+    BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 50000))
+    BATCH_COMPLETION_WINDOW = os.getenv('BATCH_COMPLETION_WINDOW', '24h')
+    # Максимальное ожидание завершения batch, с: окно выполнения и запас на смену статуса
+    BATCH_MAX_WAIT = float(os.getenv('BATCH_MAX_WAIT', 25 * 60 * 60))
+
+    # Экспорт метрик обращений к моделям в формате Prometheus (0 — HTTP-эндпоинт отключен)
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+    # Локальные хранилища (кеши, SQLite-базы)
+    DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+    # Кеш ответов моделей
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', '1') == '1'
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 60 * 60 * 24))
+    RESPONSE_CACHE_MEMORY_ITEMS = int(os.getenv('RESPONSE_CACHE_MEMORY_ITEMS', 256))
+    RESPONSE_CACHE_DISK_ITEMS = int(os.getenv('RESPONSE_CACHE_DISK_ITEMS', 5000))
+    RESPONSE_CACHE_DB_PATH = os.getenv('RESPONSE_CACHE_DB_PATH', os.path.join(DATA_DIR, 'response_cache.sqlite3'))
+
+    # Граф этапов инвестиционного анализа: зависимости вида 'rivals:market;synergy:market,rivals'
+    # (пустое значение — зависимости по умолчанию: синергия ждет рынок и конкурентов) и таймауты этапов в секундах
+    ANALYSIS_STAGE_DEPENDENCIES = os.getenv('ANALYSIS_STAGE_DEPENDENCIES', '')
+    ANALYSIS_STAGE_TIMEOUT = float(os.getenv('ANALYSIS_STAGE_TIMEOUT', 300))
+    ANALYSIS_STAGE_TIMEOUTS = os.getenv('ANALYSIS_STAGE_TIMEOUTS', '')
+
+    # Выжимка из прикрепленного к анализу файла: строится один раз и используется всеми этапами, summary и Q&A.
+    # Файлы до FILE_DIGEST_RAW_TOKENS токенов передаются как есть, большие суммаризируются частями
+    FILE_DIGEST_RAW_TOKENS = int(os.getenv('FILE_DIGEST_RAW_TOKENS', 3000))
+    FILE_DIGEST_CHUNK_TOKENS = int(os.getenv('FILE_DIGEST_CHUNK_TOKENS', 8000))
+    FILE_DIGEST_MAX_TOKENS = int(os.getenv('FILE_DIGEST_MAX_TOKENS', 6000))
+    FILE_DIGEST_CACHE_ITEMS = int(os.getenv('FILE_DIGEST_CACHE_ITEMS', 100))
+    FILE_DIGEST_CACHE_TTL = int(os.getenv('FILE_DIGEST_CACHE_TTL', 60 * 60 * 24))
+
+    # Сжатый контекст этапов: выдержка из файла и результатов предыдущих этапов в пределах бюджета токенов.
+    # ANALYSIS_CONTEXT_TOKENS — бюджет этапов с зависимостями, ANALYSIS_CONTEXT_STAGE_TOKENS — бюджеты отдельных
+    # этапов вида 'rivals:1500;synergy:4000' (0 — контекст передается целиком)
+    ANALYSIS_CONTEXT_TOKENS = int(os.getenv('ANALYSIS_CONTEXT_TOKENS', 3000))
+    ANALYSIS_CONTEXT_STAGE_TOKENS = os.getenv('ANALYSIS_CONTEXT_STAGE_TOKENS', '')
+
+    # Контрольные точки анализов: результаты этапов переживают сбой и перезапуск бота
+    ANALYSIS_CHECKPOINT_DB_PATH = os.getenv(
+        'ANALYSIS_CHECKPOINT_DB_PATH', os.path.join(DATA_DIR, 'analysis_checkpoints.sqlite3'),
+    )
+    ANALYSIS_CHECKPOINT_TTL = int(os.getenv('ANALYSIS_CHECKPOINT_TTL', 60 * 60 * 24 * 7))
+    ANALYSIS_RESUME_ON_STARTUP = os.getenv('ANALYSIS_RESUME_ON_STARTUP', '1') == '1'
+
+    # Общее хранилище завершенных анализов компаний: повторный запрос той же компании отдается без нового анализа
+    ANALYSIS_STORE_ENABLED = os.getenv('ANALYSIS_STORE_ENABLED', '1') == '1'
+    ANALYSIS_STORE_DB_PATH = os.getenv('ANALYSIS_STORE_DB_PATH', os.path.join(DATA_DIR, 'company_analyses.sqlite3'))
+    ANALYSIS_STORE_TTL = int(os.getenv('ANALYSIS_STORE_TTL', 60 * 60 * 24 * 3))  # срок свежести анализа, секунды
+
+    # Формирование DOCX отчетов в пуле процессов: число процессов и таймаут одного отчета в секундах
+    REPORT_RENDER_WORKERS = int(os.getenv('REPORT_RENDER_WORKERS', 2))
+    REPORT_RENDER_TIMEOUT = float(os.getenv('REPORT_RENDER_TIMEOUT', 60))
+    REPORT_TEMPLATE_PATH = os.getenv('REPORT_TEMPLATE_PATH', '')  # DOCX со стилями отчета; пусто — стандартный
+
+    # Портфельный анализ (/portfolio): сколько компаний анализируется одновременно и предел размера списка
+    PORTFOLIO_CONCURRENCY = int(os.getenv('PORTFOLIO_CONCURRENCY', 4))
+    PORTFOLIO_MAX_COMPANIES = int(os.getenv('PORTFOLIO_MAX_COMPANIES', 50))
+
+    # Кеш готовых финальных отчетов (ключ — результаты анализа и число вопросов-ответов)
+    REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', os.path.join(DATA_DIR, 'report_cache'))
+    REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', 200))
+    REPORT_CACHE_TTL = int(os.getenv('REPORT_CACHE_TTL', 60 * 60 * 24))
+
+    # Кеш результатов по похожим запросам (разные формулировки одного и того же анализа)
+    SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', '1') == '1'
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8))
+    SEMANTIC_CACHE_TTL = int(os.getenv('SEMANTIC_CACHE_TTL', 60 * 60 * 24))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 1000))
     
     @property
     def VECTOR_STORE_ID(self) -> Optional[str]:
@@ -0,0 +1,117 @@
+import logging
+import math
+import re
+from typing import List, Sequence, Tuple
+
+from token_budget import TokenBudget
+
+logger = logging.getLogger('bot')
+
+# Раздел контекста этапа: (заголовок, текст)
+ContextSection = Tuple[str, str]
+
+NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+MEASURE = re.compile(r'%|₽|\$|€|млрд|млн|трлн|тыс\.|руб|долл|доля|выручк|ebitda|cagr|bn\b|mln\b', re.IGNORECASE)
+SENTENCE_END = re.compile(r'(?<=[.!?;])\s+')
+TABLE_SEPARATOR = re.compile(r'\|?[\s:|-]+\|?')
+EMPHASIS = re.compile(r'\*\*|__')
+# Основы слов, которыми в ответах моделей обычно начинаются выводы и оценки
+CONCLUSION_STEMS = (
+    'вывод', 'итог', 'рекоменд', 'риск', 'целесообраз', 'синерги', 'ключев', 'преимуществ', 'угроз',
+    'возможност', 'лидер', 'conclusion', 'recommend', 'risk',
+)
+
+MAX_UNIT_TOKENS = 80  # более длинные строки делятся на предложения
+MAX_COUNTED_NUMBERS = 6
+MAX_COUNTED_NAMES = 5
+
+
+def format_context(sections: Sequence[ContextSection]) -> str:
+    """Разделы контекста в том виде, в котором они добавляются в запрос этапа."""
+    return ''.join(f'\n\n{title}:\n{text}' for title, text in sections)
+
+
+class ContextCompactor:
+    """Извлекающее сжатие контекста этапа без обращения к модели.
+
+    Из результатов предыдущих этапов и файла отбираются строки и предложения с наибольшей плотностью
+    фактов — числа, названия игроков, выводы, — пока они помещаются в бюджет токенов. Порядок
+    отобранных фрагментов сохраняется, поэтому размер запроса этапа не зависит от объема
+    предыдущих ответов.
+    """
+
+    def __init__(self, budget: TokenBudget) -> None:
+        self.budget = budget  # считает токены той же кодировкой, что и модель этапа
+
+    def _units(self, text: str) -> List[str]:
+        """Строки текста; длинные абзацы делятся на предложения."""
+        units = []
+        for line in text.split('\n'):
+            line = EMPHASIS.sub('', line).strip()
+            if not line or (line.startswith('|') and TABLE_SEPARATOR.fullmatch(line)):
+                continue
+            if self.budget.count(line) > MAX_UNIT_TOKENS:
+                units.extend(sentence for sentence in SENTENCE_END.split(line) if sentence)
+            else:
+                units.append(line)
+        return list(dict.fromkeys(units))  # повторы одной и той же строки учитываются один раз
+
+    @staticmethod
+    def _score(unit: str, position: int, total: int) -> float:
+        words = unit.lstrip('#>-*+0123456789.) ').split()
+        names = {word for word in words[1:] if word[:1].isupper() or (word[:1].isascii() and word[:1].isalpha())}
+        lowered = unit.lower()
+        score = 3 * min(len(NUMBER.findall(unit)), MAX_COUNTED_NUMBERS) + 2 * min(len(names), MAX_COUNTED_NAMES)
+        if MEASURE.search(unit):
+            score += 2
+        if any(stem in lowered for stem in CONCLUSION_STEMS):
+            score += 4
+        if unit.startswith('#'):
+            score += 2  # заголовки дешевые и сохраняют структуру выдержки
+        elif unit.startswith(('-', '*', '+', '|')) or unit[:1].isdigit():
+            score += 1
+        if position == 0 or position >= total - 3:
+            score += 2  # вступление и заключительные выводы ответа
+        return score
+
+    def compact(self, text: str, max_tokens: int) -> str:
+        """Выдержка из текста не больше max_tokens; текст, который помещается целиком, не меняется."""
+        if self.budget.count(text) <= max_tokens:
+            return text
+        units = self._units(text)
+        costs = [self.budget.count(unit) + 1 for unit in units]  # +1 — перевод строки
+        ranked = sorted(
+            range(len(units)),
+            key=lambda i: (-self._score(units[i], i, len(units)) / math.sqrt(costs[i]), i),
+        )
+        selected, used = set(), 0
+        for index in ranked:
+            if used + costs[index] <= max_tokens:
+                selected.add(index)
+                used += costs[index]
+        digest = '\n'.join(units[i] for i in sorted(selected))
+        if self.budget.count(digest) > max_tokens:
+            digest = self.budget.truncate(digest, max_tokens)
+        return digest
+
+    def compact_sections(self, sections: Sequence[ContextSection], max_tokens: int) -> List[ContextSection]:
+        """Делит бюджет между разделами поровну; недоиспользованная доля коротких разделов достается длинным."""
+        sections = [(title, text) for title, text in sections if text]
+        overhead = sum(self.budget.count(f'\n\n{title}:\n') for title, _ in sections)
+        remaining = max(max_tokens - overhead, 0)
+        sizes = {index: self.budget.count(text) for index, (_, text) in enumerate(sections)}
+        if sum(sizes.values()) <= remaining:
+            return sections
+        shares = {}
+        # разделы короче своей доли берутся целиком, начиная с самого короткого
+        for position, index in enumerate(sorted(sizes, key=sizes.get)):
+            share = remaining // (len(sections) - position)
+            shares[index] = min(sizes[index], share)
+            remaining -= shares[index]
+
+        compacted = [(title, self.compact(text, shares[index])) for index, (title, text) in enumerate(sections)]
+        logger.info(
+            f'[ContextCompactor] Контекст этапа сжат: {sum(sizes.values())} -> '
+            f'{sum(self.budget.count(text) for _, text in compacted)} токенов (бюджет {max_tokens})',
+        )
+        return compacted
@@ -3,10 +3,9 @@ import logging
 import time
 from pathlib import Path
 
-from openai import AsyncOpenAI
-
 from config import Config
 from file_processor import ExcelExtractor
+from openai_clients import get_openai_client
 
 logger = logging.getLogger('bot')
 config = Config()
@@ -32,7 +31,7 @@ class ExcelFileManager:
 
     def __init__(self):
         if not hasattr(self, '_initialized'):
-            self.client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+            self.client = get_openai_client()
             self._initialized = True
 
     async def _create_vector_store(self) -> None:
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import Config
+from llm_scheduler import RequestPriority
+from models_api import ModelAPI
+from prompts import Models, SystemPrompt, SystemPrompts
+from token_budget import TokenBudget
+
+logger = logging.getLogger('bot')
+config = Config()
+
+
+class FileDigestCache:
+    """Выжимка из прикрепленного к анализу файла, общая для всех этапов, executive summary и Q&A (Singleton).
+
+    Выжимка строится один раз: файл делится на части, части суммаризируются параллельно.
+    Ключ — хеш текста файла и промпта суммаризации, поэтому повторная генерация и вопросы
+    по тому же файлу получают готовую выжимку.
+    """
+
+    _instance = None
+
+    def __new__(cls) -> 'FileDigestCache':
+        if cls._instance is None:
+            logger.info('Создание экземпляра FileDigestCache (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.max_entries = config.FILE_DIGEST_CACHE_ITEMS
+        self.ttl = config.FILE_DIGEST_CACHE_TTL
+        self._entries: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}  # сколько вызовов держат или ждут блокировку ключа
+        self.hits = 0
+        self.built = 0
+
+    @staticmethod
+    def make_key(file_content: str) -> str:
+        summary_prompt = SystemPrompts().get_prompt(SystemPrompt.FILE_SUMMARY)
+        payload = f'{summary_prompt}\0{file_content}'
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        """Готовая выжимка по ключу или None, если ее нет или истек срок хранения."""
+        entry = self._entries.get(key) if key else None
+        if entry is None:
+            return None
+        created_at, digest = entry
+        if time.time() - created_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return digest
+
+    def _store(self, key: str, digest: str) -> None:
+        self._entries[key] = (time.time(), digest)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_digest(
+        self,
+        file_content: str,
+        user_id: Optional[int] = None,
+        priority: RequestPriority = RequestPriority.ANALYSIS,
+        bypass_cache: bool = False,
+    ) -> Tuple[str, str]:
+        """Ключ и выжимка файла: из кеша или построенная заново (одновременные запросы строят ее один раз)."""
+        key = self.make_key(file_content)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                digest = None if bypass_cache else self.get(key)
+                if digest is not None:
+                    self.hits += 1
+                    logger.info(f'[FileDigestCache] Выжимка файла {key[:12]} из кеша')
+                    return key, digest
+                digest = await self._build(file_content, user_id, priority, bypass_cache)
+                self._store(key, digest)
+                self.built += 1
+                return key, digest
+        finally:
+            # locked() сбрасывается до того, как блокировку возьмет следующий ожидающий,
+            # поэтому блокировка удаляется только когда ее никто не держит и не ждет
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                del self._lock_users[key]
+                del self._locks[key]
+
+    async def _build(
+        self, file_content: str, user_id: Optional[int], priority: RequestPriority, bypass_cache: bool,
+    ) -> str:
+        strategy = Models.chatgpt_file.value()
+        budget = TokenBudget(strategy.model)
+        file_tokens = budget.count(file_content)
+        if file_tokens <= config.FILE_DIGEST_RAW_TOKENS:
+            return file_content  # небольшой файл передается как есть: суммаризация только потеряла бы детали
+
+        summary_prompt = SystemPrompts().get_prompt(SystemPrompt.FILE_SUMMARY)
+        model_api = ModelAPI(strategy, priority, user_id, call_site='file_summary')
+
+        async def summarize(text: str) -> str:
+            messages = [{'role': 'system', 'content': summary_prompt}, {'role': 'user', 'content': text}]
+            return await model_api.get_response(messages, bypass_cache=bypass_cache)
+
+        started_at = time.monotonic()
+        chunks = budget.split(file_content, config.FILE_DIGEST_CHUNK_TOKENS)
+        summaries = await asyncio.gather(*(summarize(chunk) for chunk in chunks), return_exceptions=True)
+        parts = []
+        for chunk, summary in zip(chunks, summaries):
+            if isinstance(summary, str) and summary:
+                parts.append(summary)
+            else:
+                logger.warning(f'[FileDigestCache] Часть файла не суммаризирована, берем ее начало и конец: {summary}')
+                parts.append(budget.truncate(chunk, config.FILE_DIGEST_MAX_TOKENS // len(chunks)))
+        # выжимки частей вместе могут превысить лимит: тогда они сжимаются еще раз
+        digest = await budget.fit_text('\n\n'.join(parts), config.FILE_DIGEST_MAX_TOKENS, summarize=summarize)
+        logger.info(
+            f'[FileDigestCache] Выжимка файла: {file_tokens} -> {budget.count(digest)} токенов, '
+            f'частей {len(chunks)}, время {time.monotonic() - started_at:.1f}с',
+        )
+        return digest
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'entries': len(self._entries), 'hits': self.hits, 'built': self.built}
@@ -0,0 +1,316 @@
+import bisect
+import contextvars
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from openai.types import CompletionUsage
+from openai.types.responses import ResponseUsage
+
+from config import Config
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger('bot')
+config = Config()
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+CollectedSeries = Dict[str, Tuple[str, Dict[Labels, float]]]  # имя метрики -> (описание, значения по меткам)
+
+_current_call: contextvars.ContextVar[Optional['CallRecord']] = contextvars.ContextVar('llm_call', default=None)
+
+
+@dataclass
+class CallRecord:
+    """Метрики одного обращения к модели; стратегии дополняют его по ходу запроса."""
+
+    call_site: str
+    model: str
+    started_at: float = field(default_factory=time.monotonic)
+    outcome: str = 'upstream'  # upstream / cache_hit / coalesced / error
+    queue_wait: float = 0.0
+    limiter_wait: float = 0.0
+    latency: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    retries: int = 0
+    error: Optional[str] = None
+
+    def add_usage(self, usage: Union[CompletionUsage, ResponseUsage, None]) -> None:
+        """Учитывает usage ответа OpenAI (Chat Completions или Responses API)."""
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, 'prompt_tokens', None) or getattr(usage, 'input_tokens', None) or 0
+        self.completion_tokens += (
+            getattr(usage, 'completion_tokens', None) or getattr(usage, 'output_tokens', None) or 0
+        )
+        details = getattr(usage, 'prompt_tokens_details', None) or getattr(usage, 'input_tokens_details', None)
+        self.cached_tokens += getattr(details, 'cached_tokens', None) or 0
+
+
+def current_call() -> Optional[CallRecord]:
+    """Возвращает запись текущего обращения к модели (если вызов идет через ModelAPI)."""
+    return _current_call.get()
+
+
+def start_call(call_site: str, model: str) -> Tuple[CallRecord, contextvars.Token]:
+    """Начинает запись обращения к модели и делает ее текущей для стратегий; завершается finish_call."""
+    record = CallRecord(call_site=call_site, model=model)
+    return record, _current_call.set(record)
+
+
+def finish_call(record: CallRecord, token: contextvars.Token) -> None:
+    """Снимает запись с текущего контекста и добавляет ее в агрегированные метрики."""
+    try:
+        _current_call.reset(token)
+    except ValueError:  # потоковый генератор закрыт из другого контекста
+        pass
+    LLMMetrics().observe(record)
+
+
+def _escape_label_value(value: object) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def error_class(error: BaseException) -> str:
+    """Имя класса исходной ошибки: стратегии оборачивают ошибки SDK в ValueError."""
+    while error.__cause__ is not None or error.__context__ is not None:
+        error = error.__cause__ or error.__context__
+    return error.__class__.__name__
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus (кумулятивные корзины, сумма и количество)."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины."""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+
+class LLMMetrics:
+    """Агрегатор метрик обращений к моделям в памяти процесса с экспортом в формате Prometheus (Singleton)."""
+
+    _instance = None
+
+    def __new__(cls) -> 'LLMMetrics':
+        if cls._instance is None:
+            logger.info('Создание экземпляра LLMMetrics (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def _inc(self, name: str, help_text: str, labels: Dict[str, str], value: float = 1) -> None:
+        self._help.setdefault(name, help_text)
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def _observe(
+        self, name: str, help_text: str, labels: Dict[str, str], value: float, buckets: Sequence[float],
+    ) -> None:
+        self._help.setdefault(name, help_text)
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = Histogram(buckets)
+        series[key].observe(value)
+
+    def observe(self, record: CallRecord) -> None:
+        site = {'call_site': record.call_site}
+        site_model = {'call_site': record.call_site, 'model': record.model}
+
+        self._inc('llm_requests_total', 'Обращения к моделям по результату', {**site_model, 'outcome': record.outcome})
+        if record.outcome in ('cache_hit', 'coalesced'):
+            return
+
+        self._observe(
+            'llm_queue_wait_seconds', 'Ожидание в очереди планировщика', site, record.queue_wait, WAIT_BUCKETS,
+        )
+        self._observe(
+            'llm_limiter_wait_seconds', 'Ожидание бюджета RPM/TPM', site, record.limiter_wait, WAIT_BUCKETS,
+        )
+        if record.latency is not None:
+            self._observe(
+                'llm_upstream_latency_seconds', 'Задержка ответа модели', site_model, record.latency, LATENCY_BUCKETS,
+            )
+            if record.prompt_tokens:
+                # сравнение задержки запросов с закешированным префиксом промпта и без него
+                self._observe(
+                    'llm_prompt_cache_latency_seconds',
+                    'Задержка ответа модели в зависимости от кеша префикса промпта',
+                    {**site, 'prompt_cache': 'hit' if record.cached_tokens else 'miss'},
+                    record.latency,
+                    LATENCY_BUCKETS,
+                )
+        for kind, value in (
+            ('prompt', record.prompt_tokens),
+            ('completion', record.completion_tokens),
+            ('cached', record.cached_tokens),
+        ):
+            if value:
+                self._inc('llm_tokens_total', 'Токены по видам', {**site_model, 'kind': kind}, value)
+        if record.retries:
+            self._inc('llm_retries_total', 'Повторы запросов к модели', site_model, record.retries)
+        if record.error:
+            self._inc('llm_errors_total', 'Ошибки обращений к модели', {**site_model, 'error': record.error})
+
+        logger.info(
+            f'[LLMMetrics] {record.call_site} {record.model}: {record.outcome}, очередь {record.queue_wait:.2f}с, '
+            f'лимитер {record.limiter_wait:.2f}с, ответ {record.latency or 0:.2f}с, '
+            f'токены {record.prompt_tokens}/{record.completion_tokens} (кеш {record.cached_tokens}), '
+            f'повторов {record.retries}'
+            f'{", ошибка " + record.error if record.error else ""}',
+        )
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Краткая сводка по местам вызова: число запросов, p50/p95 задержки, токены и доля кешированных."""
+        sites: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for labels, value in self._counters.get('llm_requests_total', {}).items():
+            labels = dict(labels)
+            item = sites.setdefault((labels['call_site'], labels['model']), {'requests': 0, 'errors': 0})
+            item['requests'] += value
+            if labels['outcome'] == 'error':
+                item['errors'] += value
+        for labels, histogram in self._histograms.get('llm_upstream_latency_seconds', {}).items():
+            labels = dict(labels)
+            item = sites.setdefault((labels['call_site'], labels['model']), {'requests': 0, 'errors': 0})
+            item['p50'] = histogram.quantile(0.5)
+            item['p95'] = histogram.quantile(0.95)
+        for labels, value in self._counters.get('llm_tokens_total', {}).items():
+            labels = dict(labels)
+            item = sites.setdefault((labels['call_site'], labels['model']), {'requests': 0, 'errors': 0})
+            item[f'{labels["kind"]}_tokens'] = int(value)
+        for item in sites.values():
+            if item.get('prompt_tokens'):
+                item['cached_share'] = item.get('cached_tokens', 0) / item['prompt_tokens']
+        return [{'call_site': site, 'model': model, **item} for (site, model), item in sorted(sites.items())]
+
+    def prompt_cache_summary(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Задержка ответа по местам вызова отдельно для запросов с кешем префикса промпта и без него."""
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for labels, histogram in self._histograms.get('llm_prompt_cache_latency_seconds', {}).items():
+            labels = dict(labels)
+            result.setdefault(labels['call_site'], {})[labels['prompt_cache']] = {
+                'requests': histogram.count,
+                'avg': histogram.sum / histogram.count,
+                'p50': histogram.quantile(0.5),
+            }
+        return result
+
+    @staticmethod
+    def _format_labels(labels: Labels, extra: Optional[Dict[str, str]] = None) -> str:
+        items = list(labels) + list((extra or {}).items())
+        if not items:
+            return ''
+        return '{' + ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in items) + '}'
+
+    def _collected(self) -> Tuple[CollectedSeries, CollectedSeries]:
+        """Счетчики кеша ответов и текущее состояние кеша, планировщика и пула формирования отчетов."""
+        from llm_scheduler import LLMScheduler
+        from report_renderer import ReportRenderer
+        from response_cache import ResponseCache
+
+        cache_stats = ResponseCache().get_stats()
+        counters = {
+            f'llm_response_cache_{name}_total': ('Кеш ответов моделей', {(): float(cache_stats[name])})
+            for name in ('memory_hits', 'disk_hits', 'misses', 'bypassed', 'stores', 'evictions')
+        }
+        gauges = {
+            'llm_response_cache_memory_items': (
+                'Записей в памяти кеша ответов моделей', {(): float(cache_stats['memory_items'])},
+            ),
+            # число записей на диске ведется в памяти: опрос /metrics не обращается к SQLite
+            'llm_response_cache_disk_items': (
+                'Записей в дисковом кеше ответов моделей', {(): float(cache_stats['disk_items'])},
+            ),
+        }
+        scheduler_stats = LLMScheduler().get_stats()
+        gauges['llm_scheduler_queue_depth'] = (
+            'Глубина очереди планировщика',
+            {
+                (('priority', name),): float(stats['queue_depth'])
+                for name, stats in scheduler_stats.items()
+                if 'queue_depth' in stats
+            },
+        )
+        gauges['llm_scheduler_in_flight'] = (
+            'Запросов к моделям в работе',
+            {(): float(scheduler_stats['active']['in_flight'])},
+        )
+        render_stats = ReportRenderer().get_stats()
+        gauges['report_render_queue_depth'] = (
+            'Отчетов в очереди на формирование',
+            {(): float(render_stats['queue_depth'])},
+        )
+        gauges['report_render_in_flight'] = ('Отчетов формируется', {(): float(render_stats['in_flight'])})
+        return counters, gauges
+
+    def render_prometheus(self) -> str:
+        """Экспорт всех метрик в текстовом формате Prometheus."""
+        collected_counters, gauges = self._collected()
+        counters = {name: (self._help[name], series) for name, series in self._counters.items()}
+        counters.update(collected_counters)
+        lines = []
+        for name, (help_text, series) in sorted(counters.items()):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{self._format_labels(labels)} {value:g}' for labels, value in sorted(series.items())]
+        for name, series in sorted(self._histograms.items()):
+            lines += [f'# HELP {name} {self._help[name]}', f'# TYPE {name} histogram']
+            for labels, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{self._format_labels(labels, {"le": f"{bound:g}"})} {cumulative}')
+                lines.append(f'{name}_bucket{self._format_labels(labels, {"le": "+Inf"})} {histogram.count}')
+                lines.append(f'{name}_sum{self._format_labels(labels)} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{self._format_labels(labels)} {histogram.count}')
+        for name, (help_text, series) in sorted(gauges.items()):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            lines += [f'{name}{self._format_labels(labels)} {value:g}' for labels, value in sorted(series.items())]
+        return '\n'.join(lines) + '\n'
+
+
+async def start_metrics_server(port: int) -> 'web.AppRunner':
+    """Поднимает HTTP-эндпоинт /metrics для Prometheus; возвращает runner для остановки."""
+    from aiohttp import web
+
+    async def metrics_handler(_request: web.Request) -> web.Response:
+        return web.Response(text=LLMMetrics().render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, config.METRICS_HOST, port).start()
+    logger.info(f'Метрики моделей доступны на http://{config.METRICS_HOST}:{port}/metrics')
+    return runner
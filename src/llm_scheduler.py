@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger('bot')
+config = Config()
+
+
+class RequestPriority(IntEnum):
+    """Классы приоритета запросов к моделям (меньше — важнее)."""
+
+    INTERACTIVE = 0  # вопросы-ответы по готовому анализу
+    ANALYSIS = 1  # первичный анализ по запросу пользователя
+    BACKGROUND = 2  # повторная генерация, executive summary, суммаризация файлов
+    BATCH = 3  # пакетная обработка
+
+
+@dataclass(order=True)
+class _Ticket:
+    finish_tag: float
+    seq: int
+    user_id: Any = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class _ClassStats:
+    dispatched: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def add(self, wait: float) -> None:
+        self.dispatched += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+
+class LLMScheduler:
+    """Планировщик запросов к моделям (Singleton).
+
+    Между классами приоритета действует строгий приоритет, между пользователями внутри
+    класса — взвешенная справедливая очередь (WFQ).
+    Ограничивает число одновременных запросов к моделям; пока все слоты заняты,
+    запросы ждут в очереди своего класса.
+    """
+
+    _instance = None
+
+    def __new__(cls) -> 'LLMScheduler':
+        if cls._instance is None:
+            logger.info('Создание экземпляра LLMScheduler (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.max_concurrency = config.LLM_MAX_CONCURRENCY
+        self._user_weights = config.LLM_USER_WEIGHTS
+        self._active = 0
+        self._seq = itertools.count()
+        self._queues: Dict[RequestPriority, List[_Ticket]] = {priority: [] for priority in RequestPriority}
+        self._virtual_time: Dict[RequestPriority, float] = {priority: 0.0 for priority in RequestPriority}
+        self._last_finish: Dict[RequestPriority, Dict[Any, float]] = {priority: {} for priority in RequestPriority}
+        self._queued: Dict[RequestPriority, Dict[Any, int]] = {priority: {} for priority in RequestPriority}
+        self._stats: Dict[RequestPriority, _ClassStats] = {priority: _ClassStats() for priority in RequestPriority}
+        logger.info(f'Инициализирован планировщик запросов к моделям (слотов: {self.max_concurrency})')
+
+    def _has_waiters(self) -> bool:
+        return any(self._queues.values())
+
+    def _enqueue(self, priority: RequestPriority, user_id: Optional[int], cost: float) -> _Ticket:
+        weight = self._user_weights.get(user_id, 1.0)
+        start_tag = max(self._virtual_time[priority], self._last_finish[priority].get(user_id, 0.0))
+        finish_tag = start_tag + cost / weight
+        self._last_finish[priority][user_id] = finish_tag
+        ticket = _Ticket(
+            finish_tag=finish_tag,
+            seq=next(self._seq),
+            user_id=user_id,
+            enqueued_at=time.monotonic(),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._queues[priority], ticket)
+        self._queued[priority][user_id] = self._queued[priority].get(user_id, 0) + 1
+        return ticket
+
+    def _pop(self, priority: RequestPriority) -> _Ticket:
+        ticket = heapq.heappop(self._queues[priority])
+        queued = self._queued[priority]
+        queued[ticket.user_id] -= 1
+        if not queued[ticket.user_id]:
+            del queued[ticket.user_id]
+        return ticket
+
+    def _prune_finish_tags(self, priority: RequestPriority) -> None:
+        """Забывает теги пользователей без ожидающих запросов, которые уже догнало виртуальное время.
+
+        Для такого пользователя следующий запрос и так начнется с виртуального времени,
+        поэтому удаление тега не меняет порядок обслуживания.
+        """
+        virtual_time = self._virtual_time[priority]
+        last_finish = self._last_finish[priority]
+        queued = self._queued[priority]
+        for user_id in [user_id for user_id, tag in last_finish.items() if tag <= virtual_time]:
+            if user_id not in queued:
+                del last_finish[user_id]
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency:
+            for priority in RequestPriority:
+                queue = self._queues[priority]
+                while queue and queue[0].future.done():  # отмененные ожидающие
+                    self._pop(priority)
+                if queue:
+                    ticket = self._pop(priority)
+                    self._virtual_time[priority] = ticket.finish_tag
+                    self._prune_finish_tags(priority)
+                    self._active += 1
+                    ticket.future.set_result(None)
+                    break
+            else:
+                return
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: RequestPriority = RequestPriority.ANALYSIS,
+        user_id: Optional[int] = None,
+        cost: float = 1.0,
+    ) -> AsyncIterator[float]:
+        """Занимает слот для запроса к модели; отдает время ожидания в очереди в секундах."""
+        started_at = time.monotonic()
+        if self._active < self.max_concurrency and not self._has_waiters():
+            self._active += 1
+            wait = 0.0
+        else:
+            ticket = self._enqueue(priority, user_id, max(cost, 1.0))
+            try:
+                await ticket.future
+            except asyncio.CancelledError:
+                if ticket.future.done() and not ticket.future.cancelled():
+                    # слот уже был выдан — возвращаем его
+                    self._active -= 1
+                    self._dispatch()
+                raise
+            wait = time.monotonic() - started_at
+            logger.debug(f'[LLMScheduler] {priority.name} user={user_id}: ожидание в очереди {wait:.2f}с')
+        self._stats[priority].add(wait)
+
+        try:
+            yield wait
+        finally:
+            self._active -= 1
+            self._dispatch()
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Глубина очереди и время ожидания по классам приоритета."""
+        stats = {}
+        for priority in RequestPriority:
+            class_stats = self._stats[priority]
+            depth = sum(1 for ticket in self._queues[priority] if not ticket.future.done())
+            dispatched = class_stats.dispatched
+            stats[priority.name] = {
+                'queue_depth': depth,
+                'dispatched': dispatched,
+                'avg_wait': round(class_stats.total_wait / dispatched, 3) if dispatched else 0.0,
+                'max_wait': round(class_stats.max_wait, 3),
+            }
+        stats['active'] = {'in_flight': self._active, 'max_concurrency': self.max_concurrency}
+        return stats
@@ -0,0 +1,97 @@
+"""Нагрузочный прогон инвестиционного анализа против OpenAI-совместимого API (обычно mock_llm_server.py).
+
+Пример запуска:
+    python mock_llm_server.py --port 8080 --rate-429 0.05 &
+    OPENAI_BASE_URL=http://127.0.0.1:8080/v1 python load_test.py --companies 50 --concurrency 10 --users 5
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from typing import List
+
+from bot import InvestmentAnalysisProcessor
+from config import Config
+from llm_metrics import LLMMetrics
+from llm_scheduler import LLMScheduler
+from logger import Logger
+from openai_clients import OpenAIClientRegistry
+from rate_limiter import RateLimiterRegistry
+from token_budget import preload_encodings
+
+logger = logging.getLogger('bot')
+config = Config()
+
+
+async def run_company(processor: InvestmentAnalysisProcessor, index: int, semaphore: asyncio.Semaphore) -> float:
+    """Полный анализ одной компании (рынок, конкуренты, синергия); возвращает время выполнения."""
+    analysis_params = {'name': f'Тестовая компания {index}', 'market': 1, 'rivals': 1, 'synergy': 1}
+    async with semaphore:
+        started_at = time.monotonic()
+        await processor.run_analysis(analysis_params, bypass_cache=True)
+        return time.monotonic() - started_at
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Квантиль q (от 0 до 1) выборки без интерполяции."""
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Выполняет args.companies анализов и пишет в лог задержки, метрики моделей, планировщика и лимитеров."""
+    await preload_encodings((config.OPENAI_MODEL, config.OPENAI_FILE_MODEL))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    processors = [InvestmentAnalysisProcessor(user_id=user_id) for user_id in range(1, args.users + 1)]
+
+    started_at = time.monotonic()
+    try:
+        durations = await asyncio.gather(*(
+            run_company(processors[index % len(processors)], index, semaphore) for index in range(args.companies)
+        ))
+    finally:
+        await OpenAIClientRegistry().close()
+    elapsed = time.monotonic() - started_at
+
+    logger.info(f'Компаний: {args.companies}, параллельно: {args.concurrency}, пользователей: {args.users}')
+    logger.info(
+        f'Общее время: {elapsed:.1f}с, пропускная способность: {args.companies / elapsed * 60:.1f} анализов/мин',
+    )
+    logger.info(
+        f'Время анализа: p50 {statistics.median(durations):.2f}с, p95 {percentile(durations, 0.95):.2f}с, '
+        f'макс. {max(durations):.2f}с',
+    )
+    for item in LLMMetrics().summary():
+        logger.info(
+            f'  {item["call_site"]} ({item["model"]}): запросов {item["requests"]:g}, ошибок {item["errors"]:g}, '
+            f'p95 ≤{item.get("p95")}с, токены {item.get("prompt_tokens", 0)}/{item.get("completion_tokens", 0)}, '
+            f'из кеша префикса {item.get("cached_tokens", 0)} ({item.get("cached_share", 0):.0%})',
+        )
+    for call_site, groups in sorted(LLMMetrics().prompt_cache_summary().items()):
+        logger.info(f'  кеш префикса {call_site}: ' + ', '.join(
+            f'{group} — {stats["requests"]} запросов, ср. {stats["avg"]:.2f}с'
+            for group, stats in sorted(groups.items())
+        ))
+    for name, stats in LLMScheduler().get_stats().items():
+        logger.info(f'  планировщик {name}: {stats}')
+    for name, stats in RateLimiterRegistry().get_stats().items():
+        logger.info(f'  лимитер {name}: {stats}')
+    if args.prometheus:
+        with open(args.prometheus, 'w', encoding='utf-8') as f:
+            f.write(LLMMetrics().render_prometheus())
+
+
+if __name__ == '__main__':
+    Logger()
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон инвестиционного анализа')
+    parser.add_argument('--companies', type=int, default=20, help='сколько анализов выполнить')
+    parser.add_argument('--concurrency', type=int, default=5, help='сколько анализов выполнять одновременно')
+    parser.add_argument('--users', type=int, default=3, help='число пользователей для справедливой очереди')
+    parser.add_argument('--prometheus', default=None, help='сохранить метрики в файл в формате Prometheus')
+    parser.add_argument('--allow-live', action='store_true', help='разрешить прогон против настоящего OpenAI API')
+    args = parser.parse_args()
+
+    if not config.OPENAI_BASE_URL and not args.allow_live:
+        parser.error('OPENAI_BASE_URL не задан: укажите адрес mock_llm_server.py или передайте --allow-live')
+    asyncio.run(main(args))
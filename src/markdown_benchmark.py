@@ -0,0 +1,73 @@
+"""Микробенчмарк разбора Markdown в DOCX: время должно расти линейно с длиной ответа.
+
+Пример запуска:
+    python markdown_benchmark.py --sizes 5000 10000 25000 50000 --repeat 5
+"""
+import argparse
+import statistics
+import time
+from typing import List
+
+from markdown_docx import render_markdown
+from report_renderer import ReportWriter, load_report_template
+
+ANSWER_BLOCK = (
+    '## Рынок и позиция компании {index}\n'
+    'Компания **{index}** занимает *устойчивую* позицию, а ***ключевой*** риск — `регулирование`.\n'
+    'Подробнее в [отчете регулятора](https://example.com/report/{index}) и обзоре_рынка_{index}.\n'
+    '- Выручка растет на **25%** год к году\n'
+    '  - Онлайн-канал: *основной* драйвер\n'
+    '    - Доля мобильных заказов: 70%\n'
+    '- Логистика: собственная сеть\n'
+    '1. Сильные стороны\n'
+    '2. Слабые стороны\n'
+    '| Показатель | 2023 | 2024 |\n'
+    '|---|---|---|\n'
+    '| Выручка, млрд | **{index}** | {index}5 |\n'
+    '| EBITDA, % | 12 | 14 |\n'
+    '> Вывод: сделка целесообразна\n\n'
+)
+# Строка без пар для разделителей и скобок: проверка, что разбор не уходит в квадратичный перебор
+PATHOLOGICAL_LINE = '[ссылка ** _ * ( ' * 2000
+
+
+def make_answer(size: int) -> str:
+    """Ответ модели длиной size символов из повторяющихся блоков разметки."""
+    blocks: List[str] = []
+    length = 0
+    while length < size:
+        blocks.append(ANSWER_BLOCK.format(index=len(blocks)))
+        length += len(blocks[-1])
+    return ''.join(blocks)[:size]
+
+
+def measure(content: str, repeat: int) -> float:
+    """Медианное время разбора ответа в новый документ, без создания документа."""
+    durations = []
+    for _ in range(repeat):
+        writer = ReportWriter()
+        started_at = time.perf_counter()
+        render_markdown(writer, content)
+        durations.append(time.perf_counter() - started_at)
+    return statistics.median(durations)
+
+
+def main(args: argparse.Namespace) -> None:
+    """Печатает время разбора ответов каждой длины и строки из непарных разделителей."""
+    load_report_template()
+    print(f'{"символов":>9} | {"время":>8} | {"мкс/символ":>10}')
+    for size in args.sizes:
+        elapsed = measure(make_answer(size), args.repeat)
+        print(f'{size:>9} | {elapsed:>7.3f}с | {elapsed / size * 1e6:>10.2f}')
+    elapsed = measure(PATHOLOGICAL_LINE, args.repeat)
+    print(
+        f'{len(PATHOLOGICAL_LINE):>9} | {elapsed:>7.3f}с | {elapsed / len(PATHOLOGICAL_LINE) * 1e6:>10.2f}'
+        ' (строка из непарных разделителей)',
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Микробенчмарк разбора Markdown в DOCX')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 10000, 25000, 50000], help='длины ответов')
+    parser.add_argument('--repeat', type=int, default=3, help='повторов на каждый размер')
+    main(parser.parse_args())
@@ -0,0 +1,222 @@
+import re
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from docx.enum.text import WD_UNDERLINE
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import RGBColor
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+
+if TYPE_CHECKING:
+    from report_renderer import ReportWriter
+
+# Разметка строки: экранированный символ, `код`, [ссылка](url), разделители *, **, ***, _, __, ___.
+# Длина текста и адреса ссылки ограничена, чтобы строка без закрывающей скобки разбиралась за линейное время.
+INLINE_TOKEN = re.compile(
+    r'\\([\\`*_\[\]()#|>+-])'
+    r'|`([^`\n]+)`'
+    r'|\[([^\]\n]{1,500})\]\(([^)\s]{1,2000})\)'
+    r'|(\*{1,3}|_{1,3})',
+)
+HEADING = re.compile(r'(#{1,6})\s+(.*?)\s*#*$')
+LIST_ITEM = re.compile(r'([-*+]|\d{1,9}[.)])\s+(.*)')
+TABLE_SEPARATOR = re.compile(r'\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?')
+HORIZONTAL_RULE = re.compile(r'([-*_])(\s*\1){2,}')
+
+MAX_HEADING_LEVEL = 4
+MAX_LIST_DEPTH = 3
+CODE_FONT = 'Courier New'
+LINK_COLOR = RGBColor(0x05, 0x63, 0xC1)
+
+
+def _indent_width(line: str) -> int:
+    stripped = line.lstrip(' \t')
+    return len(line[:len(line) - len(stripped)].expandtabs(4))
+
+
+class MarkdownDocxRenderer:
+    """Однопроходный потоковый разбор Markdown из ответов моделей в абзацы и фрагменты python-docx.
+
+    Текст подается кусками через feed(); каждая строка разбирается один раз по мере поступления.
+    Поддерживаются заголовки, вложенные маркированные и нумерованные списки, таблицы, цитаты, блоки кода,
+    а внутри строки — жирный текст, курсив, код и ссылки.
+    """
+
+    def __init__(self, writer: 'ReportWriter', heading_offset: int = 1) -> None:
+        """heading_offset — на сколько уровней сдвигаются заголовки ответа: выше них заголовки самого отчета."""
+        self.writer = writer
+        self.heading_offset = heading_offset
+        self._pending = ''
+        self._list_indents: List[int] = []  # отступы открытых уровней списка
+        self._table_rows: List[List[str]] = []
+        self._in_code_block = False
+
+    def feed(self, chunk: str) -> None:
+        """Разбирает все завершенные строки куска; незавершенная строка ждет следующего куска."""
+        text = self._pending + chunk
+        start = 0
+        end = text.find('\n')
+        while end != -1:
+            self._line(text[start:end])
+            start = end + 1
+            end = text.find('\n', start)
+        self._pending = text[start:]
+
+    def close(self) -> None:
+        """Дописывает последнюю строку и незакрытую таблицу."""
+        if self._pending:
+            self._line(self._pending)
+            self._pending = ''
+        self._flush_table()
+
+    def render(self, content: str) -> None:
+        self.feed(content)
+        self.close()
+
+    def _line(self, raw: str) -> None:
+        line = raw.strip()
+        if line.startswith('```'):
+            self._flush_table()
+            self._in_code_block = not self._in_code_block
+            return
+        if self._in_code_block:
+            self.writer.paragraph().add_run(raw.rstrip()).font.name = CODE_FONT
+            return
+
+        if line.startswith('|'):
+            if not TABLE_SEPARATOR.fullmatch(line):
+                self._table_rows.append(self._table_cells(line))
+            return
+        self._flush_table()
+
+        if not line:
+            return
+        if HORIZONTAL_RULE.fullmatch(line):
+            self._list_indents.clear()
+            return
+
+        heading = HEADING.match(line) if line[0] == '#' else None
+        if heading:
+            self._list_indents.clear()
+            if heading.group(2):
+                level = min(len(heading.group(1)) + self.heading_offset, MAX_HEADING_LEVEL)
+                self._inline(self.writer.heading('', level), heading.group(2))
+            return
+
+        item = LIST_ITEM.match(line)
+        if item and item.group(2):
+            depth = self._list_depth(_indent_width(raw))
+            style = 'List Bullet' if item.group(1) in '-*+' else 'List Number'
+            if depth > 1:
+                style = f'{style} {depth}'
+            self._inline(self.writer.paragraph('', style), item.group(2))
+            return
+
+        self._list_indents.clear()
+        if line.startswith('>'):
+            self._inline(self.writer.paragraph('', 'Quote'), line.lstrip('> '))
+        else:
+            self._inline(self.writer.paragraph(), line)
+
+    def _list_depth(self, indent: int) -> int:
+        """Уровень вложенности элемента списка по его отступу относительно предыдущих элементов."""
+        while self._list_indents and indent < self._list_indents[-1]:
+            self._list_indents.pop()
+        if not self._list_indents or indent > self._list_indents[-1]:
+            self._list_indents.append(indent)
+        return min(len(self._list_indents), MAX_LIST_DEPTH)
+
+    @staticmethod
+    def _table_cells(line: str) -> List[str]:
+        line = line.strip()
+        if line.endswith('|') and not line.endswith('\\|'):
+            line = line[:-1]
+        return [cell.strip() for cell in re.split(r'(?<!\\)\|', line[1:])]
+
+    def _flush_table(self) -> None:
+        if not self._table_rows:
+            return
+        rows, self._table_rows = self._table_rows, []
+        self._list_indents.clear()
+        columns = max(len(row) for row in rows)
+        table = self.writer.table(len(rows), columns)
+        for row_index, (row, table_row) in enumerate(zip(rows, table.rows)):
+            for text, cell in zip(row, table_row.cells):
+                self._inline(cell.paragraphs[0], text, bold=row_index == 0)
+
+    def _inline(self, paragraph: Paragraph, text: str, bold: bool = False) -> None:
+        """Разбирает разметку внутри строки и добавляет в абзац фрагменты с нужным начертанием."""
+        italic = False
+        position = 0
+        for match in INLINE_TOKEN.finditer(text):
+            start, end = match.span()
+            escaped, code, link_text, url, delimiter = match.groups()
+            if delimiter:
+                new_bold, new_italic = self._toggle(text, start, end, delimiter, bold, italic)
+                if (new_bold, new_italic) == (bold, italic):
+                    continue  # разделитель без пары остается обычным текстом
+            self._run(paragraph, text[position:start], bold, italic)
+            position = end
+            if escaped:
+                self._run(paragraph, escaped, bold, italic)
+            elif code:
+                self._run(paragraph, code, bold, italic).font.name = CODE_FONT
+            elif link_text:
+                self._hyperlink(paragraph, url, link_text, bold, italic)
+            else:
+                bold, italic = new_bold, new_italic
+        self._run(paragraph, text[position:], bold, italic)
+
+    @staticmethod
+    def _toggle(text: str, start: int, end: int, delimiter: str, bold: bool, italic: bool) -> Tuple[bool, bool]:
+        """Новое начертание после разделителя; открывающий разделитель стоит перед текстом, закрывающий — после."""
+        before = text[start - 1] if start > 0 else ' '
+        after = text[end] if end < len(text) else ' '
+        can_open = not after.isspace()
+        can_close = not before.isspace()
+        if delimiter[0] == '_' and before.isalnum() and after.isalnum():
+            return bold, italic  # подчеркивание внутри слова (snake_case) — не разметка
+
+        def toggled(active: bool) -> bool:
+            if active and can_close:
+                return False
+            if not active and can_open:
+                return True
+            return active
+
+        if len(delimiter) >= 2:
+            bold = toggled(bold)
+        if len(delimiter) != 2:
+            italic = toggled(italic)
+        return bold, italic
+
+    @staticmethod
+    def _run(paragraph: Paragraph, text: str, bold: bool, italic: bool) -> Optional[Run]:
+        if not text:
+            return None
+        run = paragraph.add_run(text)
+        if bold:
+            run.bold = True
+        if italic:
+            run.italic = True
+        return run
+
+    @classmethod
+    def _hyperlink(cls, paragraph: Paragraph, url: str, text: str, bold: bool, italic: bool) -> None:
+        """Внешняя ссылка: python-docx не умеет их добавлять, поэтому элемент w:hyperlink собирается вручную."""
+        relationship_id = paragraph.part.relate_to(url, RT.HYPERLINK, is_external=True)
+        hyperlink = OxmlElement('w:hyperlink')
+        hyperlink.set(qn('r:id'), relationship_id)
+        run = cls._run(paragraph, text, bold, italic)
+        run.font.color.rgb = LINK_COLOR
+        run.font.underline = WD_UNDERLINE.SINGLE
+        hyperlink.append(run._r)  # фрагмент переносится из абзаца внутрь ссылки
+        paragraph._p.append(hyperlink)
+
+
+def render_markdown(writer: 'ReportWriter', content: Optional[str], heading_offset: int = 1) -> None:
+    """Добавляет в отчет текст ответа модели с разметкой Markdown."""
+    if content:
+        MarkdownDocxRenderer(writer, heading_offset).render(content)
@@ -0,0 +1,546 @@
+"""Локальный OpenAI-совместимый сервер-заглушка для нагрузочного тестирования без обращений к OpenAI.
+
+Поддерживает chat.completions (в том числе потоковые), responses с file_search, files, vector_stores и batches.
+Ответы детерминированы: задержка и текст зависят только от --seed и тела запроса.
+
+Пример запуска:
+    python mock_llm_server.py --port 8080 --latency-median 1.5 --tokens-per-second 60 --rate-429 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8080/v1 python bot.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger('mock_llm')
+
+WORDS = (
+    'рынок', 'компания', 'выручка', 'рост', 'конкуренты', 'доля', 'сегмент', 'инвестиции', 'синергия',
+    'клиенты', 'продукт', 'технология', 'стратегия', 'риски', 'маржинальность', 'партнерство', 'экосистема',
+    'оценка', 'спрос', 'масштабирование', 'платформа', 'аналитика', 'регион', 'прогноз', 'лидер',
+)
+PROMPT_CACHE_MIN_TOKENS = 1024  # как у OpenAI: кешируется префикс от 1024 токенов с шагом 128
+PROMPT_CACHE_STEP = 128
+
+
+def count_tokens(text: str) -> int:
+    """Приближенное число токенов текста (около 4 символов на токен)."""
+    return max(len(text) // 4, 1) if text else 0
+
+
+@dataclass
+class MockSettings:
+    """Параметры поведения сервера-заглушки."""
+
+    latency_distribution: str = 'lognormal'  # lognormal / uniform / fixed
+    latency_median: float = 0.5  # задержка до первого токена, с
+    latency_sigma: float = 0.5  # разброс lognormal или половина ширины uniform
+    tokens_per_second: float = 50.0
+    completion_tokens: int = 300
+    rate_429: float = 0.0  # доля случайных ответов 429
+    rate_5xx: float = 0.0  # доля случайных ответов 500
+    rpm_limit: int = 500
+    tpm_limit: int = 200000
+    batch_duration: float = 2.0  # через сколько секунд batch считается выполненным
+    seed: int = 0
+    canned_path: Optional[str] = None
+
+
+class MockLLMServer:
+    """Обработчики OpenAI-совместимого API с настраиваемыми задержками, лимитами и заготовленными ответами."""
+
+    def __init__(self, settings: MockSettings) -> None:
+        self.settings = settings
+        self.canned = self._load_canned(settings.canned_path)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.vector_stores: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._window: Deque[Tuple[float, int]] = deque()  # (время, токены) за последнюю минуту
+        self._cached_prefixes: set = set()
+        self._attempts: Dict[str, int] = {}
+        self.stats = {'requests': 0, 'rate_limited': 0, 'server_errors': 0, 'streamed': 0}
+
+    @staticmethod
+    def _load_canned(path: Optional[str]) -> List[Dict[str, str]]:
+        """Заготовленные ответы: JSON-список {"match": подстрока запроса, "response": текст ответа}."""
+        if not path:
+            return []
+        with open(path, encoding='utf-8') as f:
+            canned = json.load(f)
+        if isinstance(canned, dict):
+            canned = [{'match': match, 'response': response} for match, response in canned.items()]
+        return canned
+
+    def _rng(self, body: object, salt: str = '') -> random.Random:
+        payload = json.dumps(body, ensure_ascii=False, sort_keys=True, default=str)
+        digest = hashlib.sha256(f'{self.settings.seed}:{salt}:{payload}'.encode('utf-8')).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _fault_rng(self, body: object) -> random.Random:
+        """Генератор для сбоев: зависит от номера повтора, чтобы повтор того же запроса мог пройти."""
+        payload = json.dumps(body, ensure_ascii=False, sort_keys=True, default=str)
+        key = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        self._attempts[key] = self._attempts.get(key, 0) + 1
+        return self._rng(body, salt=f'fault:{self._attempts[key]}')
+
+    def _latency(self, rng: random.Random) -> float:
+        settings = self.settings
+        if settings.latency_distribution == 'fixed':
+            return settings.latency_median
+        if settings.latency_distribution == 'uniform':
+            spread = settings.latency_sigma
+            return max(rng.uniform(settings.latency_median - spread, settings.latency_median + spread), 0.0)
+        return rng.lognormvariate(0, settings.latency_sigma) * settings.latency_median
+
+    def _completion_text(self, prompt: str, rng: random.Random) -> str:
+        for item in self.canned:
+            if item['match'] in prompt:
+                return item['response']
+        words = [rng.choice(WORDS) for _ in range(self.settings.completion_tokens)]
+        sentences = [' '.join(words[i:i + 12]).capitalize() + '.' for i in range(0, len(words), 12)]
+        return '\n\n'.join(' '.join(sentences[i:i + 4]) for i in range(0, len(sentences), 4))
+
+    def _cached_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Имитирует кеширование префикса промпта: повторный одинаковый префикс засчитывается как cached."""
+        prefix_tokens, cached = 0, 0
+        for message in messages[:-1] or messages:
+            prefix_tokens += count_tokens(str(message.get('content', '')))
+        if prefix_tokens < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        prefix = json.dumps(messages[:-1] or messages, ensure_ascii=False, sort_keys=True)
+        key = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+        if key in self._cached_prefixes:
+            cached = prefix_tokens // PROMPT_CACHE_STEP * PROMPT_CACHE_STEP
+        self._cached_prefixes.add(key)
+        return cached
+
+    def _usage_in_window(self) -> Tuple[int, int]:
+        now = time.monotonic()
+        while self._window and now - self._window[0][0] > 60:
+            self._window.popleft()
+        return len(self._window), sum(tokens for _, tokens in self._window)
+
+    def _rate_limit_headers(self) -> Dict[str, str]:
+        requests, tokens = self._usage_in_window()
+        return {
+            'x-ratelimit-limit-requests': str(self.settings.rpm_limit),
+            'x-ratelimit-limit-tokens': str(self.settings.tpm_limit),
+            'x-ratelimit-remaining-requests': str(max(self.settings.rpm_limit - requests, 0)),
+            'x-ratelimit-remaining-tokens': str(max(self.settings.tpm_limit - tokens, 0)),
+            'x-ratelimit-reset-requests': '1s',
+            'x-ratelimit-reset-tokens': '1s',
+        }
+
+    def _admit(self, body: Dict[str, Any], tokens: int) -> Optional[web.Response]:
+        """Проверяет лимиты и случайные сбои; возвращает ответ с ошибкой или None."""
+        self.stats['requests'] += 1
+        rng = self._fault_rng(body)
+        requests, used_tokens = self._usage_in_window()
+        over_limit = requests + 1 > self.settings.rpm_limit or used_tokens + tokens > self.settings.tpm_limit
+        if over_limit or rng.random() < self.settings.rate_429:
+            self.stats['rate_limited'] += 1
+            headers = self._rate_limit_headers()
+            headers['retry-after-ms'] = str(int(rng.uniform(200, 1000)))
+            return web.json_response(
+                {'error': {'message': 'Rate limit reached (mock)', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                status=429,
+                headers=headers,
+            )
+        if rng.random() < self.settings.rate_5xx:
+            self.stats['server_errors'] += 1
+            return web.json_response(
+                {'error': {'message': 'The server had an error (mock)', 'type': 'server_error'}}, status=500,
+            )
+        self._window.append((time.monotonic(), tokens))
+        return None
+
+    @staticmethod
+    def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+        return '\n'.join(str(message.get('content', '')) for message in messages)
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        messages = body.get('messages', [])
+        rng = self._rng(body)
+        prompt_text = self._prompt_text(messages)
+        prompt_tokens = count_tokens(prompt_text)
+
+        error = self._admit(body, prompt_tokens + self.settings.completion_tokens)
+        if error is not None:
+            return error
+
+        text = self._completion_text(prompt_text, rng)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': count_tokens(text),
+            'total_tokens': prompt_tokens + count_tokens(text),
+            'prompt_tokens_details': {'cached_tokens': self._cached_tokens(messages)},
+        }
+        completion_id = f'chatcmpl-mock-{uuid.uuid4().hex[:12]}'
+        created = int(time.time())
+        model = body.get('model', 'mock')
+        await asyncio.sleep(self._latency(rng))
+
+        if body.get('stream'):
+            return await self._stream_completion(request, completion_id, created, model, text, usage, body)
+
+        await asyncio.sleep(count_tokens(text) / self.settings.tokens_per_second)
+        return web.json_response(
+            {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': text},
+                    'finish_reason': 'stop',
+                    'logprobs': None,
+                }],
+                'usage': usage,
+            },
+            headers=self._rate_limit_headers(),
+        )
+
+    async def _stream_completion(
+        self,
+        request: web.Request,
+        completion_id: str,
+        created: int,
+        model: str,
+        text: str,
+        usage: Dict[str, Any],
+        body: Dict[str, Any],
+    ) -> web.StreamResponse:
+        self.stats['streamed'] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', **self._rate_limit_headers()})
+        await response.prepare(request)
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> bytes:
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            return f'data: {json.dumps(payload, ensure_ascii=False)}\n\n'.encode('utf-8')
+
+        await response.write(chunk({'role': 'assistant', 'content': ''}))
+        pieces = text.split(' ')
+        pieces_per_tick = max(int(self.settings.tokens_per_second / 10), 1)
+        for i in range(0, len(pieces), pieces_per_tick):
+            content = ' '.join(pieces[i:i + pieces_per_tick]) + (' ' if i + pieces_per_tick < len(pieces) else '')
+            await response.write(chunk({'content': content}))
+            await asyncio.sleep(count_tokens(content) / self.settings.tokens_per_second)
+        await response.write(chunk({}, finish_reason='stop'))
+
+        if (body.get('stream_options') or {}).get('include_usage'):
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [],
+                'usage': usage,
+            }
+            await response.write(f'data: {json.dumps(payload, ensure_ascii=False)}\n\n'.encode('utf-8'))
+        await response.write(b'data: [DONE]\n\n')
+        await response.write_eof()
+        return response
+
+    async def responses(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        rng = self._rng(body)
+        prompt_text = body.get('input') if isinstance(body.get('input'), str) else json.dumps(body.get('input'))
+        prompt_tokens = count_tokens(prompt_text)
+
+        error = self._admit(body, prompt_tokens + self.settings.completion_tokens)
+        if error is not None:
+            return error
+
+        text = self._completion_text(prompt_text, rng)
+        await asyncio.sleep(self._latency(rng) + count_tokens(text) / self.settings.tokens_per_second)
+
+        output: List[Dict[str, Any]] = []
+        file_search = [tool for tool in body.get('tools') or [] if tool.get('type') == 'file_search']
+        if file_search:
+            output.append({
+                'type': 'file_search_call',
+                'id': f'fs-mock-{uuid.uuid4().hex[:12]}',
+                'status': 'completed',
+                'queries': [prompt_text[:200]],
+                'results': [{
+                    'file_id': next(iter(self.files), 'file-mock'),
+                    'filename': 'startups.xlsx',
+                    'score': round(rng.uniform(0.5, 1.0), 3),
+                    'text': text[:500],
+                    'attributes': {},
+                }],
+            })
+        output.append({
+            'type': 'message',
+            'id': f'msg-mock-{uuid.uuid4().hex[:12]}',
+            'role': 'assistant',
+            'status': 'completed',
+            'content': [{'type': 'output_text', 'text': text, 'annotations': []}],
+        })
+        return web.json_response(
+            {
+                'id': f'resp-mock-{uuid.uuid4().hex[:12]}',
+                'object': 'response',
+                'created_at': time.time(),
+                'model': body.get('model', 'mock'),
+                'status': 'completed',
+                'output': output,
+                'parallel_tool_calls': True,
+                'tool_choice': 'auto',
+                'tools': body.get('tools') or [],
+                'usage': {
+                    'input_tokens': prompt_tokens,
+                    'input_tokens_details': {'cached_tokens': 0},
+                    'output_tokens': count_tokens(text),
+                    'output_tokens_details': {'reasoning_tokens': 0},
+                    'total_tokens': prompt_tokens + count_tokens(text),
+                },
+            },
+            headers=self._rate_limit_headers(),
+        )
+
+    # --- files и vector stores (нужны ExcelFileManager и пакетному режиму) ---
+
+    @staticmethod
+    def _file_object(file: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in file.items() if key != 'content'}
+
+    async def create_file(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        upload = form['file']
+        content = upload.file.read()
+        file_id = f'file-mock-{uuid.uuid4().hex[:12]}'
+        self.files[file_id] = {
+            'id': file_id,
+            'object': 'file',
+            'bytes': len(content),
+            'created_at': int(time.time()),
+            'filename': upload.filename,
+            'purpose': form.get('purpose', 'assistants'),
+            'status': 'processed',
+            'content': content,
+        }
+        return web.json_response(self._file_object(self.files[file_id]))
+
+    async def file_content(self, request: web.Request) -> web.Response:
+        file = self.files.get(request.match_info['file_id'])
+        if file is None:
+            return web.json_response({'error': {'message': 'No such file'}}, status=404)
+        return web.Response(body=file['content'], content_type='application/octet-stream')
+
+    async def delete_file(self, request: web.Request) -> web.Response:
+        file_id = request.match_info['file_id']
+        self.files.pop(file_id, None)
+        return web.json_response({'id': file_id, 'object': 'file', 'deleted': True})
+
+    async def create_vector_store(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        store_id = f'vs-mock-{uuid.uuid4().hex[:12]}'
+        self.vector_stores[store_id] = {
+            'id': store_id,
+            'object': 'vector_store',
+            'name': body.get('name'),
+            'created_at': int(time.time()),
+            'status': 'completed',
+            'file_ids': [],
+        }
+        return web.json_response({k: v for k, v in self.vector_stores[store_id].items() if k != 'file_ids'})
+
+    def _vector_store_file(self, store_id: str, file_id: str) -> Dict[str, Any]:
+        return {
+            'id': file_id,
+            'object': 'vector_store.file',
+            'vector_store_id': store_id,
+            'status': 'completed',
+            'created_at': int(time.time()),
+            'usage_bytes': self.files.get(file_id, {}).get('bytes', 0),
+        }
+
+    async def list_vector_store_files(self, request: web.Request) -> web.Response:
+        store_id = request.match_info['store_id']
+        store = self.vector_stores.setdefault(store_id, {'id': store_id, 'file_ids': []})
+        data = [self._vector_store_file(store_id, file_id) for file_id in store['file_ids']]
+        return web.json_response({'object': 'list', 'data': data, 'has_more': False})
+
+    async def add_vector_store_file(self, request: web.Request) -> web.Response:
+        store_id = request.match_info['store_id']
+        body = await request.json()
+        store = self.vector_stores.setdefault(store_id, {'id': store_id, 'file_ids': []})
+        store['file_ids'].append(body['file_id'])
+        return web.json_response(self._vector_store_file(store_id, body['file_id']))
+
+    async def delete_vector_store_file(self, request: web.Request) -> web.Response:
+        store_id, file_id = request.match_info['store_id'], request.match_info['file_id']
+        store = self.vector_stores.get(store_id)
+        if store and file_id in store['file_ids']:
+            store['file_ids'].remove(file_id)
+        return web.json_response({'id': file_id, 'object': 'vector_store.file.deleted', 'deleted': True})
+
+    async def delete_vector_store(self, request: web.Request) -> web.Response:
+        store_id = request.match_info['store_id']
+        self.vector_stores.pop(store_id, None)
+        return web.json_response({'id': store_id, 'object': 'vector_store.deleted', 'deleted': True})
+
+    # --- batches ---
+
+    async def create_batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        input_file = self.files.get(body['input_file_id'])
+        if input_file is None:
+            return web.json_response({'error': {'message': 'No such file'}}, status=404)
+        lines = [json.loads(line) for line in input_file['content'].decode('utf-8').splitlines() if line.strip()]
+        batch_id = f'batch-mock-{uuid.uuid4().hex[:12]}'
+        now = int(time.time())
+        self.batches[batch_id] = {
+            'id': batch_id,
+            'object': 'batch',
+            'endpoint': body.get('endpoint'),
+            'errors': None,
+            'input_file_id': body['input_file_id'],
+            'completion_window': body.get('completion_window', '24h'),
+            'status': 'in_progress',
+            'output_file_id': None,
+            'error_file_id': None,
+            'created_at': now,
+            'in_progress_at': now,
+            'expires_at': now + 24 * 3600,
+            'completed_at': None,
+            'request_counts': {'total': len(lines), 'completed': 0, 'failed': 0},
+            'metadata': body.get('metadata'),
+            '_lines': lines,
+            '_started': time.monotonic(),
+        }
+        return web.json_response(self._batch_object(self.batches[batch_id]))
+
+    @staticmethod
+    def _batch_object(batch: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in batch.items() if not key.startswith('_')}
+
+    def _complete_batch(self, batch: Dict[str, Any]) -> None:
+        output = []
+        for line in batch['_lines']:
+            request_body = line.get('body', {})
+            rng = self._rng(request_body)
+            prompt_text = self._prompt_text(request_body.get('messages', []))
+            text = self._completion_text(prompt_text, rng)
+            output.append({
+                'id': f'batch_req_{uuid.uuid4().hex[:12]}',
+                'custom_id': line.get('custom_id'),
+                'response': {
+                    'status_code': 200,
+                    'request_id': uuid.uuid4().hex,
+                    'body': {
+                        'id': f'chatcmpl-mock-{uuid.uuid4().hex[:12]}',
+                        'object': 'chat.completion',
+                        'created': int(time.time()),
+                        'model': request_body.get('model', 'mock'),
+                        'choices': [{
+                            'index': 0,
+                            'message': {'role': 'assistant', 'content': text},
+                            'finish_reason': 'stop',
+                        }],
+                        'usage': {
+                            'prompt_tokens': count_tokens(prompt_text),
+                            'completion_tokens': count_tokens(text),
+                            'total_tokens': count_tokens(prompt_text) + count_tokens(text),
+                        },
+                    },
+                },
+                'error': None,
+            })
+        file_id = f'file-mock-{uuid.uuid4().hex[:12]}'
+        content = '\n'.join(json.dumps(item, ensure_ascii=False) for item in output).encode('utf-8')
+        self.files[file_id] = {
+            'id': file_id,
+            'object': 'file',
+            'bytes': len(content),
+            'created_at': int(time.time()),
+            'filename': 'batch_output.jsonl',
+            'purpose': 'batch_output',
+            'status': 'processed',
+            'content': content,
+        }
+        batch.update({
+            'status': 'completed',
+            'output_file_id': file_id,
+            'completed_at': int(time.time()),
+            'request_counts': {'total': len(output), 'completed': len(output), 'failed': 0},
+        })
+
+    async def retrieve_batch(self, request: web.Request) -> web.Response:
+        batch = self.batches.get(request.match_info['batch_id'])
+        if batch is None:
+            return web.json_response({'error': {'message': 'No such batch'}}, status=404)
+        if batch['status'] == 'in_progress' and time.monotonic() - batch['_started'] >= self.settings.batch_duration:
+            self._complete_batch(batch)
+        return web.json_response(self._batch_object(batch))
+
+    async def mock_stats(self, _request: web.Request) -> web.Response:
+        requests, tokens = self._usage_in_window()
+        return web.json_response({**self.stats, 'window_requests': requests, 'window_tokens': tokens})
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=200 * 1024 * 1024)
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_post('/v1/responses', self.responses)
+        app.router.add_post('/v1/files', self.create_file)
+        app.router.add_get('/v1/files/{file_id}/content', self.file_content)
+        app.router.add_delete('/v1/files/{file_id}', self.delete_file)
+        app.router.add_post('/v1/vector_stores', self.create_vector_store)
+        app.router.add_delete('/v1/vector_stores/{store_id}', self.delete_vector_store)
+        app.router.add_get('/v1/vector_stores/{store_id}/files', self.list_vector_store_files)
+        app.router.add_post('/v1/vector_stores/{store_id}/files', self.add_vector_store_file)
+        app.router.add_delete('/v1/vector_stores/{store_id}/files/{file_id}', self.delete_vector_store_file)
+        app.router.add_post('/v1/batches', self.create_batch)
+        app.router.add_get('/v1/batches/{batch_id}', self.retrieve_batch)
+        app.router.add_get('/mock/stats', self.mock_stats)
+        return app
+
+
+def parse_args() -> argparse.Namespace:
+    """Разбирает параметры запуска сервера: адрес, задержки, доли сбоев и лимиты."""
+    parser = argparse.ArgumentParser(description='OpenAI-совместимый сервер-заглушка для нагрузочных тестов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument(
+        '--latency-distribution',
+        choices=['lognormal', 'uniform', 'fixed'],
+        default='lognormal',
+        help='распределение задержки до первого токена',
+    )
+    parser.add_argument('--latency-median', type=float, default=0.5, help='медиана задержки, с')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='разброс задержки')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help='скорость генерации ответа')
+    parser.add_argument('--completion-tokens', type=int, default=300, help='длина сгенерированного ответа в словах')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='доля случайных ответов 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='доля случайных ответов 500')
+    parser.add_argument('--rpm', dest='rpm_limit', type=int, default=500, help='лимит запросов в минуту')
+    parser.add_argument('--tpm', dest='tpm_limit', type=int, default=200000, help='лимит токенов в минуту')
+    parser.add_argument('--batch-duration', type=float, default=2.0, help='время выполнения batch, с')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--canned', dest='canned_path', default=None, help='JSON с заготовленными ответами')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args()
+    settings = MockSettings(**{key: value for key, value in vars(args).items() if key not in ('host', 'port')})
+    web.run_app(MockLLMServer(settings).build_app(), host=args.host, port=args.port)
@@ -1,17 +1,29 @@
+import asyncio
+import functools
 import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
 
-from aiolimiter import AsyncLimiter
-
-from openai import AsyncOpenAI
+import openai
+from openai.types import CompletionUsage
+from openai.types.responses import ResponseUsage
 
+from circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breaker
 from config import Config
 from excel_file_manager import ExcelFileManager
+from llm_metrics import current_call, error_class, finish_call, start_call
+from llm_scheduler import LLMScheduler, RequestPriority
+from openai_clients import get_openai_client
+from rate_limiter import estimate_tokens, get_rate_limiter, parse_retry_after
+from response_cache import ResponseCache
 
 logger = logging.getLogger('bot')
 config = Config()
 
+R = TypeVar('R')
+
 
 class ModelStrategy(ABC):
     """Абстрактный класс для стратегий взаимодействия с моделями."""
@@ -21,15 +33,32 @@ class ModelStrategy(ABC):
         """Получает ответ от модели на основе списка сообщений."""
         ...
 
+    async def stream_response(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Отдает ответ модели фрагментами по мере генерации.
 
-class ChatGPTStrategy(ModelStrategy):
-    """Стратегия для взаимодействия с ChatGPT через OpenAI API с лимитом запросов."""
+        Стратегии без поддержки потоковой передачи отдают полный ответ одним фрагментом.
+        """
+        yield await self.get_response(messages)
 
-    _limiter = AsyncLimiter(max_rate=3, time_period=1.0)  # ⬅️ лимит: 3 запроса в секунду (настраивается)
+    def cache_namespace(self) -> Dict[str, Any]:
+        """Возвращает параметры вызова, от которых зависит ответ модели (часть ключа кеша)."""
+        return {'strategy': self.__class__.__name__, 'model': getattr(self, 'model', None)}
 
-    def __init__(self) -> None:
-        self.client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
-        self.model = config.OPENAI_MODEL
+    def fallback(self) -> Optional['ModelStrategy']:
+        """Возвращает стратегию резервной модели для хеджирования или None, если резерва нет."""
+        return None
+
+
+class OpenAIStrategy(ModelStrategy):
+    """Базовая стратегия для OpenAI API: общий клиент, адаптивный лимитер RPM/TPM и повторы с учетом Retry-After."""
+
+    max_attempts = 3
+
+    def __init__(self, model: str) -> None:
+        # Повторы выполняем сами, чтобы лимитер видел каждый ответ 429 и его заголовки
+        self.client = get_openai_client().with_options(max_retries=0)
+        self.model = model
+        self._limiter = get_rate_limiter(model)
         logger.info(f'Инициализирована стратегия {self.__class__.__name__} с моделью {self.model}')
 
     def _format_messages_for_log(self, messages: list, max_len: int = 50) -> str:
@@ -45,106 +74,230 @@ class ChatGPTStrategy(ModelStrategy):
             lines.append(f'  {idx}. role={role}; len={content_len}; text="{display_content}"')
         return '\n'.join(lines)
 
-    async def get_response(self, messages: List[Dict[str, str]]) -> str:
-        """Отправляет запрос к ChatGPT с ограничением по частоте запросов и повторными попытками."""
-        logger.info(f'[{self.__class__.__name__}] Отправка запроса, модель: {self.model}')
-        logger.debug(f'[{self.__class__.__name__}] {self._format_messages_for_log(messages)}')
-
-        for attempt in range(3):  # ⬅️ максимум 3 попытки при ошибке 429
+    def _reserve_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Оценивает, сколько токенов TPM-бюджета занять под запрос (промпт + ожидаемый ответ)."""
+        return estimate_tokens(messages) + int(config.OPENAI_MAX_TOKENS)
+
+    async def _request(self, send: Callable[[], Awaitable[R]], reserved_tokens: int) -> R:
+        """Выполняет запрос через лимитер и повторяет неудачные попытки.
+
+        При 429 ждет Retry-After, 5xx, обрывы соединения и таймауты повторяет с экспоненциальной паузой;
+        после последней попытки пробрасывает ее ошибку. Каждая попытка занимает в лимитере свой запрос
+        и reserved_tokens токенов; резерв неудачной попытки сразу возвращается в бюджет.
+        send должен возвращать raw-ответ OpenAI SDK (with_raw_response), чтобы были доступны заголовки.
+        """
+        record = current_call()
+        last_attempt = self.max_attempts - 1
+        for attempt in range(self.max_attempts):
+            limiter_wait = await self._limiter.acquire(reserved_tokens)
+            if record is not None:
+                record.limiter_wait += limiter_wait
+                record.retries += 1 if attempt else 0
             try:
-                async with self._limiter:
-                    response = await self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        web_search_options={},  # поддерживается только gpt-4o
-                    )
-
-                content = response.choices[0].message.content.strip()
-                token_usage = getattr(response.usage, 'completion_tokens', 'неизвестно')
-                logger.info(
-                    f'[{self.__class__.__name__}] Получен ответ, длина: {len(content)} символов, использовано токенов: {token_usage}'
-                )
-                return content
-
-            except Exception as e:
-                if '429' in str(e):
+                try:
+                    raw_response = await send()
+                except BaseException:
+                    # токены не израсходованы: иначе каждая повторная попытка навсегда занимала бы еще один резерв
+                    self._limiter.record_usage(reserved_tokens, 0)
+                    raise
+            except openai.RateLimitError as e:
+                headers = e.response.headers if e.response is not None else None
+                self._limiter.update_from_headers(headers)
+                wait = parse_retry_after(headers) or 2 ** attempt
+                self._limiter.block_for(wait)
+                if attempt == last_attempt:
+                    raise
+                logger.warning(f'[{self.__class__.__name__}] Превышен лимит запросов, повтор через {wait:.1f}с...')
+                continue
+            except openai.APIConnectionError as e:
+                # SDK сам не повторяет запросы (max_retries=0), поэтому обрывы соединения и таймауты повторяем здесь
+                if attempt < last_attempt:
                     wait = 2 ** attempt
-                    logger.warning(f'[{self.__class__.__name__}] Превышен лимит запросов, повтор через {wait}с...')
+                    logger.warning(
+                        f'[{self.__class__.__name__}] {e.__class__.__name__}: {e}, повтор через {wait:.1f}с...',
+                    )
                     await asyncio.sleep(wait)
-                else:
-                    logger.error(f'[{self.__class__.__name__}] Ошибка при запросе: {e}')
-                    raise ValueError(f'Не удалось получить ответ от ChatGPT: {e}')
+                    continue
+                raise
+            except openai.APIStatusError as e:
+                if e.status_code >= 500 and attempt < last_attempt:
+                    wait = parse_retry_after(e.response.headers) or 2 ** attempt
+                    logger.warning(
+                        f'[{self.__class__.__name__}] Ошибка сервера {e.status_code}, повтор через {wait:.1f}с...',
+                    )
+                    await asyncio.sleep(wait)
+                    continue
+                raise
+            self._limiter.update_from_headers(raw_response.headers)
+            return raw_response
 
-        raise RuntimeError("Слишком много попыток из-за превышения лимита")
+    def _record_usage(self, reserved_tokens: int, usage: Union[CompletionUsage, ResponseUsage, None]) -> None:
+        self._limiter.record_usage(reserved_tokens, getattr(usage, 'total_tokens', None))
+        record = current_call()
+        if record is not None:
+            record.add_usage(usage)
 
 
-class ChatGPTFileStrategy(ModelStrategy):
-    """Стратегия для взаимодействия с ChatGPT через OpenAI API для обработки файлов."""
+class ChatGPTStrategy(OpenAIStrategy):
+    """Стратегия для взаимодействия с ChatGPT через OpenAI API с лимитом запросов."""
 
     def __init__(self) -> None:
-        """Инициализирует клиент OpenAI с API-ключом из конфигурации."""
-        self.client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
-        self.model = config.OPENAI_FILE_MODEL
-        logger.info(f'Инициализирована стратегия {self.__class__.__name__} с моделью {self.model}')
+        super().__init__(config.OPENAI_MODEL)
+
+    def _completion_options(self) -> Dict[str, Any]:
+        return {'web_search_options': {}}  # поддерживается только gpt-4o
+
+    def cache_namespace(self) -> Dict[str, Any]:
+        namespace = super().cache_namespace()
+        namespace.update(self._completion_options())
+        return namespace
+
+    def fallback(self) -> Optional[ModelStrategy]:
+        model = config.OPENAI_FALLBACK_MODEL
+        if not model or model == self.model:
+            return None
+        if getattr(self, '_fallback', None) is None:
+            self._fallback = ChatGPTFallbackStrategy(model)
+        return self._fallback
 
     async def get_response(self, messages: List[Dict[str, str]]) -> str:
-        """Отправляет запрос к ChatGPT и возвращает ответ."""
-        try:
-            logger.info(
-                f'[{self.__class__.__name__}] Отправка запроса к файловой модели: {self.model}',
-            )
-            logger.debug(f'[{self.__class__.__name__}] Сообщения: {messages}')
+        """Отправляет запрос к ChatGPT с ограничением по частоте запросов и повторными попытками."""
+        logger.info(f'[{self.__class__.__name__}] Отправка запроса, модель: {self.model}')
+        logger.debug(f'[{self.__class__.__name__}] {self._format_messages_for_log(messages)}')
 
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+        reserved_tokens = self._reserve_tokens(messages)
+        try:
+            raw_response = await self._request(
+                lambda: self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    **self._completion_options(),
+                ),
+                reserved_tokens,
             )
+            response = raw_response.parse()
+        except RuntimeError:
+            raise
+        except Exception as e:
+            logger.error(f'[{self.__class__.__name__}] Ошибка при запросе: {e}')
+            raise ValueError(f'Не удалось получить ответ от ChatGPT: {e}')
+
+        self._record_usage(reserved_tokens, response.usage)
+        content = response.choices[0].message.content.strip()
+        token_usage = getattr(response.usage, 'completion_tokens', 'неизвестно')
+        logger.info(
+            f'[{self.__class__.__name__}] Получен ответ, длина: {len(content)} символов, '
+            f'использовано токенов: {token_usage}',
+        )
+        return content
+
+    async def stream_response(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Отправляет потоковый запрос к ChatGPT и отдает фрагменты ответа по мере генерации."""
+        logger.info(f'[{self.__class__.__name__}] Отправка потокового запроса, модель: {self.model}')
+        logger.debug(f'[{self.__class__.__name__}] {self._format_messages_for_log(messages)}')
 
-            content = response.choices[0].message.content.strip()
-            token_usage = response.usage.completion_tokens if hasattr(response, 'usage') else 'неизвестно'
-            logger.info(
-                f'[{self.__class__.__name__}] Получен ответ от файловой модели, длина: {len(content)} символов, использовано токенов: {token_usage}',
+        reserved_tokens = self._reserve_tokens(messages)
+        try:
+            # Повторы возможны только до получения первого фрагмента
+            raw_response = await self._request(
+                lambda: self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={'include_usage': True},
+                    **self._completion_options(),
+                ),
+                reserved_tokens,
             )
-            return content
+            stream = raw_response.parse()
+        except RuntimeError:
+            raise
         except Exception as e:
-            logger.error(f'[{self.__class__.__name__}] Ошибка при запросе к файловой модели: {e}')
-            raise ValueError(f'Не удалось получить ответ от ChatGPT (файловая модель): {e}')
+            logger.error(f'[{self.__class__.__name__}] Ошибка при потоковом запросе: {e}')
+            raise ValueError(f'Не удалось получить ответ от ChatGPT: {e}')
 
+        content_len = 0
+        async for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                self._record_usage(reserved_tokens, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                content_len += len(delta)
+                yield delta
+        logger.info(f'[{self.__class__.__name__}] Потоковый ответ завершен, длина: {content_len} символов')
 
-class ExcelSearchStrategy(ModelStrategy):
+
+class ChatGPTFallbackStrategy(ChatGPTStrategy):
+    """Резервная модель ChatGPT для хеджирования запросов (без веб-поиска)."""
+
+    def __init__(self, model: str) -> None:
+        OpenAIStrategy.__init__(self, model)
+
+    def _completion_options(self) -> Dict[str, Any]:
+        return {}
+
+    def fallback(self) -> Optional[ModelStrategy]:
+        return None
+
+
+class ChatGPTFileStrategy(ChatGPTStrategy):
+    """Стратегия для взаимодействия с ChatGPT через OpenAI API для обработки файлов."""
+
+    def __init__(self) -> None:
+        OpenAIStrategy.__init__(self, config.OPENAI_FILE_MODEL)
+
+    def _completion_options(self) -> Dict[str, Any]:
+        return {}
+
+
+class ExcelSearchStrategy(OpenAIStrategy):
     """Стратегия для поиска в Excel файле с использованием OpenAI Vector Store."""
 
     def __init__(self) -> None:
-        """Инициализирует клиент OpenAI с API-ключом из конфигурации."""
-        self.client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
-        self.model = config.OPENAI_FILE_MODEL
+        super().__init__(config.OPENAI_FILE_MODEL)
         self._file_manager = ExcelFileManager()
-        logger.info(f'Инициализирована стратегия {self.__class__.__name__} с моделью {self.model}')
+
+    def cache_namespace(self) -> Dict[str, Any]:
+        namespace = super().cache_namespace()
+        namespace['vector_store_id'] = self._file_manager._vector_store_id
+        return namespace
+
+    @staticmethod
+    def _build_search_prompt(messages: List[Dict[str, str]]) -> str:
+        return (
+            'Найди все стартапы в этом excel-файле, которые подходят под описание. нужно только стартапы из файла, больше ничего не существует.\n'
+            f"Запрос пользователя: {messages[-1]['content']}\n"
+            'ОБЯЗАТЕЛЬНО верни заголовок таблицы и МИНИМУМ ТРИ строки, которые потенциально подходят под запрос пользователя!\n'
+            '!Строк должно быть по количеству НЕ МЕНЕЕ, чем попросил пользователь (можешь возвращать побольше)! Если пользователь не указал количество, то возвращай НЕ МЕНЕЕ 3 СТРОК!!!\n'
+            '!Релевантными строками считаются те, которые удовлетворяют хотя бы одному критерию в запросе пользователя!\n'
+            'Не добавляй никаких пояснений или дополнительного текста!\n'
+            'Пример формата ответа (здесь одна строка после заголовка таблицы, но ты возвращай больше!):\n'
+            'Полное юридическое название Вашей|Наименование организации|Создание|Последнее изменение|ИНН|Год регистрации|Сайт|Страна юрисдикции|Краткое описание проекта|Бизнес-модели|Страна Где базируется проект|Город Где базируется проект|Индустрии|Технологии|Стадия продукта|Видео о продукте|Проблема, которую решает проект|Целевая аудитория|Рынки, на которых Вы работаете|Продажи|Оборот в год Оборот в год (в USD)|Прямые конкуренты|Преимущества перед конкурентами|Количество сотрудников|Укажите, какие ключевые должности|Если вы В2В-, В2G-, B2B2C-, В2О- стартап: у|С кем был успешный кейс? Описание и|Заинтересованы ли вы в пилотирова|Предлагаемый кейс|Есть ли у Вас опыт взаимодействия|Объем ранее привлеченных инвестиц|Какую потребность Экосистемы Сбер|Подавались ранее в sber500?|Выручка за последний месяц|Выручка за последние 3 месяца|Количество активных или платящих|заменяет ли ваш продукт какие-либо аналогичные сервисы или компании|названия заменяемых сервисов/компаний|как именно вы заменяете перечисленные сервисы/компании|преимущества перед перечисленными сервисами/компаниями\n'
+            'ООО "ВАРТЕХ"|МБонус|2021-05-05 18:10:11|2022-07-29 13:39:21|7801690817|2020|https://vartech24.ru|Россия|МБонус - это первый в России сервис управления сдельной оплатой труда и сквозной мотивации продавцов, консультантов и партнеров, с мгновенным доступом к заработанным деньгам.||Россия|Санкт-Петербург|[FinTech, Retail, HR-Tech]|[Mobile, Payments and Transactions, SaaS, Computer Vision]|[MVP, первые продажи]||1. Автоматизация постановки задач, учета выполнения и взаиморасчетов с исполнителями. 2. Мгновенные выплаты физ лицам, самозанятым и ИП. 3. Увеличение продаж товаров/услуг/выполнения KPI. 4. Низкая лояльность персонала к работодателю. 5. Высокие финансовые издержки при работе с исполнителями.|1. Сервисы такси, доставки 3. Курьерские службы 4. Call-центры 5. Аптечные сети 6. Розничые магазины и производители: электроники, бытовых товаров, товаров для ремонта, парфюмерии и косметики, авто-товаров, БАД и лекарств, алкоголя, зоотоваров.|[Россия]|[Есть продажи в РФ]|44 780|Прямых конкурентов нет.|Возможность полностью автоматизировать сдельную оплату труда, запуск промо-акций мгновенно, рямая коммуникация с продавцами, озможность мгновенно выплачивать бонусы на любую карту или телефон, не нужны предоплаченные карты или промокоды, собственное фондирование для срочный выплат.|4|(ГЕНЕРАЛЬНЫЙ ДИРЕКТОР,Опыт предпринимательской деятельности более 10 лет. Собственные проекты в рознице и бьюти.);(Коммерческий директор,Опыт работы в крупных международных фарм компаниях 9 лет, опыт предпринимательской деятельности более 5 лет. Собственный проект аптечного партнерства.);(Менеджер по работе с клиентами,В продажа более 10 лет.);(ИТ-директор,Опыт в ИТ более 10 лет. Собственная ИТ компания.)|True||True|Автоматизация взаиморасчетов с исполнителями (самозанятые, ИП, сотрудники в найме) на основании выполненных задач, результатов. Возможность выплат вознаграждения/оклада по требованию исполнителя в любое время.||0|||||||||'
+        )
 
     async def get_response(self, messages: List[Dict[str, str]]) -> str:
         """Находит наиболее релевантную информацию для запроса пользователя."""
         try:
-            search_prompt = (
-                'Найди все стартапы в этом excel-файле, которые подходят под описание. нужно только стартапы из файла, больше ничего не существует.\n'
-                f"Запрос пользователя: {messages[-1]['content']}\n"
-                'ОБЯЗАТЕЛЬНО верни заголовок таблицы и МИНИМУМ ТРИ строки, которые потенциально подходят под запрос пользователя!\n'
-                '!Строк должно быть по количеству НЕ МЕНЕЕ, чем попросил пользователь (можешь возвращать побольше)! Если пользователь не указал количество, то возвращай НЕ МЕНЕЕ 3 СТРОК!!!\n'
-                '!Релевантными строками считаются те, которые удовлетворяют хотя бы одному критерию в запросе пользователя!\n'
-                'Не добавляй никаких пояснений или дополнительного текста!\n'
-                'Пример формата ответа (здесь одна строка после заголовка таблицы, но ты возвращай больше!):\n'
-                'Полное юридическое название Вашей|Наименование организации|Создание|Последнее изменение|ИНН|Год регистрации|Сайт|Страна юрисдикции|Краткое описание проекта|Бизнес-модели|Страна Где базируется проект|Город Где базируется проект|Индустрии|Технологии|Стадия продукта|Видео о продукте|Проблема, которую решает проект|Целевая аудитория|Рынки, на которых Вы работаете|Продажи|Оборот в год Оборот в год (в USD)|Прямые конкуренты|Преимущества перед конкурентами|Количество сотрудников|Укажите, какие ключевые должности|Если вы В2В-, В2G-, B2B2C-, В2О- стартап: у|С кем был успешный кейс? Описание и|Заинтересованы ли вы в пилотирова|Предлагаемый кейс|Есть ли у Вас опыт взаимодействия|Объем ранее привлеченных инвестиц|Какую потребность Экосистемы Сбер|Подавались ранее в sber500?|Выручка за последний месяц|Выручка за последние 3 месяца|Количество активных или платящих|заменяет ли ваш продукт какие-либо аналогичные сервисы или компании|названия заменяемых сервисов/компаний|как именно вы заменяете перечисленные сервисы/компании|преимущества перед перечисленными сервисами/компаниями\n'
-                'ООО "ВАРТЕХ"|МБонус|2021-05-05 18:10:11|2022-07-29 13:39:21|7801690817|2020|https://vartech24.ru|Россия|МБонус - это первый в России сервис управления сдельной оплатой труда и сквозной мотивации продавцов, консультантов и партнеров, с мгновенным доступом к заработанным деньгам.||Россия|Санкт-Петербург|[FinTech, Retail, HR-Tech]|[Mobile, Payments and Transactions, SaaS, Computer Vision]|[MVP, первые продажи]||1. Автоматизация постановки задач, учета выполнения и взаиморасчетов с исполнителями. 2. Мгновенные выплаты физ лицам, самозанятым и ИП. 3. Увеличение продаж товаров/услуг/выполнения KPI. 4. Низкая лояльность персонала к работодателю. 5. Высокие финансовые издержки при работе с исполнителями.|1. Сервисы такси, доставки 3. Курьерские службы 4. Call-центры 5. Аптечные сети 6. Розничые магазины и производители: электроники, бытовых товаров, товаров для ремонта, парфюмерии и косметики, авто-товаров, БАД и лекарств, алкоголя, зоотоваров.|[Россия]|[Есть продажи в РФ]|44 780|Прямых конкурентов нет.|Возможность полностью автоматизировать сдельную оплату труда, запуск промо-акций мгновенно, рямая коммуникация с продавцами, озможность мгновенно выплачивать бонусы на любую карту или телефон, не нужны предоплаченные карты или промокоды, собственное фондирование для срочный выплат.|4|(ГЕНЕРАЛЬНЫЙ ДИРЕКТОР,Опыт предпринимательской деятельности более 10 лет. Собственные проекты в рознице и бьюти.);(Коммерческий директор,Опыт работы в крупных международных фарм компаниях 9 лет, опыт предпринимательской деятельности более 5 лет. Собственный проект аптечного партнерства.);(Менеджер по работе с клиентами,В продажа более 10 лет.);(ИТ-директор,Опыт в ИТ более 10 лет. Собственная ИТ компания.)|True||True|Автоматизация взаиморасчетов с исполнителями (самозанятые, ИП, сотрудники в найме) на основании выполненных задач, результатов. Возможность выплат вознаграждения/оклада по требованию исполнителя в любое время.||0|||||||||'
-            )
-
-            response = await self.client.responses.create(
-                model=self.model,
-                input=search_prompt,
-                tools=[{
-                    'type': 'file_search',
-                    'vector_store_ids': [self._file_manager._vector_store_id],
-                }],
-                include=['file_search_call.results'],
+            search_prompt = self._build_search_prompt(messages)
+            reserved_tokens = self._reserve_tokens([{'role': 'user', 'content': search_prompt}])
+
+            raw_response = await self._request(
+                lambda: self.client.responses.with_raw_response.create(
+                    model=self.model,
+                    input=search_prompt,
+                    tools=[{
+                        'type': 'file_search',
+                        'vector_store_ids': [self._file_manager._vector_store_id],
+                    }],
+                    include=['file_search_call.results'],
+                ),
+                reserved_tokens,
             )
+            response = raw_response.parse()
+            self._record_usage(reserved_tokens, response.usage)
 
             content = response.output[1].content[0].text.strip()
             logger.info(f'Получен ответ, длина: {len(content)} символов, текст: `{content}`')
@@ -155,12 +308,35 @@ class ExcelSearchStrategy(ModelStrategy):
             raise ValueError(f'Не удалось найти релевантную информацию: {e}')
 
 
+@dataclass
+class _InflightRequest:
+    """Выполняющийся запрос к модели и число вызовов, ожидающих его результат."""
+
+    task: asyncio.Future
+    waiters: int = 0
+
+
 class ModelAPI:
     """Фасад для взаимодействия с различными моделями."""
 
-    def __init__(self, strategy: ModelStrategy) -> None:
-        """Инициализирует API с выбранной стратегией."""
+    _inflight: Dict[str, _InflightRequest] = {}  # ключ запроса -> выполняющийся запрос к модели
+    coalesced_requests = 0
+
+    def __init__(
+        self,
+        strategy: ModelStrategy,
+        priority: RequestPriority = RequestPriority.ANALYSIS,
+        user_id: Optional[int] = None,
+        call_site: str = 'other',
+    ) -> None:
+        """Инициализирует API с выбранной стратегией, классом приоритета и пользователем для планировщика.
+
+        call_site — метка места вызова в метриках (parse, market, qa, ...).
+        """
         self._strategy = strategy
+        self.priority = priority
+        self.user_id = user_id
+        self.call_site = call_site
         logger.info(f'Инициализирован ModelAPI с стратегией {strategy.__class__.__name__}')
 
     @property
@@ -174,7 +350,167 @@ class ModelAPI:
         logger.info(f'Смена стратегии с {self._strategy.__class__.__name__} на {strategy.__class__.__name__}')
         self._strategy = strategy
 
-    async def get_response(self, messages: List[Dict[str, str]]) -> str:
-        """Получает ответ от модели с использованием текущей стратегии."""
+    async def get_response(self, messages: List[Dict[str, str]], bypass_cache: bool = False) -> str:
+        """Получает ответ от модели с использованием текущей стратегии.
+
+        Ответы кешируются по содержимому запроса. При bypass_cache=True кеш не читается,
+        но свежий ответ перезаписывает сохраненный (используется при повторной генерации).
+        Одновременные одинаковые запросы объединяются в один запрос к модели.
+        """
         logger.info(f'Запрос ответа через стратегию {self._strategy.__class__.__name__}')
-        return await self._strategy.get_response(messages)
+
+        record, token = start_call(self.call_site, self._model_name())
+        try:
+            cache = ResponseCache()
+            namespace = self._strategy.cache_namespace()
+            key = cache.make_key(namespace, messages)
+            if bypass_cache:
+                cache.mark_bypassed()
+            else:
+                cached_response = await cache.get(key)
+                if cached_response is not None:
+                    logger.info(f'Ответ получен из кеша ({key[:12]}), запрос к модели не выполнялся')
+                    record.outcome = 'cache_hit'
+                    return cached_response
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                # задача наследует контекст с record: стратегия дописывает в него токены, ожидания и повторы
+                inflight = _InflightRequest(asyncio.ensure_future(self._fetch_and_store(key, namespace, messages)))
+                self._inflight[key] = inflight
+                inflight.task.add_done_callback(functools.partial(self._forget_inflight, key))
+            else:
+                ModelAPI.coalesced_requests += 1
+                record.outcome = 'coalesced'
+                logger.info(f'Такой же запрос уже выполняется ({key[:12]}), ожидаем его результат')
+
+            # shield: отмена одного из ожидающих не отменяет общий запрос к модели, пока его ждут другие
+            inflight.waiters += 1
+            try:
+                return await asyncio.shield(inflight.task)
+            finally:
+                inflight.waiters -= 1
+                if not inflight.waiters and not inflight.task.done():
+                    # ожидающих не осталось (все отменены): освобождаем слот планировщика и бюджет лимитера
+                    self._cancel_inflight(key, inflight)
+        except Exception as e:
+            if record.outcome != 'coalesced':
+                record.outcome = 'error'
+                record.error = error_class(e)
+            raise
+        finally:
+            finish_call(record, token)
+
+    @classmethod
+    def _cancel_inflight(cls, key: str, inflight: _InflightRequest) -> None:
+        if cls._inflight.get(key) is inflight:
+            del cls._inflight[key]
+        inflight.task.cancel()
+        logger.info(f'Запрос к модели ({key[:12]}) отменен: результат больше никто не ожидает')
+
+    @classmethod
+    def _forget_inflight(cls, key: str, task: asyncio.Future) -> None:
+        inflight = cls._inflight.get(key)
+        if inflight is not None and inflight.task is task:
+            del cls._inflight[key]
+        if not task.cancelled():
+            task.exception()  # исключение получат ожидающие; помечаем как обработанное
+
+    async def _fetch_and_store(self, key: str, namespace: Dict[str, Any], messages: List[Dict[str, str]]) -> str:
+        strategy, response = await self._call_strategy(messages)
+        # ключ построен по основной модели: ответ резервной модели под ним выдавался бы за ответ основной
+        if strategy is self._strategy:
+            await ResponseCache().set(key, response, namespace=str(namespace.get('model')))
+        return response
+
+    def _model_name(self) -> str:
+        return getattr(self._strategy, 'model', None) or self._strategy.__class__.__name__
+
+    def _circuit_breaker(self) -> CircuitBreaker:
+        return get_circuit_breaker(self._model_name())
+
+    @staticmethod
+    async def _answer(strategy: ModelStrategy, messages: List[Dict[str, str]]) -> Tuple[ModelStrategy, str]:
+        return strategy, await strategy.get_response(messages)
+
+    async def _call_strategy(self, messages: List[Dict[str, str]]) -> Tuple[ModelStrategy, str]:
+        """Запрашивает модель, дождавшись своей очереди в планировщике; возвращает ответившую стратегию и ответ.
+
+        Медленные и сбойные ответы отслеживает автомат модели: пока p95 нарушает SLO, запрос
+        дублируется в резервную модель, после серии ошибок основная модель временно отключается.
+        """
+        fallback = self._strategy.fallback()
+        record = current_call()
+        async with LLMScheduler().slot(self.priority, self.user_id, cost=estimate_tokens(messages)) as queue_wait:
+            started_at = time.monotonic()
+            try:
+                return await self._circuit_breaker().call(
+                    lambda: self._answer(self._strategy, messages),
+                    (lambda: self._answer(fallback, messages)) if fallback is not None else None,
+                )
+            finally:
+                if record is not None:
+                    record.queue_wait = queue_wait
+                    record.latency = max(time.monotonic() - started_at - record.limiter_wait, 0.0)
+
+    async def stream_response(self, messages: List[Dict[str, str]], bypass_cache: bool = False) -> AsyncIterator[str]:
+        """Отдает ответ модели фрагментами; ответ из кеша отдается одним фрагментом."""
+        logger.info(f'Потоковый запрос через стратегию {self._strategy.__class__.__name__}')
+
+        record, token = start_call(self.call_site, self._model_name())
+        try:
+            cache = ResponseCache()
+            namespace = self._strategy.cache_namespace()
+            key = cache.make_key(namespace, messages) if cache.enabled else None
+            if key and not bypass_cache:
+                cached_response = await cache.get(key)
+                if cached_response is not None:
+                    logger.info(f'Ответ получен из кеша ({key[:12]}), запрос к модели не выполнялся')
+                    record.outcome = 'cache_hit'
+                    yield cached_response
+                    return
+            elif key:
+                cache.mark_bypassed()
+
+            # Поток нельзя хеджировать на середине: при разомкнутом автомате сразу читаем резервную модель
+            strategy, breaker = self._strategy, self._circuit_breaker()
+            if not breaker.allow_request():
+                strategy = self._strategy.fallback()
+                if strategy is None:
+                    raise CircuitOpenError(f'Модель {breaker.name} временно недоступна, попробуйте позже')
+                breaker.short_circuited += 1
+            # исход запроса к основной модели учитывается автоматом ровно один раз
+            unsettled = strategy is self._strategy
+            trial = unsettled and breaker.trial_in_flight
+
+            parts = []
+            cost = estimate_tokens(messages)
+            async with LLMScheduler().slot(self.priority, self.user_id, cost=cost) as queue_wait:
+                record.queue_wait = queue_wait
+                started_at = time.monotonic()
+                try:
+                    async for chunk in strategy.stream_response(messages):
+                        parts.append(chunk)
+                        yield chunk
+                    if unsettled:
+                        breaker.record_success(time.monotonic() - started_at)
+                        unsettled = False
+                except Exception as e:
+                    if unsettled:
+                        breaker.record_error(e, time.monotonic() - started_at, trial)
+                        unsettled = False
+                    raise
+                finally:
+                    record.latency = max(time.monotonic() - started_at - record.limiter_wait, 0.0)
+                    if unsettled and trial:
+                        # потребитель прекратил чтение (GeneratorExit, отмена): снимаем пробный запрос
+                        breaker.release_trial()
+
+            if key and strategy is self._strategy:
+                await cache.set(key, ''.join(parts).strip(), namespace=str(namespace.get('model')))
+        except Exception as e:
+            record.outcome = 'error'
+            record.error = error_class(e)
+            raise
+        finally:
+            finish_call(record, token)
@@ -0,0 +1,83 @@
+import logging
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import Config
+
+logger = logging.getLogger('bot')
+config = Config()
+
+
+class OpenAIClientRegistry:
+    """Общий на процесс реестр клиентов AsyncOpenAI с пулом keep-alive соединений (Singleton).
+
+    Клиенты создаются один раз на пару (API-ключ, base_url) и переиспользуются всеми стратегиями,
+    поэтому TLS-рукопожатие и установка соединения не повторяются на каждый запрос.
+    """
+
+    _instance = None
+
+    def __new__(cls) -> 'OpenAIClientRegistry':
+        if cls._instance is None:
+            logger.info('Создание экземпляра OpenAIClientRegistry (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._clients = {}
+        return cls._instance
+
+    @staticmethod
+    def _build_http_client() -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=config.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.OPENAI_KEEPALIVE_EXPIRY,
+        )
+        http2 = config.OPENAI_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning('Пакет h2 не установлен, HTTP/2 для OpenAI отключен')
+                http2 = False
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=limits,
+            timeout=httpx.Timeout(config.OPENAI_TIMEOUT, connect=config.OPENAI_CONNECT_TIMEOUT),
+        )
+
+    def get_client(self, api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """Возвращает общий клиент для указанного ключа, создавая его при первом обращении."""
+        api_key = api_key or config.OPENAI_API_KEY
+        base_url = base_url or config.OPENAI_BASE_URL
+        key = (api_key, base_url)
+        client = self._clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=self._build_http_client(),
+            )
+            self._clients[key] = client
+            logger.info(
+                f'Создан общий клиент OpenAI (base_url={base_url or "default"}, '
+                f'max_connections={config.OPENAI_MAX_CONNECTIONS}, http2={config.OPENAI_HTTP2})',
+            )
+        return client
+
+    async def close(self) -> None:
+        """Закрывает все клиенты и их пулы соединений (вызывается при остановке бота)."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.error(f'Ошибка при закрытии клиента OpenAI: {e}')
+        if clients:
+            logger.info(f'Закрыто клиентов OpenAI: {len(clients)}')
+
+
+def get_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """Возвращает общий клиент OpenAI из реестра."""
+    return OpenAIClientRegistry().get_client(api_key=api_key, base_url=base_url)
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
+
+import openpyxl
+
+from analysis_pipeline import AnalysisPipeline
+from config import Config
+from llm_scheduler import RequestPriority
+
+if TYPE_CHECKING:
+    from bot import InvestmentAnalysisProcessor
+
+logger = logging.getLogger('bot')
+config = Config()
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'  # анализ не выполнен или все этапы завершились ошибкой
+
+
+def read_company_list(path: str) -> List[str]:
+    """Читает список компаний: по одной в строке (.txt) или из первого столбца (.xlsx)."""
+    if Path(path).suffix.lower() == '.xlsx':
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        names = [
+            str(row[0]).strip()
+            for sheet in wb.worksheets
+            for row in sheet.iter_rows(values_only=True)
+            if row and row[0]
+        ]
+    else:
+        with open(path, encoding='utf-8') as f:
+            names = [line.strip() for line in f]
+
+    # убираем пустые строки и дубликаты, сохраняя порядок
+    return list(dict.fromkeys(name for name in names if name))
+
+
+@dataclass
+class PortfolioItem:
+    """Анализ одной компании портфеля."""
+
+    company_name: str
+    status: str = STATUS_QUEUED
+    results: Dict[str, str] = field(default_factory=dict)
+    failed_stages: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    duration: float = 0.0
+
+
+# Вызывается при каждом изменении статуса компании: (все компании портфеля, изменившаяся компания)
+ProgressCallback = Callable[[List[PortfolioItem], PortfolioItem], Awaitable[None]]
+
+
+class PortfolioAnalysis:
+    """Анализ списка компаний (рынок, конкуренты, синергия) с ограничением числа одновременных анализов.
+
+    Запросы идут с приоритетом BATCH через общий планировщик и лимитер, поэтому портфель
+    не вытесняет интерактивные запросы других пользователей.
+    """
+
+    def __init__(self, processor: 'InvestmentAnalysisProcessor', concurrency: Optional[int] = None) -> None:
+        self.processor = processor  # обработчик пользователя, запустившего портфель
+        self.concurrency = concurrency or config.PORTFOLIO_CONCURRENCY
+
+    async def _analyze(
+        self,
+        items: List[PortfolioItem],
+        item: PortfolioItem,
+        semaphore: asyncio.Semaphore,
+        on_progress: Optional[ProgressCallback],
+    ) -> None:
+        async with semaphore:
+            item.status = STATUS_RUNNING
+            await self._notify(on_progress, items, item)
+            started_at = time.monotonic()
+            analysis_params = {'name': item.company_name, 'market': 1, 'rivals': 1, 'synergy': 1}
+            try:
+                item.results = await self.processor.run_analysis(analysis_params, priority=RequestPriority.BATCH)
+                item.failed_stages = AnalysisPipeline().failed_stages(item.results)
+                item.status = STATUS_FAILED if len(item.failed_stages) == len(item.results) else STATUS_DONE
+            except Exception as e:
+                logger.error(f'[Portfolio] Ошибка анализа {item.company_name}: {e}')
+                item.status = STATUS_FAILED
+                item.error = str(e)
+            item.duration = time.monotonic() - started_at
+        await self._notify(on_progress, items, item)
+
+    @staticmethod
+    async def _notify(
+        on_progress: Optional[ProgressCallback], items: List[PortfolioItem], item: PortfolioItem,
+    ) -> None:
+        if on_progress is None:
+            return
+        try:
+            await on_progress(items, item)
+        except Exception as e:
+            logger.warning(f'[Portfolio] Не удалось обновить прогресс: {e}')
+
+    async def run(self, companies: List[str], on_progress: Optional[ProgressCallback] = None) -> List[PortfolioItem]:
+        """Анализирует все компании; ошибка одной компании не прерывает портфель."""
+        items = [PortfolioItem(company_name) for company_name in companies]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started_at = time.monotonic()
+        await asyncio.gather(*(self._analyze(items, item, semaphore, on_progress) for item in items))
+        logger.info(
+            f'[Portfolio] Компаний: {len(items)}, с ошибками: {sum(item.status == STATUS_FAILED for item in items)}, '
+            f'время {time.monotonic() - started_at:.1f}с',
+        )
+        return items
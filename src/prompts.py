@@ -1,15 +1,29 @@
 import logging
+import re
+from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
+from typing import Dict, Tuple, Union
 
 from keyboards_builder import DynamicKeyboard
 from models_api import ChatGPTFileStrategy, ChatGPTStrategy
+from semantic_cache import SemanticCache
 
 logger = logging.getLogger('bot')
 
 BASE_DIR = Path(__file__).parent.absolute()
 DEFAULT_PROMPTS_DIR = BASE_DIR / 'default_prompts'
 
+# Именованные плейсхолдеры в тексте промптов: имя -> как плейсхолдер записан в промпте
+PROMPT_PLACEHOLDERS = {'company': '[название компании]'}
+PLACEHOLDER_PATTERN = re.compile('|'.join(re.escape(text) for text in PROMPT_PLACEHOLDERS.values()))
+PLACEHOLDER_NAMES = {text: name for name, text in PROMPT_PLACEHOLDERS.items()}
+
+# Классический промпт вида 'РОЛЬ. ... КОНТЕКСТ. ...'
+ROLE_PATTERN = re.compile(r'РОЛЬ\.\s*(.*?)(?=\n\s*КОНТЕКСТ\.|\n\s*[А-ЯЁ]+\.|\Z)', re.DOTALL | re.IGNORECASE)
+CONTEXT_PATTERN = re.compile(r'КОНТЕКСТ\.\s*(.*?)(?=\n\s*[А-ЯЁ]+\.|\Z)', re.DOTALL | re.IGNORECASE)
+DEFAULT_ROLE = 'Ты профессиональный аналитик.'
+
 
 class DynamicEnum(Enum):
     @classmethod
@@ -43,6 +57,50 @@ class SystemPrompt(DynamicEnum):
     FILE_SUMMARY = 'file_summary'
 
 
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """Промпт, разобранный один раз при загрузке: роль, контекст и контекст, разрезанный по плейсхолдерам.
+
+    Подстановка значений — склейка готовых фрагментов, без регулярных выражений и повторного разбора.
+    """
+
+    source: str
+    role: str
+    context: str
+    parts: Tuple[Union[str, Tuple[str]], ...]  # текст или (имя плейсхолдера,)
+
+    @classmethod
+    def compile(cls, prompt_text: str) -> 'CompiledPrompt':
+        if not isinstance(prompt_text, str):
+            raise ValueError(f'Неподдерживаемый формат промпта: {type(prompt_text)}')
+        role_match = ROLE_PATTERN.search(prompt_text)
+        context_match = CONTEXT_PATTERN.search(prompt_text)
+        role = role_match.group(1).strip() if role_match else ''
+        context = context_match.group(1).strip() if context_match else ''
+        # Если не нашли структурированные части, используем весь текст как контекст
+        if not role and not context:
+            role, context = DEFAULT_ROLE, prompt_text.strip()
+
+        parts = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(context):
+            parts += [context[position:match.start()], (PLACEHOLDER_NAMES[match.group()],)]
+            position = match.end()
+        parts.append(context[position:])
+        return cls(prompt_text, role, context, tuple(part for part in parts if part))
+
+    @property
+    def placeholders(self) -> Tuple[str, ...]:
+        return tuple(part[0] for part in self.parts if isinstance(part, tuple))
+
+    def render(self, **values: str) -> str:
+        """Контекст промпта с подставленными значениями; плейсхолдер без значения остается как есть."""
+        return ''.join(
+            part if isinstance(part, str) else values.get(part[0], PROMPT_PLACEHOLDERS[part[0]])
+            for part in self.parts
+        )
+
+
 class SystemPrompts:
     """Класс для работы с системными промптами. Получение, обновление промптов."""
 
@@ -53,6 +111,7 @@ class SystemPrompts:
             logger.info(f'Создание экземпляра SystemPrompts')
             cls._instance = super(SystemPrompts, cls).__new__(cls)
             cls._instance.prompts = {}
+            cls._instance.compiled: Dict[SystemPrompt, CompiledPrompt] = {}
             cls._instance._initialized = False
         return cls._instance
 
@@ -73,6 +132,7 @@ class SystemPrompts:
                 logger.error(f'Файл промпта не найден: {filename}')
                 raise ValueError(f'Файла для дефолтного системного промпта {filename} не существует.')
             self.prompts[prompt_type] = self.read_file(filename)
+            self.compiled[prompt_type] = CompiledPrompt.compile(self.prompts[prompt_type])
             logger.debug(f'Загружен промпт {prompt_type.name}, размер: {len(self.prompts[prompt_type])} символов')
         logger.info(f'Загружено {len(self.prompts)} промптов')
 
@@ -113,6 +173,15 @@ class SystemPrompts:
                 raise ValueError(f'Промпта для {prompt_type} не найдено.')
         return prompt
 
+    def get_compiled_prompt(self, prompt_type: SystemPrompt) -> CompiledPrompt:
+        """Разобранный промпт; разбирается заново, только если текст промпта изменился."""
+        prompt = self.get_prompt(prompt_type)
+        compiled = self.compiled.get(prompt_type)
+        if compiled is None or compiled.source is not prompt:
+            compiled = self.compiled[prompt_type] = CompiledPrompt.compile(prompt)
+            logger.debug(f'Промпт {prompt_type.name} разобран, плейсхолдеры: {compiled.placeholders}')
+        return compiled
+
     def _reset_dynamic_keyboards(self) -> None:
         """Сбрасывает кеш всех динамических клавиатур после изменения промптов."""
         try:
@@ -125,9 +194,12 @@ class SystemPrompts:
         """Обновляет существующий промпт."""
         logger.info(f'Обновление промпта: {prompt_type.name}, размер: {len(content)} символов')
         self.prompts[prompt_type] = content
+        self.compiled[prompt_type] = CompiledPrompt.compile(content)
         filename = DEFAULT_PROMPTS_DIR / f'{prompt_type.value}.txt'
         self.update_or_create_file(content, filename)
         self._reset_dynamic_keyboards()
+        # результаты, полученные со старым промптом, больше не выдаем по похожим запросам
+        SemanticCache().clear()
         logger.info(f'Промпт {prompt_type.name} успешно обновлен')
 
     def add_new_prompt(self, name: str, display_name: str, system_content: str, detail_content: str = None) -> None:
@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger('bot')
+config = Config()
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Разбирает длительность из заголовков OpenAI ('20ms', '1s', '6m0s', '1h2m3.5s') в секунды."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Возвращает паузу из заголовков retry-after-ms / retry-after в секундах."""
+    if not headers:
+        return None
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Грубая оценка числа токенов запроса (примерно 4 символа на токен)."""
+    chars = sum(len(str(msg.get('content', ''))) for msg in messages)
+    return chars // 4 + 4 * len(messages) + 3
+
+
+class TokenBucket:
+    """Ведро токенов с равномерным пополнением до емкости за минуту."""
+
+    def __init__(self, capacity: float) -> None:
+        self.capacity = capacity
+        self.level = capacity
+        self._updated_at = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """Через сколько секунд в ведре окажется amount единиц (0 — уже есть)."""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate if self.rate else float('inf')
+
+    def consume(self, amount: float) -> None:
+        self.level -= amount
+
+    def set_capacity(self, capacity: float) -> None:
+        self.refill()
+        self.level = min(self.level + max(capacity - self.capacity, 0), capacity)
+        self.capacity = capacity
+
+    def sync_remaining(self, remaining: float) -> None:
+        """Подстраивает остаток под значение, которое сообщил сервер (сервер точнее локального учета)."""
+        self.refill()
+        self.level = min(self.level, remaining)
+
+
+class AdaptiveRateLimiter:
+    """Лимитер запросов к OpenAI с бюджетами RPM и TPM, подстраивающийся под заголовки x-ratelimit-*."""
+
+    def __init__(self, name: str, rpm: int, tpm: int, headroom: float) -> None:
+        self.name = name
+        self.headroom = headroom
+        self._requests = TokenBucket(rpm * headroom)
+        self._tokens = TokenBucket(tpm * headroom)
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    @property
+    def rpm(self) -> float:
+        return self._requests.capacity
+
+    @property
+    def tpm(self) -> float:
+        return self._tokens.capacity
+
+    async def acquire(self, tokens: int) -> float:
+        """Ждет, пока в бюджете будет один запрос и tokens токенов; возвращает время ожидания."""
+        started_at = time.monotonic()
+        async with self._lock:  # очередь FIFO: пока первый ждет бюджет, остальные стоят за ним
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._requests.refill()
+                self._tokens.refill()
+                wait = max(self._requests.time_until(1), self._tokens.time_until(tokens))
+                if wait <= 0:
+                    self._requests.consume(1)
+                    self._tokens.consume(min(tokens, self._tokens.capacity))
+                    break
+                await asyncio.sleep(wait)
+
+        waited = time.monotonic() - started_at
+        if waited > 0.01:
+            self.throttled += 1
+            self.total_wait += waited
+            logger.debug(f'[RateLimiter {self.name}] Ожидание бюджета {waited:.2f}с (tokens={tokens})')
+        return waited
+
+    def record_usage(self, reserved_tokens: int, used_tokens: Optional[int]) -> None:
+        """Возвращает в бюджет неиспользованные токены или списывает перерасход."""
+        if used_tokens is None:
+            return
+        self._tokens.refill()
+        self._tokens.level = min(self._tokens.capacity, self._tokens.level + reserved_tokens - used_tokens)
+
+    def block_for(self, seconds: float) -> None:
+        """Приостанавливает выдачу бюджета (например, по Retry-After)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Обновляет лимиты и остатки по заголовкам x-ratelimit-* ответа OpenAI."""
+        if not headers:
+            return
+        for bucket, kind in ((self._requests, 'requests'), (self._tokens, 'tokens')):
+            limit = headers.get(f'x-ratelimit-limit-{kind}')
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            try:
+                if limit:
+                    capacity = float(limit) * self.headroom
+                    if abs(capacity - bucket.capacity) > 1e-6:
+                        logger.info(
+                            f'[RateLimiter {self.name}] Лимит {kind}/мин обновлен: '
+                            f'{bucket.capacity:.0f} → {capacity:.0f}',
+                        )
+                        bucket.set_capacity(capacity)
+                if remaining:
+                    reserve = bucket.capacity / self.headroom - bucket.capacity
+                    bucket.sync_remaining(float(remaining) - reserve)
+            except ValueError:
+                logger.debug(f'[RateLimiter {self.name}] Некорректные заголовки лимитов {kind}: {limit}, {remaining}')
+
+        if headers.get('x-ratelimit-remaining-requests') == '0':
+            reset = parse_duration(headers.get('x-ratelimit-reset-requests'))
+            if reset:
+                self.block_for(reset)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            'rpm': round(self.rpm),
+            'tpm': round(self.tpm),
+            'throttled': self.throttled,
+            'total_wait': round(self.total_wait, 2),
+        }
+
+
+class RateLimiterRegistry:
+    """Реестр лимитеров: один лимитер на пару (API-ключ, модель) на весь процесс (Singleton)."""
+
+    _instance = None
+
+    def __new__(cls) -> 'RateLimiterRegistry':
+        if cls._instance is None:
+            logger.info('Создание экземпляра RateLimiterRegistry (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._limiters = {}
+        return cls._instance
+
+    def get(self, api_key: str, model: str) -> AdaptiveRateLimiter:
+        key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+        key: Tuple[str, str] = (key_hash, model)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(
+                name=f'{model}@{key_hash}',
+                rpm=config.OPENAI_DEFAULT_RPM,
+                tpm=config.OPENAI_DEFAULT_TPM,
+                headroom=config.OPENAI_RATE_LIMIT_HEADROOM,
+            )
+            self._limiters[key] = limiter
+        return limiter
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        return {limiter.name: limiter.get_stats() for limiter in self._limiters.values()}
+
+
+def get_rate_limiter(model: str, api_key: Optional[str] = None) -> AdaptiveRateLimiter:
+    """Возвращает общий лимитер для модели и API-ключа."""
+    return RateLimiterRegistry().get(api_key or config.OPENAI_API_KEY, model)
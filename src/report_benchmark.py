@@ -0,0 +1,170 @@
+"""Сравнение формирования финального DOCX отчета: текущий build_final_report против прежней функции.
+
+Текущий путь — копия шаблона с кешированными стилями и однопроходный конвертер markdown; прежний — без изменений:
+новый Document() на каждый отчет, add_heading и построчный add_formatted_content со стилями по имени.
+
+Пример запуска:
+    python report_benchmark.py --qa 10 50 200 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from docx import Document
+from docx.document import Document as DocxDocument
+
+from report_renderer import LAST_SECTION, SECTION_TITLES, build_final_report, load_report_template
+
+# (название компании, результаты этапов, история Q&A) -> путь к DOCX
+ReportBuilder = Callable[[str, Dict[str, str], List[Dict[str, str]]], str]
+
+ANSWER_TEMPLATE = (
+    '# Итоги\n'
+    'Компания **{index}** показывает устойчивый рост выручки и доли рынка.\n\n'
+    '## Ключевые факторы\n'
+    '- Рост онлайн-продаж на **25%** год к году\n'
+    '- Расширение логистической сети\n'
+    '* Снижение стоимости привлечения клиента\n\n'
+    '1. Рыночная позиция: лидер сегмента\n'
+    '2. Риски: регуляторные ограничения\n'
+    '3. Синергия: платежные сервисы и кредитование\n\n'
+    '**Вывод**\n'
+    'Сделка целесообразна при сохранении текущих темпов роста и контроле над издержками.'
+)
+
+
+def legacy_add_formatted_content(doc: DocxDocument, content: str) -> None:
+    """Прежний add_formatted_content: построчный разбор markdown, стили назначаются по имени."""
+    if not content:
+        return
+
+    for para_text in content.split('\n\n'):
+        if not para_text.strip():
+            continue
+
+        for line in para_text.strip().split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+
+            if line.startswith('##'):
+                heading_text = line.replace('##', '').strip()
+                if heading_text:
+                    doc.add_heading(heading_text, level=3)
+            elif line.startswith('#'):
+                heading_text = line.replace('#', '').strip()
+                if heading_text:
+                    doc.add_heading(heading_text, level=2)
+            elif line.startswith('**') and line.endswith('**'):
+                para = doc.add_paragraph()
+                run = para.add_run(line.replace('**', ''))
+                run.bold = True
+            elif line.startswith(('- ', '* ')):
+                bullet_text = line[2:].strip()
+                if bullet_text:
+                    doc.add_paragraph(bullet_text, style='List Bullet')
+            elif line[0].isdigit() and '. ' in line:
+                numbered_text = line.split('. ', 1)[1]
+                if numbered_text:
+                    doc.add_paragraph(numbered_text, style='List Number')
+            else:
+                para = doc.add_paragraph()
+                # нечетные части между ** — жирный текст
+                for i, part in enumerate(line.split('**')):
+                    if part:
+                        run = para.add_run(part)
+                        if i % 2 == 1:
+                            run.bold = True
+
+
+def legacy_build_final_report(
+    company_name: str, analysis_results: Dict[str, str], qa_history: List[Dict[str, str]],
+) -> str:
+    """Прежний build_final_report: новый Document() на каждый отчет, add_heading и legacy_add_formatted_content."""
+    doc = Document()
+
+    title = doc.add_heading(f'Инвестиционный анализ: {company_name}', 0)
+    title.alignment = 1  # по центру
+    date_paragraph = doc.add_paragraph(f'Дата создания отчета: {datetime.now().strftime("%d.%m.%Y")}')
+    date_paragraph.alignment = 1
+    doc.add_page_break()
+
+    for number, (section, section_title) in enumerate(SECTION_TITLES.items(), 1):
+        if section not in analysis_results:
+            continue
+        doc.add_heading(f'{number}. {section_title}', level=1)
+        legacy_add_formatted_content(doc, analysis_results[section])
+        if section != LAST_SECTION or qa_history:
+            doc.add_page_break()
+
+    if qa_history:
+        doc.add_heading(f'{len(SECTION_TITLES) + 1}. Дополнительные вопросы и ответы', level=1)
+        for i, qa in enumerate(qa_history, 1):
+            question_para = doc.add_paragraph()
+            question_para.add_run(f'Вопрос {i}: ').bold = True
+            question_para.add_run(qa['question'])
+
+            answer_para = doc.add_paragraph()
+            answer_para.add_run('Ответ: ').bold = True
+            legacy_add_formatted_content(doc, qa['answer'])
+
+            if i < len(qa_history):
+                doc.add_paragraph()
+
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='_final.docx')
+    doc.save(temp_file.name)
+    temp_file.close()
+    return temp_file.name
+
+
+def make_report_data(qa_count: int) -> Tuple[Dict[str, str], List[Dict[str, str]]]:
+    """Результаты всех этапов и история Q&A заданной длины из шаблонного ответа."""
+    analysis_results = {
+        section: '\n\n'.join(ANSWER_TEMPLATE.format(index=i) for i in range(5)) for section in SECTION_TITLES
+    }
+    qa_history = [
+        {'question': f'Вопрос {i} о перспективах компании?', 'answer': ANSWER_TEMPLATE.format(index=i)}
+        for i in range(qa_count)
+    ]
+    return analysis_results, qa_history
+
+
+def measure(build: ReportBuilder, qa_count: int, repeat: int) -> Tuple[float, float]:
+    """Медианное время (с) и пиковая память (МБ) формирования одного отчета."""
+    analysis_results, qa_history = make_report_data(qa_count)
+    durations = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        path = build('Тестовая компания', analysis_results, qa_history)
+        durations.append(time.perf_counter() - started_at)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        os.remove(path)
+    return statistics.median(durations), peak / 1024 / 1024
+
+
+def main(args: argparse.Namespace) -> None:
+    """Печатает таблицу времени и памяти обоих путей для каждого размера истории Q&A."""
+    load_report_template()  # шаблон загружается один раз на процесс, как в пуле формирования отчетов
+    print(f'{"Q&A":>6} | {"прежний путь":>22} | {"шаблон":>22} | ускорение')
+    for qa_count in args.qa:
+        legacy_time, legacy_memory = measure(legacy_build_final_report, qa_count, args.repeat)
+        template_time, template_memory = measure(build_final_report, qa_count, args.repeat)
+        print(
+            f'{qa_count:>6} | {legacy_time:>8.3f}с {legacy_memory:>9.1f} МБ | '
+            f'{template_time:>8.3f}с {template_memory:>9.1f} МБ | {legacy_time / template_time:.1f}x',
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сравнение скорости и памяти формирования DOCX отчетов')
+    parser.add_argument('--qa', type=int, nargs='+', default=[10, 50, 200], help='размеры истории Q&A')
+    parser.add_argument('--repeat', type=int, default=3, help='повторов на каждый размер')
+    main(parser.parse_args())
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from report_renderer import ReportRenderer
+
+logger = logging.getLogger('bot')
+config = Config()
+
+CacheKey = Tuple[str, int]  # (хеш результатов анализа, число вопросов-ответов)
+
+
+def results_digest(company_name: str, analysis_results: Dict[str, str]) -> str:
+    """Хеш названия компании и результатов всех этапов анализа."""
+    payload = json.dumps([company_name, analysis_results], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def qa_prefix_digests(qa_history: List[Dict[str, str]]) -> List[str]:
+    """Хеши всех префиксов истории Q&A: digests[n] — хеш первых n пар."""
+    digest = hashlib.sha256()
+    digests = [digest.hexdigest()]
+    for qa in qa_history:
+        digest.update(json.dumps([qa['question'], qa['answer']], ensure_ascii=False).encode('utf-8'))
+        digests.append(digest.hexdigest())
+    return digests
+
+
+@dataclass
+class CachedReport:
+    path: str
+    qa_digest: str  # хеш пар вопрос-ответ, вошедших в отчет
+    created_at: float = field(default_factory=time.time)
+
+
+class FinalReportCache:
+    """Готовые финальные отчеты по ключу (хеш результатов анализа, число Q&A) (Singleton).
+
+    Повторное скачивание или отправка на почту отдают готовый файл. Если после прошлого отчета
+    появились новые вопросы, в копию готового отчета дописывается только раздел Q&A.
+    Файл, выданный get_report, закреплен до вызова release: вытеснение из кеша его не удаляет.
+    """
+
+    _instance = None
+
+    def __new__(cls) -> 'FinalReportCache':
+        if cls._instance is None:
+            logger.info('Создание экземпляра FinalReportCache (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.cache_dir = Path(config.REPORT_CACHE_DIR)
+        self.max_entries = config.REPORT_CACHE_MAX_ENTRIES
+        self.ttl = config.REPORT_CACHE_TTL
+        self._entries: 'OrderedDict[CacheKey, CachedReport]' = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pins: Dict[str, int] = {}  # путь -> число незавершенных отправок файла
+        self.hits = 0
+        self.extended = 0
+        self.rendered = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # индекс хранится в памяти, поэтому файлы прошлого запуска бота не используются
+        for stale in self.cache_dir.glob('*.docx'):
+            stale.unlink(missing_ok=True)
+
+    def _evict(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key)
+        if entry.path not in self._pins:  # закрепленный файл удалит release
+            Path(entry.path).unlink(missing_ok=True)
+        lock = self._locks.get(key[0])
+        if lock is not None and not lock.locked() and all(other[0] != key[0] for other in self._entries):
+            del self._locks[key[0]]
+
+    def _evict_expired(self) -> None:
+        now = time.time()
+        for key in [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl]:
+            self._evict(key)
+
+    def _valid(self, key: CacheKey, qa_digest: str) -> Optional[CachedReport]:
+        entry = self._entries.get(key)
+        if entry is None or entry.qa_digest != qa_digest or not os.path.exists(entry.path):
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: CacheKey, path: str, qa_digest: str) -> None:
+        if key in self._entries:
+            if self._entries[key].path == path:
+                del self._entries[key]  # файл по этому пути только что сформирован заново
+            else:
+                self._evict(key)
+        while len(self._entries) >= self.max_entries:
+            self._evict(next(iter(self._entries)))
+        self._entries[key] = CachedReport(path, qa_digest)
+
+    def is_cached_file(self, path: str) -> bool:
+        """Файл принадлежит кешу и удаляется только при вытеснении."""
+        return any(entry.path == path for entry in self._entries.values())
+
+    def _pin(self, path: str) -> None:
+        self._pins[path] = self._pins.get(path, 0) + 1
+
+    def release(self, path: str) -> None:
+        """Файл отчета больше не используется: снимает закрепление и удаляет файл, если его нет в кеше.
+
+        Файл вне кеша — вытесненный, пока его отправляли, или запасной отчет, сформированный без кеша.
+        """
+        count = self._pins.pop(path, 0) - 1
+        if count > 0:
+            self._pins[path] = count
+        elif not self.is_cached_file(path):
+            Path(path).unlink(missing_ok=True)
+
+    async def get_report(
+        self, company_name: str, analysis_results: Dict[str, str], qa_history: List[Dict[str, str]],
+    ) -> str:
+        """Путь к финальному отчету: из кеша, дописанный из отчета с меньшим числом Q&A или сформированный заново.
+
+        Файл закреплен за вызывающим, после отправки нужно вызвать release(path).
+        """
+        digest = results_digest(company_name, analysis_results)
+        qa_digests = qa_prefix_digests(qa_history)
+        qa_count = len(qa_history)
+        lock = self._locks.setdefault(digest, asyncio.Lock())
+        async with lock:
+            self._evict_expired()
+            cached = self._valid((digest, qa_count), qa_digests[qa_count])
+            if cached is not None:
+                self.hits += 1
+                logger.info(f'[FinalReportCache] Отчет {company_name} ({qa_count} Q&A) из кеша')
+                self._pin(cached.path)
+                return cached.path
+
+            path = str(self.cache_dir / f'{digest[:24]}_{qa_count}_{qa_digests[qa_count][:8]}.docx')
+            base_count = next(
+                (count for count in range(qa_count - 1, -1, -1) if self._valid((digest, count), qa_digests[count])),
+                None,
+            )
+            if base_count is not None:
+                base = self._entries[(digest, base_count)]
+                # пока отчет дописывается, базовый файл может вытеснить запрос по другому анализу
+                self._pin(base.path)
+                try:
+                    await ReportRenderer().extend_final_report(
+                        base.path, analysis_results, qa_history, base_count, path,
+                    )
+                finally:
+                    self.release(base.path)
+                self.extended += 1
+                logger.info(
+                    f'[FinalReportCache] Отчет {company_name}: дописано Q&A {base_count + 1}–{qa_count} '
+                    'в готовый отчет',
+                )
+            else:
+                await ReportRenderer().render_final_report(company_name, analysis_results, qa_history, path)
+                self.rendered += 1
+            self._store((digest, qa_count), path, qa_digests[qa_count])
+            self._pin(path)
+        return path
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'extended': self.extended,
+            'rendered': self.rendered,
+        }
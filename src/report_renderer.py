@@ -0,0 +1,372 @@
+import asyncio
+import copy
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from docx import Document
+from docx.document import Document as DocxDocument
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+from config import Config
+from markdown_docx import render_markdown
+
+logger = logging.getLogger('bot')
+config = Config()
+
+# Заголовки разделов отчета в порядке этапов анализа
+SECTION_TITLES = {
+    'market': 'Рыночный анализ',
+    'rivals': 'Анализ конкурентов',
+    'synergy': 'Анализ синергии',
+}
+LAST_SECTION = list(SECTION_TITLES)[-1]
+
+
+# Стили, которые использует отчет; их идентификаторы разрешаются один раз при загрузке шаблона
+HEADING_STYLES = {0: 'Title', 1: 'Heading 1', 2: 'Heading 2', 3: 'Heading 3', 4: 'Heading 4'}
+REPORT_STYLES = (
+    *HEADING_STYLES.values(),
+    'List Bullet', 'List Bullet 2', 'List Bullet 3', 'List Number', 'List Number 2', 'List Number 3',
+    'Quote', 'Table Grid',
+)
+
+
+class ReportTemplate:
+    """Базовый шаблон отчета: разбирается один раз на процесс, каждый отчет начинается с его копии.
+
+    Из файла шаблона (REPORT_TEMPLATE_PATH) берутся стили, поля и колонтитулы, содержимое тела удаляется.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._document = Document(path) if path else Document()
+        body = self._document.element.body
+        for child in list(body):
+            if child.tag != qn('w:sectPr'):
+                body.remove(child)
+        styles = self._document.styles
+        self.style_ids = {name: styles[name].style_id for name in REPORT_STYLES if name in styles}
+
+    def new_document(self) -> DocxDocument:
+        return copy.deepcopy(self._document)
+
+
+_template: Optional[ReportTemplate] = None
+
+
+def load_report_template() -> ReportTemplate:
+    """Шаблон отчета текущего процесса; загружается при первом обращении."""
+    global _template
+    if _template is None:
+        _template = ReportTemplate(config.REPORT_TEMPLATE_PATH or None)
+    return _template
+
+
+class ReportWriter:
+    """Добавляет абзацы в копию шаблона, назначая стили по заранее найденным идентификаторам.
+
+    python-docx при назначении стиля по имени или объекту каждый раз перебирает все стили документа,
+    что на больших отчетах занимает большую часть времени формирования.
+    """
+
+    def __init__(self, template: Optional[ReportTemplate] = None, path: Optional[str] = None) -> None:
+        """Начинает отчет с копии шаблона или открывает path — готовый отчет из того же шаблона, чтобы дописать его."""
+        template = template or load_report_template()
+        self.doc = Document(path) if path else template.new_document()
+        self.style_ids = template.style_ids
+
+    def paragraph(self, text: str = '', style: Optional[str] = None) -> Paragraph:
+        paragraph = self.doc.add_paragraph(text)
+        if style in self.style_ids:
+            paragraph._p.style = self.style_ids[style]
+        return paragraph
+
+    def heading(self, text: str, level: int) -> Paragraph:
+        return self.paragraph(text, HEADING_STYLES[level])
+
+    def table(self, rows: int, columns: int) -> Table:
+        table = self.doc.add_table(rows, columns)
+        if 'Table Grid' in self.style_ids:
+            table._tbl.tblStyle_val = self.style_ids['Table Grid']
+        return table
+
+    def page_break(self) -> None:
+        self.doc.add_page_break()
+
+    def save(self, suffix: str, path: Optional[str] = None) -> str:
+        """Сохраняет отчет в path или во временный файл и возвращает путь."""
+        if path:
+            self.doc.save(path)
+            return path
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        self.doc.save(temp_file.name)
+        temp_file.close()
+        return temp_file.name
+
+
+def build_analysis_report(
+    company_name: str, analysis_results: Dict[str, str], writer: Optional[ReportWriter] = None,
+) -> str:
+    """Создает DOCX отчет с результатами анализа и возвращает путь к временному файлу."""
+    writer = writer or ReportWriter()
+    writer.heading(f'Анализ инвестиционной привлекательности: {company_name}', 0)
+
+    for section, section_title in SECTION_TITLES.items():
+        if section not in analysis_results:
+            continue
+        writer.heading(section_title, 1)
+        writer.paragraph(analysis_results[section])
+        if section != LAST_SECTION:
+            writer.page_break()
+
+    return writer.save('.docx')
+
+
+def _append_qa(
+    writer: ReportWriter, analysis_results: Dict[str, str], qa_history: List[Dict[str, str]], start: int = 0,
+) -> None:
+    """Добавляет вопросы-ответы начиная с номера start; при start == 0 — вместе с заголовком раздела."""
+    if start == 0:
+        if LAST_SECTION in analysis_results:
+            writer.page_break()
+        writer.heading(f'{len(SECTION_TITLES) + 1}. Дополнительные вопросы и ответы', 1)
+
+    for i, qa in enumerate(qa_history[start:], start + 1):
+        if i > 1:
+            writer.paragraph()  # отступ между парами вопрос-ответ
+
+        question_para = writer.paragraph()
+        question_para.add_run(f'Вопрос {i}: ').bold = True
+        question_para.add_run(qa['question'])
+
+        writer.paragraph().add_run('Ответ: ').bold = True
+        render_markdown(writer, qa['answer'])
+
+
+def build_final_report(
+    company_name: str,
+    analysis_results: Dict[str, str],
+    qa_history: List[Dict[str, str]],
+    writer: Optional[ReportWriter] = None,
+    path: Optional[str] = None,
+) -> str:
+    """Создает финальный DOCX отчет с результатами анализа и вопросами-ответами."""
+    writer = writer or ReportWriter()
+
+    writer.heading(f'Инвестиционный анализ: {company_name}', 0).alignment = 1  # по центру
+    writer.paragraph(f'Дата создания отчета: {datetime.now().strftime("%d.%m.%Y")}').alignment = 1
+    writer.page_break()
+
+    for number, (section, section_title) in enumerate(SECTION_TITLES.items(), 1):
+        if section not in analysis_results:
+            continue
+        writer.heading(f'{number}. {section_title}', 1)
+        render_markdown(writer, analysis_results[section])
+        if section != LAST_SECTION:
+            writer.page_break()
+
+    if qa_history:
+        _append_qa(writer, analysis_results, qa_history)
+
+    return writer.save('_final.docx', path)
+
+
+def extend_final_report(
+    base_path: str,
+    analysis_results: Dict[str, str],
+    qa_history: List[Dict[str, str]],
+    start: int,
+    path: Optional[str] = None,
+) -> str:
+    """Дописывает в готовый финальный отчет с start вопросами-ответами остальные пары из qa_history."""
+    writer = ReportWriter(path=base_path)
+    _append_qa(writer, analysis_results, qa_history, start)
+    return writer.save('_final.docx', path)
+
+
+def build_portfolio_report(companies: List[Dict[str, Any]]) -> str:
+    """Сводный DOCX отчет по портфелю: таблица статусов этапов и раздел на каждую компанию.
+
+    companies — словари с полями company_name, results, failed_stages и error (PortfolioItem).
+    """
+    writer = ReportWriter()
+    writer.heading(f'Портфельный анализ (компаний: {len(companies)})', 0).alignment = 1
+    writer.paragraph(f'Дата создания отчета: {datetime.now().strftime("%d.%m.%Y")}').alignment = 1
+
+    writer.heading('Сводка', 1)
+    table = writer.table(len(companies) + 1, len(SECTION_TITLES) + 2)
+    for cell, text in zip(table.rows[0].cells, ('№', 'Компания', *SECTION_TITLES.values())):
+        cell.paragraphs[0].add_run(text).bold = True
+    for number, (company, row) in enumerate(zip(companies, table.rows[1:]), 1):
+        statuses = [
+            'ошибка' if company['error'] or section in company['failed_stages'] else
+            'готово' if section in company['results'] else '—'
+            for section in SECTION_TITLES
+        ]
+        for cell, text in zip(row.cells, (str(number), company['company_name'], *statuses)):
+            cell.text = text
+
+    for number, company in enumerate(companies, 1):
+        writer.page_break()
+        writer.heading(f'{number}. {company["company_name"]}', 1)
+        if company['error']:
+            writer.paragraph(f'Анализ не выполнен: {company["error"]}')
+            continue
+        for section, section_title in SECTION_TITLES.items():
+            if section in company['results']:
+                writer.heading(section_title, 2)
+                render_markdown(writer, company['results'][section], heading_offset=2)
+
+    return writer.save('_portfolio.docx')
+
+
+class ReportRenderTimeoutError(Exception):
+    pass
+
+
+def _partial_path(path: str) -> str:
+    """Уникальный путь рядом с path: процесс пишет отчет туда, на место path он переносится только дождавшись."""
+    root, ext = os.path.splitext(path)
+    return f'{root}.{uuid.uuid4().hex[:12]}.partial{ext}'
+
+
+def _discard_abandoned_report(future: Future) -> None:
+    """Удаляет файл отчета, который процесс дописал уже после того, как его перестали ждать.
+
+    Это всегда собственный файл процесса: отчет по тому же пути мог быть сформирован заново и уже отдан.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        os.remove(future.result())
+    except OSError as e:
+        logger.warning(f'[ReportRenderer] Не удалось удалить брошенный отчет {future.result()}: {e}')
+
+
+class ReportRenderer:
+    """Пул процессов для формирования DOCX отчетов (Singleton).
+
+    python-docx работает синхронно и на длинных отчетах занимает процессор на секунды; в пуле процессов
+    это не останавливает цикл событий бота и не блокирует обработку сообщений других пользователей.
+    """
+
+    _instance = None
+
+    def __new__(cls) -> 'ReportRenderer':
+        if cls._instance is None:
+            logger.info('Создание экземпляра ReportRenderer (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.workers = config.REPORT_RENDER_WORKERS
+        self.timeout = config.REPORT_RENDER_TIMEOUT
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0  # отчеты, отправленные в пул и еще не готовые
+        self.rendered = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.total_time = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: дочерний процесс не наследует потоки и блокировки родителя (SQLite, логирование)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=load_report_template,
+            )
+            logger.info(f'[ReportRenderer] Запущен пул из {self.workers} процессов')
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """Отчеты, которые ждут свободного процесса."""
+        return max(0, self.pending - self.workers)
+
+    async def _render(self, func: Callable[..., str], *args: object, path: Optional[str] = None) -> str:
+        """Формирует отчет в пуле процессов и возвращает путь к нему.
+
+        С заданным path процесс пишет в собственный временный файл, который переносится на место path,
+        только если результат дождались: брошенный по таймауту процесс не затрет и не удалит файл path.
+        """
+        started_at = time.monotonic()
+        self.pending += 1
+        if path is not None:
+            args = (*args, _partial_path(path))
+        future = self._get_executor().submit(func, *args)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # процесс нельзя прервать: он освободится, когда допишет документ, а файл будет удален
+            future.add_done_callback(_discard_abandoned_report)
+            self.timeouts += 1
+            logger.error(f'[ReportRenderer] {func.__name__} не уложился в {self.timeout:g}с')
+            raise ReportRenderTimeoutError(f'Отчет не сформирован за {self.timeout:g}с')
+        except asyncio.CancelledError:
+            future.add_done_callback(_discard_abandoned_report)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        if path is not None:
+            os.replace(result, path)
+        else:
+            path = result
+        elapsed = time.monotonic() - started_at
+        self.rendered += 1
+        self.total_time += elapsed
+        logger.info(f'[ReportRenderer] {func.__name__}: {path} за {elapsed:.2f}с, в очереди {self.queue_depth}')
+        return path
+
+    async def render_analysis_report(self, company_name: str, analysis_results: Dict[str, str]) -> str:
+        return await self._render(build_analysis_report, company_name, analysis_results)
+
+    async def render_final_report(
+        self,
+        company_name: str,
+        analysis_results: Dict[str, str],
+        qa_history: List[Dict[str, str]],
+        path: Optional[str] = None,
+    ) -> str:
+        return await self._render(build_final_report, company_name, analysis_results, qa_history, None, path=path)
+
+    async def extend_final_report(
+        self,
+        base_path: str,
+        analysis_results: Dict[str, str],
+        qa_history: List[Dict[str, str]],
+        start: int,
+        path: Optional[str] = None,
+    ) -> str:
+        return await self._render(extend_final_report, base_path, analysis_results, qa_history, start, path=path)
+
+    async def render_portfolio_report(self, companies: List[Dict[str, Any]]) -> str:
+        return await self._render(build_portfolio_report, companies)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'in_flight': min(self.pending, self.workers),
+            'queue_depth': self.queue_depth,
+            'rendered': self.rendered,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'avg_time': round(self.total_time / self.rendered, 2) if self.rendered else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger('bot')
+config = Config()
+
+
+@dataclass
+class CacheStats:
+    """Счетчики обращений к кешу ответов."""
+
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['hits'] = self.hits
+        data['hit_rate'] = round(self.hit_rate, 4)
+        return data
+
+
+class MemoryCacheTier:
+    """Быстрый LRU-кеш в памяти процесса с TTL."""
+
+    def __init__(self, max_items: int, ttl: int) -> None:
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        created_at, value = item
+        if time.time() - created_at > self.ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, created_at: Optional[float] = None) -> int:
+        """Сохраняет значение и возвращает количество вытесненных элементов."""
+        self._items[key] = (created_at or time.time(), value)
+        self._items.move_to_end(key)
+        evicted = 0
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SQLiteCacheTier:
+    """Дисковый кеш в SQLite: переживает перезапуск бота, вытесняет давно не читавшиеся записи."""
+
+    def __init__(self, db_path: str, max_items: int, ttl: int) -> None:
+        self.db_path = db_path
+        self.max_items = max_items
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, namespace TEXT, response TEXT NOT NULL, '
+                'created_at REAL NOT NULL, accessed_at REAL NOT NULL)',
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)')
+            self._conn.commit()
+            # число записей ведется в памяти: get_stats вызывается из цикла событий и не должен ждать диск
+            self._rows = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        logger.info(f'Дисковый кеш ответов: {db_path}')
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT created_at, response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._conn.commit()
+                self._rows -= 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+        return row[0], row[1]
+
+    def set(self, key: str, namespace: str, value: str) -> int:
+        """Сохраняет значение и возвращает количество вытесненных записей."""
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute('SELECT 1 FROM responses WHERE key = ?', (key,)).fetchone() is not None
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, namespace, response, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, namespace, value, now, now),
+            )
+            rows = self._rows + (not exists)
+            expired = self._conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl,)).rowcount
+            rows -= expired
+            evicted = 0
+            if rows > self.max_items:
+                evicted = self._conn.execute(
+                    'DELETE FROM responses WHERE key IN '
+                    '(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)',
+                    (rows - self.max_items,),
+                ).rowcount
+                rows -= evicted
+            self._conn.commit()
+            self._rows = rows
+        return expired + evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+            self._rows = 0
+
+    def count(self) -> int:
+        """Число записей без обращения к базе: безопасно вызывать из цикла событий."""
+        return self._rows
+
+
+class ResponseCache:
+    """Двухуровневый (память + SQLite) кеш ответов моделей с адресацией по содержимому запроса (Singleton)."""
+
+    _instance = None
+
+    def __new__(cls) -> 'ResponseCache':
+        if cls._instance is None:
+            logger.info('Создание экземпляра ResponseCache (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.enabled = config.RESPONSE_CACHE_ENABLED
+        self.stats = CacheStats()
+        self._memory = MemoryCacheTier(config.RESPONSE_CACHE_MEMORY_ITEMS, config.RESPONSE_CACHE_TTL)
+        self._disk: Optional[SQLiteCacheTier] = None
+        if self.enabled:
+            try:
+                self._disk = SQLiteCacheTier(
+                    config.RESPONSE_CACHE_DB_PATH,
+                    config.RESPONSE_CACHE_DISK_ITEMS,
+                    config.RESPONSE_CACHE_TTL,
+                )
+            except Exception as e:
+                logger.error(f'Не удалось открыть дисковый кеш ответов, работаем только с памятью: {e}')
+        logger.info(f'Инициализирован кеш ответов (enabled={self.enabled})')
+
+    @staticmethod
+    def _normalize_content(content: object) -> object:
+        if not isinstance(content, str):
+            return content
+        lines = content.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        return '\n'.join(line.rstrip() for line in lines).strip()
+
+    @classmethod
+    def normalize_messages(cls, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Приводит сообщения к каноническому виду, чтобы незначимые различия не ломали ключ."""
+        return [
+            {
+                'role': str(msg.get('role', '')).strip(),
+                'content': cls._normalize_content(msg.get('content', '')),
+            }
+            for msg in messages
+        ]
+
+    @classmethod
+    def make_key(cls, namespace: Dict[str, Any], messages: List[Dict[str, Any]]) -> str:
+        """Строит ключ кеша по модели, параметрам вызова и нормализованным сообщениям."""
+        payload = json.dumps(
+            {'namespace': namespace, 'messages': cls.normalize_messages(messages)},
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        value = self._memory.get(key)
+        if value is not None:
+            self.stats.memory_hits += 1
+            logger.debug(f'Кеш ответов: попадание в память ({key[:12]})')
+            return value
+
+        if self._disk is not None:
+            try:
+                row = await asyncio.to_thread(self._disk.get, key)
+            except Exception as e:
+                logger.error(f'Ошибка чтения дискового кеша ответов: {e}')
+                row = None
+            if row is not None:
+                created_at, value = row
+                self.stats.evictions += self._memory.set(key, value, created_at)
+                self.stats.disk_hits += 1
+                logger.debug(f'Кеш ответов: попадание на диск ({key[:12]})')
+                return value
+
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, namespace: str = '') -> None:
+        if not self.enabled or not value:
+            return
+
+        self.stats.evictions += self._memory.set(key, value)
+        if self._disk is not None:
+            try:
+                self.stats.evictions += await asyncio.to_thread(self._disk.set, key, namespace, value)
+            except Exception as e:
+                logger.error(f'Ошибка записи в дисковый кеш ответов: {e}')
+        self.stats.stores += 1
+
+    def mark_bypassed(self) -> None:
+        self.stats.bypassed += 1
+
+    def clear(self) -> None:
+        """Полностью очищает оба уровня кеша."""
+        self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+        logger.info('Кеш ответов очищен')
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.to_dict()
+        stats['memory_items'] = len(self._memory)
+        stats['disk_items'] = self._disk.count() if self._disk is not None else 0
+        return stats
@@ -0,0 +1,202 @@
+import logging
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from config import Config
+
+logger = logging.getLogger('bot')
+config = Config()
+
+NGRAM_SIZES = (2, 3, 4)
+
+# Служебные слова и формулировки запроса, которые не меняют предмет анализа
+STOPWORDS = frozenset(
+    {
+        'а', 'в', 'во', 'и', 'или', 'к', 'ко', 'на', 'о', 'об', 'обо', 'от', 'по', 'про', 'с', 'со', 'у', 'для',
+        'же', 'ли', 'мне', 'нам', 'как', 'что', 'это', 'этой', 'этого', 'его', 'ее', 'их', 'между', 'также',
+        'анализ', 'анализа', 'проанализируй', 'проанализировать', 'проведи', 'провести', 'сделай', 'сделать',
+        'расскажи', 'рассказать', 'оцени', 'оценить', 'оценка', 'оценку', 'подготовь', 'нужен', 'нужна', 'нужно',
+        'пожалуйста', 'компания', 'компании', 'компанию', 'компанией', 'покупка', 'покупку', 'покупки', 'купить',
+        'партнерство', 'партнерства', 'сделка', 'сделки', 'инвестиции', 'инвестиций', 'инвестиционный',
+        'инвестиционного', 'привлекательность', 'привлекательности',
+        'найди', 'найти', 'покажи', 'подбери', 'подобрать',
+        'analysis', 'analyze', 'company', 'the', 'of', 'for', 'and',
+    },
+)
+
+# Покупатель в запросе вида «покупка Сбером X» не меняет предмет анализа; названия брендов в стоп-слова
+# не входят, иначе «Сбер Маркет» и «Маркет» совпадают, а запрос «анализ Сбер» становится пустым
+ACQUIRER_PHRASE = re.compile(r'\b(покупк[аиу]|сделк[аи]|партнерств[оа])\s+(?:со\s+)?сбером\b')
+
+# Падежные окончания, которые отбрасываются у слов на кириллице («Озона» -> «Озон»)
+CASE_ENDINGS = ('ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ов', 'ев', 'ой', 'ей', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях',
+                'а', 'я', 'у', 'ю', 'е', 'ы', 'и')
+MIN_STEM_LENGTH = 3
+
+# Транслитерация приводит «Озон» и «Ozon» к одному написанию
+TRANSLITERATION = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'i',
+    'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e',
+    'ю': 'yu', 'я': 'ya',
+}
+
+
+def _strip_case_ending(word: str) -> str:
+    if not re.fullmatch(r'[а-я]+', word):
+        return word
+    for ending in CASE_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def normalize_query(text: str) -> str:
+    """Нормализует запрос: регистр, пунктуация, служебные слова, окончания, транслитерация в латиницу."""
+    text = ACQUIRER_PHRASE.sub(r'\1', text.lower().replace('ё', 'е'))
+    words = [_strip_case_ending(word) for word in re.findall(r'\w+', text) if word not in STOPWORDS]
+    normalized = ' '.join(words).replace('кс', 'x')
+    normalized = ''.join(TRANSLITERATION.get(char, char) for char in normalized)
+    return normalized.replace('ks', 'x')
+
+
+def char_ngrams(text: str) -> Counter:
+    """Символьные n-граммы по словам: устойчивы к падежным окончаниям и опечаткам."""
+    grams: Counter = Counter()
+    for word in text.split():
+        padded = f' {word} '
+        for size in NGRAM_SIZES:
+            grams.update(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return grams
+
+
+@dataclass
+class SemanticCacheEntry:
+    """Сохраненный результат и исходный запрос, по которому он получен."""
+
+    topic: str
+    query: str
+    normalized: str
+    payload: Dict[str, Any]
+    grams: Counter = field(repr=False, default_factory=Counter)
+    created_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class SemanticCacheHit:
+    entry: SemanticCacheEntry
+    similarity: float
+
+
+class SemanticCache:
+    """Кеш результатов по смыслу запроса: TF-IDF по символьным n-граммам и поиск ближайшего соседа (Singleton).
+
+    Срабатывает на разные формулировки одного запроса («анализ Ozon», «покупка Озон»),
+    которые не совпадают побайтно и поэтому не попадают в кеш ответов моделей.
+    """
+
+    _instance = None
+
+    def __new__(cls) -> 'SemanticCache':
+        if cls._instance is None:
+            logger.info('Создание экземпляра SemanticCache (Singleton)')
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self) -> None:
+        self.enabled = config.SEMANTIC_CACHE_ENABLED
+        self.threshold = config.SEMANTIC_CACHE_THRESHOLD
+        self.ttl = config.SEMANTIC_CACHE_TTL
+        self.max_entries = config.SEMANTIC_CACHE_MAX_ENTRIES
+        self._entries: 'OrderedDict[int, SemanticCacheEntry]' = OrderedDict()
+        self._document_frequency: Dict[str, Counter] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _vector(self, topic: str, grams: Counter, documents: int) -> Dict[str, float]:
+        frequency = self._document_frequency.get(topic, Counter())
+        vector = {
+            gram: count * (math.log((1 + documents) / (1 + frequency.get(gram, 0))) + 1)
+            for gram, count in grams.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {gram: weight / norm for gram, weight in vector.items()} if norm else {}
+
+    def _evict(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        frequency = self._document_frequency[entry.topic]
+        frequency.subtract(entry.grams.keys())
+        self._document_frequency[entry.topic] = +frequency  # убираем нулевые счетчики
+
+    def _evict_expired(self) -> None:
+        now = time.time()
+        for entry_id in [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl]:
+            self._evict(entry_id)
+
+    def lookup(self, topic: str, query: str) -> Optional[SemanticCacheHit]:
+        """Ищет сохраненный результат для похожего запроса по той же теме."""
+        if not self.enabled or not query:
+            return None
+        self._evict_expired()
+        normalized = normalize_query(query)
+        grams = char_ngrams(normalized)
+        if not grams:
+            return None
+
+        candidates = [entry for entry in self._entries.values() if entry.topic == topic]
+        query_vector = self._vector(topic, grams, len(candidates))
+        best: Optional[SemanticCacheHit] = None
+        for entry in candidates:
+            entry_vector = self._vector(topic, entry.grams, len(candidates))
+            similarity = sum(weight * entry_vector.get(gram, 0.0) for gram, weight in query_vector.items())
+            if best is None or similarity > best.similarity:
+                best = SemanticCacheHit(entry, similarity)
+
+        if best is None or best.similarity < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(
+            f'[SemanticCache] Запрос "{query}" похож на "{best.entry.query}" ({best.similarity:.2f}), '
+            f'тема {topic}',
+        )
+        return best
+
+    def store(self, topic: str, query: str, payload: Dict[str, Any]) -> None:
+        """Сохраняет результат; запись с тем же нормализованным запросом заменяется."""
+        if not self.enabled or not query:
+            return
+        normalized = normalize_query(query)
+        grams = char_ngrams(normalized)
+        if not grams:
+            return
+        duplicates = [
+            key for key, entry in self._entries.items() if entry.topic == topic and entry.normalized == normalized
+        ]
+        for entry_id in duplicates:
+            self._evict(entry_id)
+        while len(self._entries) >= self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+        self._entries[self._next_id] = SemanticCacheEntry(topic, query, normalized, payload, grams)
+        self._document_frequency.setdefault(topic, Counter()).update(grams.keys())
+        self._next_id += 1
+
+    def clear(self, topic: Optional[str] = None) -> None:
+        """Сбрасывает сохраненные результаты (например, после обновления промптов)."""
+        for entry_id in [key for key, entry in self._entries.items() if topic is None or entry.topic == topic]:
+            self._evict(entry_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'threshold': self.threshold,
+        }
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from config import Config
+
+logger = logging.getLogger('bot')
+config = Config()
+
+try:
+    import tiktoken
+except ImportError:  # без tiktoken считаем токены приближенно
+    tiktoken = None
+
+# Размер контекстного окна по префиксу имени модели (проверяются от самого длинного префикса)
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4': 8192,
+    'gpt-4-32k': 32768,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+    'gpt-4.1': 1047576,
+    'gpt-4.5': 128000,
+    'gpt-5': 400000,
+    'o1': 200000,
+    'o3': 200000,
+    'o4-mini': 200000,
+}
+
+MESSAGE_OVERHEAD_TOKENS = 4  # служебные токены на каждое сообщение чата
+REPLY_OVERHEAD_TOKENS = 3
+CHARS_PER_TOKEN_FALLBACK = 3  # для кириллицы токенов больше, чем в английском тексте
+TRUNCATION_MARKER = '\n\n[...текст сокращен...]\n\n'
+
+Summarizer = Callable[[str], Awaitable[Optional[str]]]
+
+
+def get_context_window(model: Optional[str]) -> int:
+    """Возвращает размер контекстного окна модели в токенах."""
+    if config.LLM_CONTEXT_WINDOW:
+        return config.LLM_CONTEXT_WINDOW
+    model = (model or '').lower()
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    return config.LLM_DEFAULT_CONTEXT_WINDOW
+
+
+def _encoding_name(model: str) -> str:
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        modern = model.startswith(('gpt-4o', 'gpt-4.1', 'gpt-5', 'o'))
+        return 'o200k_base' if modern else 'cl100k_base'
+
+
+@lru_cache(maxsize=8)
+def _load_encoding(name: str) -> Optional['tiktoken.Encoding']:
+    """Загружает кодировку tiktoken; при недоступном BPE-файле (офлайн, прокси) возвращает None.
+
+    Результат кешируется и при ошибке, поэтому загрузка не повторяется на каждом запросе.
+    """
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f'[TokenBudget] Кодировка {name} недоступна, токены считаются приближенно: {e}')
+        return None
+
+
+def _get_encoding(model: str) -> Optional['tiktoken.Encoding']:
+    if tiktoken is None:
+        return None
+    return _load_encoding(_encoding_name(model))
+
+
+async def preload_encodings(models: Iterable[Optional[str]] = ()) -> None:
+    """Заранее загружает кодировки в отдельном потоке, чтобы обработчики не скачивали BPE-файлы на event loop."""
+    if tiktoken is None:
+        return
+    names = {'cl100k_base', 'o200k_base'} | {_encoding_name(model) for model in models if model}
+    await asyncio.gather(*(asyncio.to_thread(_load_encoding, name) for name in sorted(names)))
+
+
+class TokenBudget:
+    """Предварительный учет токенов: подгоняет запрос под контекстное окно модели до отправки."""
+
+    def __init__(self, model: Optional[str], reserve_output: Optional[int] = None) -> None:
+        self.model = model or ''
+        self.context_window = get_context_window(self.model)
+        self.reserve_output = reserve_output if reserve_output is not None else int(config.OPENAI_MAX_TOKENS)
+        self._encoding = _get_encoding(self.model)
+
+    @property
+    def limit(self) -> int:
+        """Сколько токенов можно отправить во входных сообщениях с учетом запаса на ответ."""
+        margin = int(self.context_window * config.TOKEN_BUDGET_MARGIN)
+        return max(self.context_window - self.reserve_output - margin, 0)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // CHARS_PER_TOKEN_FALLBACK + 1
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        return sum(self.count(str(msg.get('content', ''))) + MESSAGE_OVERHEAD_TOKENS for msg in messages) + (
+            REPLY_OVERHEAD_TOKENS
+        )
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Обрезает текст до max_tokens, сохраняя начало и конец (середина документа обычно наименее важна)."""
+        if self.count(text) <= max_tokens:
+            return text
+        keep = max(max_tokens - self.count(TRUNCATION_MARKER), 0)
+        head, tail = keep * 2 // 3, keep // 3
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            tail_text = self._encoding.decode(tokens[-tail:]) if tail else ''
+            return self._encoding.decode(tokens[:head]) + TRUNCATION_MARKER + tail_text
+        head_chars, tail_chars = head * CHARS_PER_TOKEN_FALLBACK, tail * CHARS_PER_TOKEN_FALLBACK
+        return text[:head_chars] + TRUNCATION_MARKER + (text[-tail_chars:] if tail_chars else '')
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """Делит текст на части не больше max_tokens, по возможности по границам абзацев."""
+        chunks, current = [], []
+        current_tokens = 0
+        for paragraph in text.split('\n'):
+            paragraph_tokens = self.count(paragraph) + 1
+            if paragraph_tokens > max_tokens:
+                # слишком длинный абзац режем на куски фиксированного размера
+                pieces = self._split_long(paragraph, max_tokens)
+            else:
+                pieces = [paragraph]
+            for piece in pieces:
+                piece_tokens = self.count(piece) + 1
+                if current and current_tokens + piece_tokens > max_tokens:
+                    chunks.append('\n'.join(current))
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+        if current:
+            chunks.append('\n'.join(current))
+        return [chunk for chunk in chunks if chunk.strip()]
+
+    def _split_long(self, text: str, max_tokens: int) -> List[str]:
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return [self._encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+        size = max_tokens * CHARS_PER_TOKEN_FALLBACK
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    async def fit_text(self, text: str, max_tokens: int, summarize: Optional[Summarizer] = None) -> str:
+        """Подгоняет текст под max_tokens: при наличии summarize сжимает части текста, иначе обрезает."""
+        if self.count(text) <= max_tokens:
+            return text
+        if summarize is not None:
+            chunks = self.split(text, max_tokens)
+            logger.info(f'[TokenBudget] Текст превышает бюджет {max_tokens} токенов, сжимаем по частям: {len(chunks)}')
+            summaries = await asyncio.gather(*(summarize(chunk) for chunk in chunks), return_exceptions=True)
+            parts = [
+                summary if isinstance(summary, str) and summary else self.truncate(chunk, max_tokens // len(chunks))
+                for chunk, summary in zip(chunks, summaries)
+            ]
+            text = '\n\n'.join(parts)
+        if self.count(text) > max_tokens:
+            logger.info(f'[TokenBudget] Текст обрезан до {max_tokens} токенов')
+            text = self.truncate(text, max_tokens)
+        return text
+
+    def fit_messages(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+        """Подгоняет диалог под бюджет: убирает старые реплики, затем сокращает самое длинное сообщение.
+
+        Системные сообщения и последняя реплика пользователя сохраняются всегда.
+        """
+        max_tokens = max_tokens if max_tokens is not None else self.limit
+        total = self.count_messages(messages)
+        if total <= max_tokens:
+            return messages
+
+        fitted = list(messages)
+        last_index = len(fitted) - 1
+        index = 0
+        while total > max_tokens and index < last_index:
+            if fitted[index].get('role') != 'system':
+                total -= self.count(str(fitted[index].get('content', ''))) + MESSAGE_OVERHEAD_TOKENS
+                fitted.pop(index)
+                last_index -= 1
+            else:
+                index += 1
+
+        while total > max_tokens:
+            longest = max(range(len(fitted)), key=lambda i: self.count(str(fitted[i].get('content', ''))))
+            content = str(fitted[longest].get('content', ''))
+            content_tokens = self.count(content)
+            target = max(content_tokens - (total - max_tokens), 0)
+            if target >= content_tokens:
+                break
+            fitted[longest] = {**fitted[longest], 'content': self.truncate(content, target)}
+            new_total = self.count_messages(fitted)
+            if new_total >= total:
+                break
+            total = new_total
+
+        dropped = len(messages) - len(fitted)
+        logger.info(
+            f'[TokenBudget] Запрос подогнан под контекст {self.model}: {total}/{max_tokens} токенов, '
+            f'удалено сообщений: {dropped}',
+        )
+        return fitted
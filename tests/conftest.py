@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# модули бота импортируются как в src/, настройки читаются из окружения при импорте config
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='invest-tests-'))
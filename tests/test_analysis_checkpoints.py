@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+import analysis_checkpoints
+from analysis_checkpoints import STATUS_COMPLETED, STATUS_RUNNING, AnalysisCheckpointStore
+
+PARAMS = {'name': 'Альфа', 'industry': 'ритейл'}
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    db_path = str(tmp_path / 'checkpoints.sqlite3')
+    monkeypatch.setattr(analysis_checkpoints.config, 'ANALYSIS_CHECKPOINT_DB_PATH', db_path)
+    monkeypatch.setattr(AnalysisCheckpointStore, '_instance', None)
+    store = AnalysisCheckpointStore()
+    yield store
+    store._conn.close()
+
+
+def test_saved_stages_are_restored(store):
+    async def scenario():
+        await store.create('a1', 42, PARAMS, additional_context='выжимка файла')
+        await store.save_stage('a1', 'market', 'рынок растет')
+        await store.save_stage('a1', 'rivals', 'Ошибка при анализе', failed=True)
+        return await store.load('a1')
+
+    checkpoint = asyncio.run(scenario())
+
+    assert checkpoint.user_id == 42
+    assert checkpoint.company_name == 'Альфа'
+    assert checkpoint.additional_context == 'выжимка файла'
+    assert checkpoint.status == STATUS_RUNNING
+    assert checkpoint.failed_stages == ['rivals']
+    assert checkpoint.completed_results() == {'market': 'рынок растет'}
+    assert checkpoint.completed_results(exclude=['market']) == {}
+
+
+def test_recreating_analysis_drops_old_stages(store):
+    async def scenario():
+        await store.create('a1', 42, PARAMS)
+        await store.save_stage('a1', 'market', 'рынок растет')
+        await store.create('a1', 42, PARAMS)
+        return await store.load('a1')
+
+    assert asyncio.run(scenario()).stages == {}
+
+
+def test_expired_checkpoint_is_not_loaded(store, monkeypatch):
+    asyncio.run(store.create('a1', 42, PARAMS))
+    now = time.time()
+    monkeypatch.setattr(analysis_checkpoints.time, 'time', lambda: now + store.ttl + 1)
+
+    assert asyncio.run(store.load('a1')) is None
+    assert asyncio.run(store.list_interrupted()) == []
+
+
+def test_only_running_analyses_are_interrupted(store):
+    async def scenario():
+        await store.create('done', 1, PARAMS)
+        await store.set_status('done', STATUS_COMPLETED)
+        await store.create('running', 2, PARAMS)
+        return await store.list_interrupted()
+
+    assert [checkpoint.analysis_id for checkpoint in asyncio.run(scenario())] == ['running']
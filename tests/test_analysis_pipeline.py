@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from analysis_pipeline import AnalysisPipeline, AnalysisStage
+from circuit_breaker import CircuitBreakerRegistry
+from llm_scheduler import LLMScheduler
+from models_api import ModelAPI, ModelStrategy
+from prompts import SystemPrompt
+from response_cache import ResponseCache
+
+
+def make_stages(timeout=None):
+    return (
+        AnalysisStage('market', SystemPrompt.INVESTMENT_MARKET, 'Рынок', 'Ошибка рынка', timeout=timeout),
+        AnalysisStage('rivals', SystemPrompt.INVESTMENT_RIVALS, 'Конкуренты', 'Ошибка конкурентов', timeout=timeout),
+        AnalysisStage(
+            'synergy',
+            SystemPrompt.INVESTMENT_SYNERGY,
+            'Синергия',
+            'Ошибка синергии',
+            depends_on=('market', 'rivals'),
+            timeout=timeout,
+        ),
+    )
+
+
+def run(pipeline, run_stage, selected=('market', 'rivals', 'synergy'), **kwargs):
+    return asyncio.run(pipeline.run(selected, run_stage, 'Ozon', **kwargs))
+
+
+def test_independent_stages_run_in_parallel_before_dependent_stage():
+    events = []
+
+    async def run_stage(stage, dependency_results):
+        events.append(('start', stage.name, sorted(dependency_results)))
+        await asyncio.sleep(0.01)
+        events.append(('done', stage.name))
+        return stage.name
+
+    results = run(AnalysisPipeline(make_stages()), run_stage)
+
+    assert list(results) == ['market', 'rivals', 'synergy']
+    assert events[:2] == [('start', 'market', []), ('start', 'rivals', [])]
+    assert events[-2] == ('start', 'synergy', ['market', 'rivals'])
+
+
+def test_failed_stage_is_reported_and_left_out_of_dependent_context():
+    seen = {}
+
+    async def run_stage(stage, dependency_results):
+        if stage.name == 'rivals':
+            raise ValueError('нет данных')
+        seen[stage.name] = dependency_results
+        return stage.name
+
+    pipeline = AnalysisPipeline(make_stages())
+    results = run(pipeline, run_stage)
+
+    assert results['rivals'] == 'Ошибка конкурентов: нет данных'
+    assert pipeline.failed_stages(results) == ['rivals']
+    assert seen['synergy'] == {'market': 'market'}
+
+
+def test_completed_stages_are_not_run_again():
+    calls = []
+
+    async def run_stage(stage, dependency_results):
+        calls.append(stage.name)
+        return stage.name
+
+    results = run(AnalysisPipeline(make_stages()), run_stage, completed={'market': 'сохранено'})
+
+    assert 'market' not in calls
+    assert results['market'] == 'сохранено'
+
+
+def test_dependency_cycle_is_rejected():
+    stages = (
+        AnalysisStage('market', SystemPrompt.INVESTMENT_MARKET, 'Рынок', 'Ошибка', depends_on=('rivals',)),
+        AnalysisStage('rivals', SystemPrompt.INVESTMENT_RIVALS, 'Конкуренты', 'Ошибка', depends_on=('market',)),
+    )
+    with pytest.raises(ValueError, match='Циклическая'):
+        AnalysisPipeline(stages)
+
+
+class SlowStrategy(ModelStrategy):
+    model = 'stub-slow'
+
+    def __init__(self):
+        self.cancelled = False
+
+    async def get_response(self, messages):
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return 'поздний ответ'
+
+
+def test_stage_timeout_cancels_model_request(monkeypatch):
+    monkeypatch.setattr(ResponseCache, '_instance', None)
+    monkeypatch.setattr(LLMScheduler, '_instance', None)
+    monkeypatch.setattr(CircuitBreakerRegistry, '_instance', None)
+    monkeypatch.setattr(ModelAPI, '_inflight', {})
+    strategy = SlowStrategy()
+
+    async def run_stage(stage, dependency_results):
+        return await ModelAPI(strategy).get_response([{'role': 'user', 'content': stage.name}], bypass_cache=True)
+
+    async def scenario():
+        results = await AnalysisPipeline(make_stages(timeout=0.05)).run(['market'], run_stage, 'Ozon')
+        await asyncio.sleep(0.01)
+        # проверяем до завершения цикла событий: при его закрытии asyncio отменяет все оставшиеся задачи
+        assert results['market'] == 'Ошибка рынка: превышено время ожидания ответа'
+        assert strategy.cancelled
+        assert ModelAPI._inflight == {}
+        assert LLMScheduler().get_stats()['active']['in_flight'] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+
+import analysis_store
+from analysis_store import CompanyAnalysisStore, analysis_flags, company_key
+
+PARAMS = {'name': 'Ozon', 'market': 1, 'rivals': 1}
+RESULTS = {'market': 'рынок растет', 'rivals': 'конкуренты слабее'}
+STAGES = ['rivals', 'market']
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(analysis_store.config, 'ANALYSIS_STORE_ENABLED', True)
+    monkeypatch.setattr(analysis_store.config, 'ANALYSIS_STORE_DB_PATH', str(tmp_path / 'analyses.sqlite3'))
+    monkeypatch.setattr(CompanyAnalysisStore, '_instance', None)
+    store = CompanyAnalysisStore()
+    yield store
+    store._conn.close()
+
+
+def save(store, company_name='Ozon', stages=STAGES, prompt_hash='v1', summary='сделка целесообразна'):
+    asyncio.run(store.save(company_name, stages, prompt_hash, PARAMS, RESULTS, summary))
+
+
+def get(store, company_name='Ozon', stages=STAGES, prompt_hash='v1'):
+    return asyncio.run(store.get(company_name, stages, prompt_hash))
+
+
+def test_key_ignores_case_and_stage_order():
+    assert company_key('Ozon') == company_key('ozon') == company_key('Озон') == company_key(' ОЗОН. ')
+    assert company_key('Ёлка-Маркет') == company_key('елка   маркет')
+    assert analysis_flags(['synergy', 'market']) == analysis_flags(['market', 'synergy']) == 'market,synergy'
+
+
+def test_saved_analysis_is_shared_by_normalized_name(store):
+    save(store)
+
+    stored = get(store, 'ozon', stages=['market', 'rivals'])
+
+    assert stored.company_name == 'Ozon'
+    assert stored.analysis_results == RESULTS
+    assert stored.executive_summary == 'сделка целесообразна'
+    assert store.get_stats() == {'entries': 1, 'hits': 1, 'misses': 0, 'stores': 1}
+
+
+def test_other_stages_or_prompt_version_miss(store):
+    save(store)
+
+    assert get(store, stages=['market']) is None
+    assert get(store, prompt_hash='v2') is None
+    assert store.misses == 2
+
+
+def test_expired_analysis_is_not_returned(store, monkeypatch):
+    save(store)
+    now = time.time()
+    monkeypatch.setattr(analysis_store.time, 'time', lambda: now + store.ttl + 1)
+
+    assert get(store) is None
+
+
+def test_expired_rows_are_removed_on_save(store, monkeypatch):
+    save(store)
+    now = time.time()
+    monkeypatch.setattr(analysis_store.time, 'time', lambda: now + store.ttl + 1)
+
+    save(store, 'Wildberries')
+
+    assert store.get_stats()['entries'] == 1
+
+
+def test_unknown_company_and_empty_summary_are_not_stored(store):
+    save(store, 'unknown_company')
+    save(store, summary='')
+
+    assert store.get_stats()['entries'] == 0
+    assert get(store, 'unknown_company') is None
+
+
+@pytest.mark.parametrize('first, second', [('Сбер Маркет', 'Маркет'), ('Компания Плюс', 'Плюс'), ('Авиа', 'Ави')])
+def test_different_companies_do_not_share_a_key(store, first, second):
+    assert company_key(first) != company_key(second)
+
+    save(store, first)
+
+    assert get(store, second) is None
+    assert get(store, first).company_name == first
@@ -0,0 +1,148 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+from openai import AsyncOpenAI
+
+from analysis_pipeline import AnalysisPipeline, configured_stages
+from batch_analysis import BatchAnalysisRunner, BatchJob, BatchTimeoutError
+from mock_llm_server import MockLLMServer, MockSettings
+from report_renderer import ReportRenderer
+
+
+async def start_mock_server(settings: MockSettings) -> tuple:
+    runner = web.AppRunner(MockLLMServer(settings).build_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/v1'
+
+
+async def run_batch(tmp_path, companies, settings, setup=None, **runner_kwargs):
+    server, base_url = await start_mock_server(settings)
+    client = AsyncOpenAI(api_key='test-key', base_url=base_url)
+    try:
+        runner = BatchAnalysisRunner(
+            client=client, model='mock-model', output_dir=str(tmp_path), poll_interval=0.05, **runner_kwargs
+        )
+        if setup is not None:
+            setup(runner)
+        return runner, await runner.run(companies)
+    finally:
+        await client.close()
+        await server.cleanup()
+        ReportRenderer().close()
+
+
+def test_batch_run_writes_report_per_company(tmp_path):
+    companies = ['Альфа', 'Бета', 'Гамма']
+    runner, reports = asyncio.run(
+        run_batch(tmp_path, companies, MockSettings(batch_duration=0.1), max_wait=10, max_requests=4)
+    )
+
+    assert len(reports) == len(companies)
+    assert sorted(path.name for path in tmp_path.glob('*.docx')) == sorted(Path(path).name for path in reports)
+
+
+def test_compile_requests_covers_configured_stages():
+    runner = BatchAnalysisRunner(client=AsyncOpenAI(api_key='test-key'), model='mock-model')
+    requests = runner.compile_requests(['Альфа', 'Бета'], offset=5)
+
+    stage_names = [stage.name for stage in configured_stages()]
+    assert [request['custom_id'] for request in requests] == [
+        runner.make_custom_id(index, name) for index in (5, 6) for name in stage_names
+    ]
+    assert all(request['body']['model'] == 'mock-model' for request in requests)
+
+
+def test_dependent_stage_gets_previous_wave_results_in_context():
+    runner = BatchAnalysisRunner(client=AsyncOpenAI(api_key='test-key'), model='mock-model')
+    previous = {runner.make_custom_id(0, 'market'): 'Рынок растет на 12% в год'}
+
+    assert runner.pipeline.levels(stage.name for stage in runner.stages) == [['market', 'rivals'], ['synergy']]
+    [request] = runner.compile_requests(['Альфа'], stages=['synergy'], previous_results=previous)
+    user_content = request['body']['messages'][-1]['content']
+
+    assert request['custom_id'] == runner.make_custom_id(0, 'synergy')
+    assert 'Рынок растет на 12% в год' in user_content
+    assert 'Результат анализа конкурентов' not in user_content
+
+
+def test_missing_results_use_pipeline_error_text(tmp_path):
+    async def write():
+        runner = BatchAnalysisRunner(
+            client=AsyncOpenAI(api_key='test-key'), model='mock-model', output_dir=str(tmp_path)
+        )
+        captured = {}
+
+        async def create_docx_report(company_name, analysis_results):
+            captured.update(analysis_results)
+            path = tmp_path / 'report.docx'
+            path.write_bytes(b'')
+            return str(path)
+
+        runner.create_docx_report = create_docx_report
+        job = BatchJob(companies=['Альфа'], status='expired')
+        await runner.write_reports(['Альфа'], job)
+        return captured
+
+    results = asyncio.run(write())
+    assert AnalysisPipeline().failed_stages(results) == [stage.name for stage in configured_stages()]
+
+
+def capture_reports(runner):
+    """Подменяет формирование DOCX: результаты этапов сохраняются в runner.captured по компаниям."""
+    runner.captured = {}
+
+    async def create_docx_report(company_name, analysis_results):
+        runner.captured[company_name] = analysis_results
+        path = runner.output_dir / f'{len(runner.captured)}.tmp'
+        path.write_bytes(b'')
+        return str(path)
+
+    runner.create_docx_report = create_docx_report
+
+
+def test_wait_raises_when_batch_exceeds_deadline(tmp_path):
+    async def scenario():
+        server, base_url = await start_mock_server(MockSettings(batch_duration=60))
+        client = AsyncOpenAI(api_key='test-key', base_url=base_url)
+        try:
+            runner = BatchAnalysisRunner(client=client, model='mock-model', poll_interval=0.05, max_wait=0.2)
+            batch_id = await runner.submit(runner.compile_requests(['Альфа']))
+            await runner.wait(batch_id)
+        finally:
+            await client.close()
+            await server.cleanup()
+
+    with pytest.raises(BatchTimeoutError):
+        asyncio.run(scenario())
+
+
+def test_timed_out_wave_fails_its_chunk_and_run_continues(tmp_path):
+    def setup(runner):
+        capture_reports(runner)
+        wait = runner.wait
+        calls = []
+
+        async def wait_with_timeout_on_second_wave(batch_id):
+            calls.append(batch_id)
+            # волна синергии первой партии не дожидается выполнения batch на сервере
+            runner.max_wait = 0 if len(calls) == 2 else 10
+            return await wait(batch_id)
+
+        runner.wait = wait_with_timeout_on_second_wave
+
+    companies = ['Альфа', 'Бета', 'Гамма']
+    runner, reports = asyncio.run(
+        run_batch(tmp_path, companies, MockSettings(batch_duration=0.1), setup, max_wait=10, max_requests=6),
+    )
+
+    assert len(reports) == len(companies)
+    pipeline = AnalysisPipeline()
+    assert pipeline.failed_stages(runner.captured['Альфа']) == ['synergy']
+    assert pipeline.failed_stages(runner.captured['Бета']) == ['synergy']
+    assert 'не завершился' in runner.captured['Альфа']['synergy']
+    assert pipeline.failed_stages(runner.captured['Гамма']) == []
@@ -0,0 +1,150 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitState
+from llm_scheduler import LLMScheduler
+from models_api import ModelAPI, ModelStrategy
+from response_cache import ResponseCache
+
+MESSAGES = [{'role': 'user', 'content': 'анализ Ozon'}]
+
+
+def api_error(status_code):
+    response = httpx.Response(status_code, request=httpx.Request('POST', 'http://llm.test/v1/chat/completions'))
+    return openai.APIStatusError(f'status {status_code}', response=response, body=None)
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(circuit_breaker.config, 'LLM_LATENCY_SLO', 0.05)
+    monkeypatch.setattr(circuit_breaker.config, 'LLM_LATENCY_MIN_SAMPLES', 3)
+    monkeypatch.setattr(circuit_breaker.config, 'LLM_CIRCUIT_FAILURE_THRESHOLD', 2)
+    monkeypatch.setattr(circuit_breaker.config, 'LLM_CIRCUIT_OPEN_TIMEOUT', 60)
+    return CircuitBreaker('primary')
+
+
+def make_degraded(breaker):
+    for _ in range(breaker.min_samples):
+        breaker.record_success(breaker.slo * 2)
+    assert breaker.degraded
+
+
+def answer(value, delay=0.0, calls=None):
+    async def call():
+        if calls is not None:
+            calls.append(value)
+        await asyncio.sleep(delay)
+        return value
+
+    return call
+
+
+def test_slow_primary_is_not_hedged_while_p95_is_within_slo(breaker):
+    calls = []
+    result = asyncio.run(breaker.call(answer('primary', delay=0.1), answer('fallback', calls=calls)))
+
+    assert result == 'primary'
+    assert calls == []
+    assert breaker.hedged == 0
+
+
+def test_degraded_breaker_hedges_and_fallback_wins(breaker):
+    make_degraded(breaker)
+
+    result = asyncio.run(breaker.call(answer('primary', delay=1.0), answer('fallback')))
+
+    assert result == 'fallback'
+    assert breaker.hedged == 1
+    assert breaker.hedge_wins == 1
+
+
+def test_client_error_during_hedge_cancels_fallback(breaker):
+    make_degraded(breaker)
+    fallback_cancelled = asyncio.Event()
+
+    async def primary():
+        await asyncio.sleep(0.1)
+        raise api_error(400)
+
+    async def fallback():
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            fallback_cancelled.set()
+            raise
+        return 'fallback'
+
+    async def scenario():
+        with pytest.raises(openai.APIStatusError):
+            await breaker.call(primary, fallback)
+        await asyncio.sleep(0)
+        return fallback_cancelled.is_set()
+
+    assert asyncio.run(scenario())
+    assert breaker.client_errors == 1
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_model_failures_open_breaker_and_trial_success_closes_it(breaker):
+    async def failing():
+        raise api_error(503)
+
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(openai.APIStatusError):
+            asyncio.run(breaker.call(failing))
+    assert breaker.state == CircuitState.OPEN
+
+    assert asyncio.run(breaker.call(answer('primary'), answer('fallback'))) == 'fallback'
+    assert breaker.short_circuited == 1
+
+    breaker.open_timeout = 0
+    assert asyncio.run(breaker.call(answer('primary'))) == 'primary'
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_client_errors_do_not_open_breaker(breaker):
+    async def bad_request():
+        raise api_error(400)
+
+    for _ in range(breaker.failure_threshold + 1):
+        with pytest.raises(openai.APIStatusError):
+            asyncio.run(breaker.call(bad_request, answer('fallback')))
+
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.client_errors == breaker.failure_threshold + 1
+
+
+class StubStrategy(ModelStrategy):
+    def __init__(self, model, fallback=None):
+        self.model = model
+        self._fallback = fallback
+
+    async def get_response(self, messages):
+        return f'ответ {self.model}'
+
+    def fallback(self):
+        return self._fallback
+
+
+def test_fallback_answer_is_not_cached_under_primary_key(monkeypatch):
+    monkeypatch.setattr(ResponseCache, '_instance', None)
+    monkeypatch.setattr(LLMScheduler, '_instance', None)
+    monkeypatch.setattr(CircuitBreakerRegistry, '_instance', None)
+    ResponseCache().clear()
+    strategy = StubStrategy('stub-primary', fallback=StubStrategy('stub-fallback'))
+    api = ModelAPI(strategy)
+    breaker = api._circuit_breaker()
+    breaker.state = CircuitState.OPEN
+    breaker._opened_at = float('inf')
+
+    assert asyncio.run(api.get_response(MESSAGES)) == 'ответ stub-fallback'
+    key = ResponseCache.make_key(strategy.cache_namespace(), MESSAGES)
+    assert asyncio.run(ResponseCache().get(key)) is None
+
+    breaker.state = CircuitState.CLOSED
+    assert asyncio.run(api.get_response(MESSAGES)) == 'ответ stub-primary'
+    assert asyncio.run(ResponseCache().get(key)) == 'ответ stub-primary'
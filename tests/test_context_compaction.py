@@ -0,0 +1,54 @@
+from context_compaction import ContextCompactor, format_context
+from token_budget import TokenBudget
+
+FILLER = 'Компания продолжает работу в обычном режиме без существенных изменений.'
+MARKET_ANSWER = '\n'.join(
+    ['# Рыночный анализ']
+    + [FILLER] * 3
+    + ['- Выручка Ozon выросла на 25% до 615 млрд руб.']
+    + [f'{FILLER} Абзац {index}.' for index in range(40)]
+    + ['**Вывод**: ключевой риск — регулирование маркетплейсов.'],
+)
+
+
+def make_compactor() -> ContextCompactor:
+    budget = TokenBudget('gpt-4o', reserve_output=0)
+    budget._encoding = None  # приближенный подсчет: тесты не зависят от загрузки BPE-файлов
+    return ContextCompactor(budget)
+
+
+def test_short_text_is_unchanged():
+    compactor = make_compactor()
+
+    assert compactor.compact('Короткий ответ', max_tokens=100) == 'Короткий ответ'
+
+
+def test_compacted_text_fits_budget_and_keeps_facts_in_order():
+    compactor = make_compactor()
+
+    digest = compactor.compact(MARKET_ANSWER, max_tokens=60)
+
+    assert compactor.budget.count(digest) <= 60
+    lines = digest.split('\n')
+    assert '- Выручка Ozon выросла на 25% до 615 млрд руб.' in lines
+    assert lines[-1] == 'Вывод: ключевой риск — регулирование маркетплейсов.'
+    source_lines = MARKET_ANSWER.replace('**', '').split('\n')
+    assert sorted(lines, key=source_lines.index) == lines
+
+
+def test_sections_within_budget_are_unchanged():
+    compactor = make_compactor()
+    sections = [('Рыночный анализ', 'рынок растет'), ('Анализ конкурентов', '')]
+
+    assert compactor.compact_sections(sections, max_tokens=1000) == [('Рыночный анализ', 'рынок растет')]
+
+
+def test_short_section_kept_whole_and_long_one_gets_the_rest():
+    compactor = make_compactor()
+    sections = [('Рыночный анализ', MARKET_ANSWER), ('Выжимка файла', 'Доля рынка 12%.')]
+
+    compacted = compactor.compact_sections(sections, max_tokens=80)
+
+    assert compacted[1] == sections[1]
+    assert compacted[0][0] == 'Рыночный анализ' and compacted[0][1] != MARKET_ANSWER
+    assert compactor.budget.count(format_context(compacted)) <= 80
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from file_digest import FileDigestCache
+
+FILE_CONTENT = 'Выручка компании за 2024 год — 10 млрд руб.'
+
+
+class StubBuilder:
+    def __init__(self, fail_first=False):
+        self.fail_first = fail_first
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, file_content, user_id, priority, bypass_cache):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            if self.fail_first and self.calls == 1:
+                raise ValueError('модель недоступна')
+            return f'выжимка: {file_content}'
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(FileDigestCache, '_instance', None)
+    return FileDigestCache()
+
+
+def test_concurrent_requests_build_digest_once(cache):
+    cache._build = builder = StubBuilder()
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_digest(FILE_CONTENT) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+
+    assert builder.calls == 1
+    assert {digest for _, digest in results} == {f'выжимка: {FILE_CONTENT}'}
+    assert cache.get_stats() == {'entries': 1, 'hits': 2, 'built': 1}
+    assert cache._locks == {}
+
+
+def test_failed_build_does_not_let_two_builds_run_at_once(cache):
+    cache._build = builder = StubBuilder(fail_first=True)
+
+    async def first():
+        try:
+            await cache.get_digest(FILE_CONTENT)
+        except ValueError:
+            # новый запрос приходит, пока очередной ожидающий еще не успел взять блокировку
+            return asyncio.ensure_future(cache.get_digest(FILE_CONTENT))
+
+    async def scenario():
+        first_task = asyncio.ensure_future(first())
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(cache.get_digest(FILE_CONTENT)) for _ in range(2)]
+        late = await first_task
+        return await asyncio.gather(*waiters, late)
+
+    results = asyncio.run(scenario())
+
+    assert builder.max_active == 1
+    assert builder.calls == 2
+    assert len(results) == 3
+    assert cache._locks == {} and cache._lock_users == {}
@@ -0,0 +1,34 @@
+import pytest
+
+import response_cache
+from llm_metrics import LLMMetrics
+from response_cache import ResponseCache
+
+
+class ClosedConnection:
+    def execute(self, *args):
+        raise AssertionError('опрос метрик не должен обращаться к SQLite')
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(response_cache.config, 'RESPONSE_CACHE_ENABLED', True)
+    monkeypatch.setattr(response_cache.config, 'RESPONSE_CACHE_DB_PATH', str(tmp_path / 'responses.sqlite3'))
+    monkeypatch.setattr(ResponseCache, '_instance', None)
+    monkeypatch.setattr(LLMMetrics, '_instance', None)
+    cache = ResponseCache()
+    yield cache
+    cache._disk._conn.close()
+
+
+def test_scrape_reads_disk_cache_size_without_querying_sqlite(cache, monkeypatch):
+    cache._disk.set('a', 'ns', 'ответ a')
+    cache._disk.set('b', 'ns', 'ответ b')
+    connection = cache._disk._conn
+    monkeypatch.setattr(cache._disk, '_conn', ClosedConnection())
+    try:
+        text = LLMMetrics().render_prometheus()
+    finally:
+        monkeypatch.setattr(cache._disk, '_conn', connection)
+
+    assert 'llm_response_cache_disk_items 2' in text.splitlines()
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import llm_scheduler
+from llm_scheduler import LLMScheduler, RequestPriority
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(llm_scheduler.config, 'LLM_MAX_CONCURRENCY', 1)
+    monkeypatch.setattr(LLMScheduler, '_instance', None)
+    return LLMScheduler()
+
+
+def dispatch_order(scheduler, requests):
+    """Порядок, в котором запросы (метка, приоритет, пользователь, стоимость) получают единственный слот."""
+    order = []
+
+    async def request(label, priority, user_id, cost):
+        async with scheduler.slot(priority, user_id, cost):
+            order.append(label)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot(RequestPriority.BATCH):
+                await release.wait()
+
+        holder_task = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        tasks = []
+        for item in requests:
+            tasks.append(asyncio.ensure_future(request(*item)))
+            await asyncio.sleep(0)  # запросы встают в очередь в порядке списка
+        release.set()
+        await asyncio.gather(holder_task, *tasks)
+
+    asyncio.run(scenario())
+    return order
+
+
+def test_higher_priority_class_is_served_first(scheduler):
+    order = dispatch_order(scheduler, [
+        ('batch', RequestPriority.BATCH, 1, 1),
+        ('background', RequestPriority.BACKGROUND, 1, 1),
+        ('analysis', RequestPriority.ANALYSIS, 1, 1),
+        ('interactive', RequestPriority.INTERACTIVE, 1, 1),
+    ])
+
+    assert order == ['interactive', 'analysis', 'background', 'batch']
+
+
+def test_users_share_a_class_fairly(scheduler):
+    order = dispatch_order(scheduler, [
+        ('a1', RequestPriority.ANALYSIS, 1, 10),
+        ('a2', RequestPriority.ANALYSIS, 1, 10),
+        ('a3', RequestPriority.ANALYSIS, 1, 10),
+        ('b1', RequestPriority.ANALYSIS, 2, 10),
+    ])
+
+    assert order.index('b1') < order.index('a2')
+
+
+def test_user_weight_gives_larger_share(scheduler):
+    scheduler._user_weights = {2: 3.0}
+    order = dispatch_order(scheduler, [
+        ('a1', RequestPriority.ANALYSIS, 1, 10),
+        ('a2', RequestPriority.ANALYSIS, 1, 10),
+        ('b1', RequestPriority.ANALYSIS, 2, 10),
+        ('b2', RequestPriority.ANALYSIS, 2, 10),
+        ('b3', RequestPriority.ANALYSIS, 2, 10),
+    ])
+
+    assert order.index('b3') < order.index('a2')
+
+
+def test_cancelled_waiter_does_not_keep_a_slot(scheduler):
+    async def scenario():
+        async with scheduler.slot(RequestPriority.ANALYSIS, 1):
+            waiter = asyncio.ensure_future(scheduler.slot(RequestPriority.ANALYSIS, 2).__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        async with scheduler.slot(RequestPriority.ANALYSIS, 3) as wait:
+            return wait
+
+    assert asyncio.run(scenario()) == 0.0
+    stats = scheduler.get_stats()
+    assert stats['active']['in_flight'] == 0
+    assert stats['ANALYSIS']['queue_depth'] == 0
@@ -0,0 +1,67 @@
+from markdown_docx import MarkdownDocxRenderer, render_markdown
+from report_renderer import ReportWriter
+
+
+def render(content):
+    writer = ReportWriter()
+    render_markdown(writer, content)
+    return writer.doc
+
+
+def runs(paragraph):
+    return [(run.text, bool(run.bold), bool(run.italic)) for run in paragraph.runs]
+
+
+def test_table_header_is_bold_and_separator_skipped():
+    doc = render('| Показатель | 2024 |\n|---|:---:|\n| Выручка | **10** |\n| EBITDA |')
+
+    table = doc.tables[0]
+    cells = [[cell.text for cell in row.cells] for row in table.rows]
+    assert cells == [['Показатель', '2024'], ['Выручка', '10'], ['EBITDA', '']]
+    assert runs(table.rows[0].cells[0].paragraphs[0]) == [('Показатель', True, False)]
+    assert runs(table.rows[1].cells[1].paragraphs[0]) == [('10', True, False)]
+    assert doc.paragraphs == []
+
+
+def test_nested_lists_get_style_per_depth():
+    doc = render('- рост\n  - онлайн\n    - мобильные\n      - глубже\n- логистика\n1. сильные стороны')
+
+    assert [(p.text, p.style.name) for p in doc.paragraphs] == [
+        ('рост', 'List Bullet'),
+        ('онлайн', 'List Bullet 2'),
+        ('мобильные', 'List Bullet 3'),
+        ('глубже', 'List Bullet 3'),
+        ('логистика', 'List Bullet'),
+        ('сильные стороны', 'List Number'),
+    ]
+
+
+def test_unclosed_markup_does_not_leak_past_line():
+    doc = render('Рост **выручки и [отчет](http://x и `код\nследующая * строка')
+
+    assert runs(doc.paragraphs[0]) == [('Рост ', False, False), ('выручки и [отчет](http://x и `код', True, False)]
+    assert runs(doc.paragraphs[1]) == [('следующая * строка', False, False)]
+
+
+def test_inline_markup_and_snake_case():
+    doc = render('**жирный** и *курсив* в обзоре_рынка_2024')
+
+    assert runs(doc.paragraphs[0]) == [
+        ('жирный', True, False),
+        (' и ', False, False),
+        ('курсив', False, True),
+        (' в обзоре_рынка_2024', False, False),
+    ]
+
+
+def test_text_fed_in_chunks_matches_whole_text():
+    content = '## Итоги\nКомпания **растет**\n- пункт'
+    writer = ReportWriter()
+    renderer = MarkdownDocxRenderer(writer)
+    for index in range(0, len(content), 3):
+        renderer.feed(content[index:index + 3])
+    renderer.close()
+
+    expected = render(content)
+    assert [runs(p) for p in writer.doc.paragraphs] == [runs(p) for p in expected.paragraphs]
+    assert writer.doc.paragraphs[0].style.name == 'Heading 3'
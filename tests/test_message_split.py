@@ -0,0 +1,25 @@
+from bot import BaseScenario
+
+
+def test_split_prefers_newline_in_second_half():
+    text = 'a' * 30 + '\n' + 'b' * 30
+    split_at = BaseScenario._find_split_point(text, 40)
+    assert split_at == 31
+    assert text[:split_at].endswith('\n')
+
+
+def test_split_ignores_newline_in_first_half():
+    text = 'a' * 5 + '\n' + 'b' * 60
+    assert BaseScenario._find_split_point(text, 40) == 40
+
+
+def test_split_without_newline_cuts_at_limit():
+    assert BaseScenario._find_split_point('x' * 100, 40) == 40
+
+
+def test_split_sections_keeps_parts_under_limit():
+    sections = ['раздел ' + str(i) + '\n' + 'строка\n' * 30 for i in range(10)]
+    text = '\n\n'.join(sections)
+    parts = BaseScenario._split_sections(text, max_length=120)
+    assert all(len(part) <= 120 for part in parts)
+    assert ''.join(parts).replace('\n', '') == text.replace('\n', '')
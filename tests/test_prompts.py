@@ -0,0 +1,62 @@
+import pytest
+
+from prompts import DEFAULT_ROLE, CompiledPrompt, SystemPrompt, SystemPrompts
+
+PROMPT = (
+    'РОЛЬ. Ты инвестиционный аналитик.\n'
+    'КОНТЕКСТ. Проанализируй рынок [название компании] и конкурентов [название компании].\n'
+    'ФОРМАТ. Markdown.'
+)
+
+
+def test_role_and_context_are_split_once():
+    compiled = CompiledPrompt.compile(PROMPT)
+
+    assert compiled.role == 'Ты инвестиционный аналитик.'
+    assert compiled.context == 'Проанализируй рынок [название компании] и конкурентов [название компании].'
+    assert compiled.placeholders == ('company', 'company')
+
+
+def test_render_substitutes_every_placeholder():
+    compiled = CompiledPrompt.compile(PROMPT)
+
+    assert compiled.render(company='Ozon') == 'Проанализируй рынок Ozon и конкурентов Ozon.'
+
+
+def test_missing_value_keeps_placeholder():
+    compiled = CompiledPrompt.compile(PROMPT)
+
+    assert compiled.render() == compiled.context
+
+
+def test_unstructured_prompt_uses_default_role():
+    compiled = CompiledPrompt.compile('  Оцени компанию [название компании]  ')
+
+    assert compiled.role == DEFAULT_ROLE
+    assert compiled.render(company='Wildberries') == 'Оцени компанию Wildberries'
+
+
+def test_prompt_without_placeholders_renders_as_is():
+    compiled = CompiledPrompt.compile('КОНТЕКСТ. Краткая выжимка файла.')
+
+    assert compiled.placeholders == ()
+    assert compiled.render(company='Ozon') == 'Краткая выжимка файла.'
+
+
+def test_non_string_prompt_is_rejected():
+    with pytest.raises(ValueError):
+        CompiledPrompt.compile(None)
+
+
+def test_compiled_prompt_is_reused_until_text_changes(monkeypatch):
+    prompts = SystemPrompts()
+    monkeypatch.setitem(prompts.prompts, SystemPrompt.FILE_SUMMARY, PROMPT)
+    monkeypatch.delitem(prompts.compiled, SystemPrompt.FILE_SUMMARY)
+
+    first = prompts.get_compiled_prompt(SystemPrompt.FILE_SUMMARY)
+    assert prompts.get_compiled_prompt(SystemPrompt.FILE_SUMMARY) is first
+
+    prompts.prompts[SystemPrompt.FILE_SUMMARY] = PROMPT.replace('рынок', 'отрасль')
+    assert prompts.get_compiled_prompt(SystemPrompt.FILE_SUMMARY).render(company='Ozon').startswith(
+        'Проанализируй отрасль Ozon',
+    )
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import httpx
+import openai
+import pytest
+
+from models_api import ChatGPTFileStrategy
+from rate_limiter import AdaptiveRateLimiter, parse_duration, parse_retry_after
+
+RESERVED = 1000
+
+
+def rate_limit_error(headers):
+    request = httpx.Request('POST', 'http://llm.test/v1/chat/completions')
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError('rate limited', response=response, body=None)
+
+
+class RawResponse:
+    headers = {}
+
+
+@pytest.fixture
+def limiter():
+    return AdaptiveRateLimiter('test', rpm=600, tpm=60000, headroom=1.0)
+
+
+@pytest.fixture
+def strategy(limiter):
+    strategy = ChatGPTFileStrategy()
+    strategy._limiter = limiter
+    return strategy
+
+
+def test_parse_duration_formats():
+    assert parse_duration('20ms') == pytest.approx(0.02)
+    assert parse_duration('6m0s') == pytest.approx(360)
+    assert parse_duration('1h2m3.5s') == pytest.approx(3723.5)
+    assert parse_duration('1.5') == pytest.approx(1.5)
+    assert parse_duration('soon') is None
+
+
+def test_parse_retry_after_prefers_milliseconds():
+    assert parse_retry_after({'retry-after-ms': '250', 'retry-after': '5'}) == pytest.approx(0.25)
+    assert parse_retry_after({'retry-after': '3'}) == pytest.approx(3)
+    assert 8 <= parse_retry_after({'retry-after': formatdate(time.time() + 10, usegmt=True)}) <= 10
+    assert parse_retry_after({}) is None
+
+
+def test_headers_update_limits_and_remaining(limiter):
+    limiter.update_from_headers({
+        'x-ratelimit-limit-requests': '100',
+        'x-ratelimit-limit-tokens': '20000',
+        'x-ratelimit-remaining-tokens': '500',
+    })
+
+    assert limiter.rpm == 100
+    assert limiter.tpm == 20000
+    assert limiter._tokens.level <= 500
+
+
+def test_exhausted_requests_block_until_reset(limiter):
+    limiter.update_from_headers({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '50ms'})
+
+    waited = asyncio.run(limiter.acquire(10))
+
+    assert waited >= 0.04
+
+
+def test_acquire_waits_for_token_budget(limiter):
+    limiter._tokens.level = 0
+
+    waited = asyncio.run(limiter.acquire(100))  # 60000 токенов/мин — 1000 в секунду
+
+    assert waited >= 0.08
+    assert limiter.throttled == 1
+
+
+def test_retry_after_rate_limit_settles_one_reservation(strategy, limiter):
+    attempts = []
+
+    async def send():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise rate_limit_error({'retry-after-ms': '50'})
+        return RawResponse()
+
+    asyncio.run(strategy._request(send, RESERVED))
+
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.04
+    limiter._tokens.refill()
+    assert limiter._tokens.capacity - limiter._tokens.level <= RESERVED
+
+
+def test_last_rate_limit_error_is_raised_and_budget_refunded(strategy, limiter):
+    async def send():
+        raise rate_limit_error({'retry-after-ms': '1'})
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(strategy._request(send, RESERVED))
+
+    limiter._tokens.refill()
+    assert limiter._tokens.level == pytest.approx(limiter._tokens.capacity)
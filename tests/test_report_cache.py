@@ -0,0 +1,72 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+import report_cache
+from report_cache import FinalReportCache
+
+ANALYSIS = {'market': 'рынок', 'rivals': 'конкуренты', 'synergy': 'синергия'}
+
+
+class StubRenderer:
+    async def render_final_report(self, company_name, analysis_results, qa_history, path):
+        Path(path).write_text(company_name, encoding='utf-8')
+
+    async def extend_final_report(self, base_path, analysis_results, qa_history, base_count, path):
+        Path(path).write_text(Path(base_path).read_text(encoding='utf-8'), encoding='utf-8')
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(report_cache.config, 'REPORT_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(report_cache, 'ReportRenderer', StubRenderer)
+    monkeypatch.setattr(FinalReportCache, '_instance', None)
+    cache = FinalReportCache()
+    cache.max_entries = 1
+    return cache
+
+
+def get_report(cache, company_name):
+    return asyncio.run(cache.get_report(company_name, ANALYSIS, []))
+
+
+def test_released_cached_report_is_kept_and_reused(cache):
+    path = get_report(cache, 'Альфа')
+    cache.release(path)
+
+    assert Path(path).exists()
+    assert get_report(cache, 'Альфа') == path
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_pinned_report_survives_eviction_until_released(cache):
+    path = get_report(cache, 'Альфа')
+    other = get_report(cache, 'Бета')  # вытесняет отчет по Альфе, пока тот еще отправляется
+
+    assert not cache.is_cached_file(path)
+    assert Path(path).exists()
+
+    cache.release(path)
+    assert not Path(path).exists()
+    cache.release(other)
+    assert Path(other).exists()
+
+
+def test_report_pinned_twice_needs_two_releases(cache):
+    path = get_report(cache, 'Альфа')
+    assert get_report(cache, 'Альфа') == path
+    get_report(cache, 'Бета')
+
+    cache.release(path)
+    assert Path(path).exists()
+    cache.release(path)
+    assert not Path(path).exists()
+
+
+def test_release_removes_report_outside_cache(cache, tmp_path):
+    fallback = tmp_path / 'fallback.docx'
+    fallback.write_bytes(b'')
+
+    cache.release(str(fallback))
+    assert not fallback.exists()
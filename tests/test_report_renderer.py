@@ -0,0 +1,70 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from docx import Document
+
+from report_renderer import ReportRenderer, ReportRenderTimeoutError
+
+
+@pytest.fixture
+def renderer(monkeypatch):
+    monkeypatch.setattr(ReportRenderer, '_instance', None)
+    renderer = ReportRenderer()
+    renderer._executor = ThreadPoolExecutor(max_workers=1)
+    yield renderer
+    renderer._executor.shutdown(wait=True)
+
+
+def test_analysis_report_has_section_per_stage(renderer):
+    path = asyncio.run(renderer.render_analysis_report('Альфа', {'market': 'рынок', 'synergy': 'синергия'}))
+    try:
+        texts = [paragraph.text for paragraph in Document(path).paragraphs]
+    finally:
+        Path(path).unlink()
+
+    assert texts[0] == 'Анализ инвестиционной привлекательности: Альфа'
+    assert 'Рыночный анализ' in texts and 'Анализ синергии' in texts
+    assert 'Анализ конкурентов' not in texts
+    assert renderer.get_stats()['rendered'] == 1
+
+
+def test_report_finished_after_timeout_is_removed(renderer, tmp_path):
+    report = tmp_path / 'late.docx'
+
+    def slow_render():
+        time.sleep(0.2)
+        report.write_bytes(b'docx')
+        return str(report)
+
+    renderer.timeout = 0.05
+    with pytest.raises(ReportRenderTimeoutError):
+        asyncio.run(renderer._render(slow_render))
+
+    renderer._executor.shutdown(wait=True)
+    assert not report.exists()
+    assert renderer.get_stats()['timeouts'] == 1
+
+
+def test_abandoned_render_does_not_touch_rerendered_report(renderer, tmp_path):
+    report = tmp_path / 'cached.docx'
+    renderer._executor.shutdown(wait=True)
+    renderer._executor = ThreadPoolExecutor(max_workers=2)  # брошенный процесс завершается после повторного
+
+    def write_report(content, delay, path):
+        time.sleep(delay)
+        Path(path).write_bytes(content)
+        return path
+
+    renderer.timeout = 0.05
+    with pytest.raises(ReportRenderTimeoutError):
+        asyncio.run(renderer._render(write_report, b'old', 0.2, path=str(report)))
+
+    renderer.timeout = 5
+    assert asyncio.run(renderer._render(write_report, b'new', 0, path=str(report))) == str(report)
+
+    renderer._executor.shutdown(wait=True)
+    assert report.read_bytes() == b'new'
+    assert list(tmp_path.iterdir()) == [report]
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from circuit_breaker import CircuitBreakerRegistry
+from llm_scheduler import LLMScheduler
+from models_api import ModelAPI, ModelStrategy
+from response_cache import ResponseCache
+
+MESSAGES = [{'role': 'user', 'content': 'анализ Ozon'}]
+
+
+class CountingStrategy(ModelStrategy):
+    model = 'stub-coalescing'
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+
+    async def get_response(self, messages):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if self.error is not None:
+            raise self.error
+        return f'ответ {self.calls}'
+
+
+@pytest.fixture(autouse=True)
+def fresh_singletons(monkeypatch):
+    monkeypatch.setattr(ResponseCache, '_instance', None)
+    monkeypatch.setattr(LLMScheduler, '_instance', None)
+    monkeypatch.setattr(CircuitBreakerRegistry, '_instance', None)
+    monkeypatch.setattr(ModelAPI, '_inflight', {})
+    monkeypatch.setattr(ModelAPI, 'coalesced_requests', 0)
+
+
+def get_response(strategy):
+    return ModelAPI(strategy).get_response(MESSAGES, bypass_cache=True)
+
+
+def test_identical_concurrent_requests_share_one_model_call():
+    strategy = CountingStrategy()
+
+    async def scenario():
+        return await asyncio.gather(*(get_response(strategy) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == ['ответ 1'] * 3
+    assert strategy.calls == 1
+    assert ModelAPI.coalesced_requests == 2
+    assert ModelAPI._inflight == {}
+
+
+def test_cancelled_waiter_does_not_cancel_request_for_others():
+    strategy = CountingStrategy()
+
+    async def scenario():
+        first = asyncio.ensure_future(get_response(strategy))
+        second = asyncio.ensure_future(get_response(strategy))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == 'ответ 1'
+    assert strategy.calls == 1
+
+
+def test_error_reaches_every_waiter():
+    strategy = CountingStrategy(error=ValueError('модель недоступна'))
+
+    async def scenario():
+        return await asyncio.gather(*(get_response(strategy) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert strategy.calls == 1
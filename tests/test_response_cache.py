@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+import response_cache
+from response_cache import SQLiteCacheTier
+
+
+@pytest.fixture
+def tier(tmp_path):
+    tier = SQLiteCacheTier(str(tmp_path / 'responses.sqlite3'), max_items=3, ttl=60)
+    yield tier
+    tier._conn.close()
+
+
+def rows(tier):
+    return tier._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+def test_count_tracks_rows_without_querying(tier):
+    tier.set('a', 'ns', 'ответ a')
+    tier.set('a', 'ns', 'ответ a2')
+    tier.set('b', 'ns', 'ответ b')
+
+    assert tier.count() == rows(tier) == 2
+
+
+def test_overflow_evicts_least_recently_read(tier, monkeypatch):
+    now = time.time()
+    for offset, key in enumerate('abc'):
+        monkeypatch.setattr(response_cache.time, 'time', lambda offset=offset: now + offset)
+        tier.set(key, 'ns', f'ответ {key}')
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now + 5)
+    tier.get('a')
+
+    assert tier.set('d', 'ns', 'ответ d') == 1
+    assert tier.count() == rows(tier) == 3
+    assert tier.get('b') is None and tier.get('a') is not None
+
+
+def test_expired_rows_leave_the_count(tier, monkeypatch):
+    tier.set('a', 'ns', 'ответ a')
+    tier.set('b', 'ns', 'ответ b')
+    now = time.time()
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now + tier.ttl + 1)
+
+    assert tier.get('a') is None
+    assert tier.set('c', 'ns', 'ответ c') == 1
+    assert tier.count() == rows(tier) == 1
+
+    tier.clear()
+    assert tier.count() == 0
+
+
+def test_count_restored_after_restart(tier):
+    tier.set('a', 'ns', 'ответ a')
+
+    reopened = SQLiteCacheTier(tier.db_path, max_items=3, ttl=60)
+    try:
+        assert reopened.count() == 1
+    finally:
+        reopened._conn.close()
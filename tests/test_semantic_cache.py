@@ -0,0 +1,63 @@
+import pytest
+
+from semantic_cache import SemanticCache, normalize_query
+
+TOPIC = 'investment'
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(SemanticCache, '_instance', None)
+    cache = SemanticCache()
+    cache.enabled = True
+    cache.threshold = 0.8
+    cache.store(TOPIC, 'анализ Ozon', {'company': 'Ozon'})
+    cache.store(TOPIC, 'покупка Wildberries', {'company': 'Wildberries'})
+    return cache
+
+
+def test_rephrased_query_is_a_hit(cache):
+    hit = cache.lookup(TOPIC, 'Проанализируй покупку Озона')
+
+    assert hit is not None
+    assert hit.entry.payload == {'company': 'Ozon'}
+    assert hit.similarity >= cache.threshold
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_different_company_is_a_miss(cache):
+    assert cache.lookup(TOPIC, 'анализ Яндекс') is None
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_similarity_below_threshold_is_a_miss(cache):
+    query = 'Вайлдберриз'
+    cache.threshold = 0.0
+    hit = cache.lookup(TOPIC, query)
+    assert hit is not None and 0 < hit.similarity < 0.8
+
+    cache.threshold = 0.8
+    assert cache.lookup(TOPIC, query) is None
+
+
+def test_other_topic_is_not_matched(cache):
+    assert cache.lookup('startups', 'анализ Ozon') is None
+
+
+def test_disabled_cache_never_hits(cache):
+    cache.enabled = False
+    assert cache.lookup(TOPIC, 'анализ Ozon') is None
+
+
+def test_brand_name_is_part_of_the_company(cache):
+    cache.store(TOPIC, 'анализ Сбер Маркет', {'company': 'Сбер Маркет'})
+
+    assert cache.lookup(TOPIC, 'анализ Маркет') is None
+    assert cache.lookup(TOPIC, 'анализ Маркета') is None
+    assert normalize_query('анализ Сбер') == 'sber'
+
+
+def test_acquirer_in_purchase_phrase_is_ignored(cache):
+    hit = cache.lookup(TOPIC, 'покупка Сбером Ozon')
+
+    assert hit is not None and hit.entry.payload == {'company': 'Ozon'}
@@ -0,0 +1,57 @@
+import token_budget
+from token_budget import MESSAGE_OVERHEAD_TOKENS, TokenBudget
+
+
+def make_budget() -> TokenBudget:
+    budget = TokenBudget('gpt-4o', reserve_output=0)
+    budget._encoding = None  # приближенный подсчет: тесты не зависят от загрузки BPE-файлов
+    return budget
+
+
+def test_messages_within_budget_are_unchanged():
+    budget = make_budget()
+    messages = [{'role': 'system', 'content': 'системный'}, {'role': 'user', 'content': 'вопрос'}]
+    assert budget.fit_messages(messages, max_tokens=1000) is messages
+
+
+def test_oldest_turns_dropped_first_keeping_system_and_last_message():
+    budget = make_budget()
+    messages = [
+        {'role': 'system', 'content': 'системный промпт'},
+        {'role': 'user', 'content': 'старый вопрос ' * 20},
+        {'role': 'assistant', 'content': 'старый ответ ' * 20},
+        {'role': 'user', 'content': 'новый вопрос'},
+    ]
+    max_tokens = budget.count_messages([messages[0], messages[-1]]) + MESSAGE_OVERHEAD_TOKENS
+    fitted = budget.fit_messages(messages, max_tokens=max_tokens)
+
+    assert fitted == [messages[0], messages[-1]]
+    assert budget.count_messages(fitted) <= max_tokens
+
+
+def test_longest_message_truncated_when_dropping_is_not_enough():
+    budget = make_budget()
+    messages = [
+        {'role': 'system', 'content': 'системный промпт'},
+        {'role': 'user', 'content': 'документ ' * 500},
+    ]
+    fitted = budget.fit_messages(messages, max_tokens=200)
+
+    assert fitted[0] == messages[0]
+    assert token_budget.TRUNCATION_MARKER in fitted[1]['content']
+    assert budget.count_messages(fitted) <= 200
+    assert messages[1]['content'] == 'документ ' * 500  # исходный список не изменяется
+
+
+def test_encoding_load_failure_falls_back_to_approximate_count(monkeypatch):
+    def unavailable(name):
+        raise OSError('нет сети')
+
+    monkeypatch.setattr(token_budget.tiktoken, 'get_encoding', unavailable)
+    token_budget._load_encoding.cache_clear()
+    try:
+        budget = TokenBudget('gpt-4o')
+        assert budget._encoding is None
+        assert budget.count('abcdef') == 3
+    finally:
+        token_budget._load_encoding.cache_clear()